@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# ====================================================
+# Benchmarks of the EN_Mod hot paths
+# - open/close, per-element vs bulk result harvesting, extended period
+#   simulation with result capture, pattern updates and scenario throughput,
+#   on BMV.inp and on generated grid networks
+# ====================================================
+#
+# Usage:
+#     python Benchmark.py [--sizes 1000 10000 100000] [--repeat 5]
+#                         [--output results.json] [--compare baseline.json]
+#
+# The toolkit library is found as by EN_Mod (EPANET_LIBRARY or the usual
+# library names). Results are written as JSON: a "meta" record describing the
+# machine, Python, NumPy and toolkit, and one record per (network, benchmark)
+# with the best and median of the repeated timings in seconds. --compare
+# prints the change of every best time against an earlier results file.
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+import numpy as np
+import EN_Mod
+from EN_Mod import *
+from EN_Inp import ENnetwork, ENtable
+from EN_Scenario import ENscenario, ENsession
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+def gridnetwork(nnodes, seed=0):
+    # Description:
+    #     Builds a square grid network of about nnodes junctions, fed by a
+    #     reservoir at each corner, with one 24 hour demand pattern.
+    # Returns: ENnetwork
+    side = max(int(round(np.sqrt(nnodes))), 2)
+    rng = np.random.RandomState(seed)
+    rows, cols = np.divmod(np.arange(side*side), side)
+    ids = np.array(['J%d' % k for k in range(side*side)])
+    net = ENnetwork()
+    net.title = ['Grid network of %d junctions' % (side*side)]
+    net.junctions = ENtable([('id', ids),
+                             ('elevation', np.round(10 + 10*rng.rand(side*side), 2)),
+                             ('demand', np.full(side*side, 0.05)),
+                             ('pattern', np.full(side*side, 'P1'))])
+    corners = [0, side-1, side*(side-1), side*side-1]
+    net.reservoirs = ENtable([('id', np.array(['R%d' % k for k in range(4)])),
+                              ('head', np.full(4, 120.0)),
+                              ('pattern', np.full(4, ''))])
+    right = np.flatnonzero(cols < side-1)
+    down = np.flatnonzero(rows < side-1)
+    node1 = np.concatenate([ids[right], ids[down], net.reservoirs['id']])
+    node2 = np.concatenate([ids[right+1], ids[down+side], ids[corners]])
+    npipes = len(node1)
+    net.pipes = ENtable([('id', np.array(['L%d' % k for k in range(npipes)])),
+                         ('node1', node1),
+                         ('node2', node2),
+                         ('length', np.full(npipes, 100.0)),
+                         ('diameter', np.where(np.arange(npipes) < npipes-4, 300.0, 1000.0)),
+                         ('roughness', np.full(npipes, 130.0)),
+                         ('minorloss', np.zeros(npipes)),
+                         ('status', np.full(npipes, 'Open'))])
+    net.patterns['P1'] = 1 + 0.5*np.sin(np.arange(24)*np.pi/12)
+    net.times.update([('DURATION', '24:00'), ('HYDRAULIC TIMESTEP', '1:00'),
+                      ('PATTERN TIMESTEP', '1:00'), ('REPORT TIMESTEP', '1:00')])
+    net.options.update([('UNITS', 'LPS'), ('HEADLOSS', 'H-W')])
+    net.coordinates = ENtable([('node', ids), ('x', 100.0*cols), ('y', 100.0*rows)])
+    return net
+
+def timeit(fn, repeat, number=1):
+    # Returns the best and median time of one call of fn over repeat rounds
+    # of number calls.
+    times = []
+    for k in range(repeat):
+        start = _clock()
+        for n in range(number):
+            fn()
+        times.append((_clock() - start)/number)
+    return min(times), float(np.median(times))
+
+def bench_openclose(inpname):
+    ENopen(inpname, os.devnull, '')
+    ENclose()
+
+def bench_harvest(nodes, links, bulk):
+    # One step's pressures and flows, element by element or in bulk
+    if bulk:
+        ENgetnodevalues(EN_PRESSURE, nodes)
+        ENgetlinkvalues(EN_FLOW, links)
+    else:
+        [ENgetnodevalue(k, EN_PRESSURE) for k in range(1, len(nodes)+1)]
+        [ENgetlinkvalue(k, EN_FLOW) for k in range(1, len(links)+1)]
+
+def bench_eps():
+    # Full extended period simulation keeping pressures and flows at every step
+    results = []
+    for t, step in ENiterH((EN_PRESSURE,), (EN_FLOW,), flag=EN_INITFLOW):
+        results.append((step.nodes[EN_PRESSURE].copy(), step.links[EN_FLOW].copy()))
+    return results
+
+def bench_patterns(npatterns, factors, bulk):
+    if bulk:
+        for k in range(1, npatterns+1):
+            ENsetpattern(k, factors)
+    else:
+        for k in range(1, npatterns+1):
+            for p, value in enumerate(factors, 1):
+                ENsetpatternvalue(k, p, value)
+
+def run(name, inpname, repeat, nscenarios):
+    # Runs every benchmark on one network and returns their records.
+    records = []
+    def record(benchmark, timing, **extra):
+        best, median = timing
+        entry = OrderedDict([('network', name), ('nodes', nnodes), ('links', nlinks),
+                             ('benchmark', benchmark), ('repeat', repeat),
+                             ('best', best), ('median', median)])
+        entry.update(extra)
+        records.append(entry)
+        print('%-12s %-22s %12.6f s' % (name, benchmark, best))
+
+    ENopen(inpname, os.devnull, '')
+    nnodes = ENgetcount(EN_NODECOUNT)
+    nlinks = ENgetcount(EN_LINKCOUNT)
+    ENclose()
+    record('open_close', timeit(lambda: bench_openclose(inpname), repeat))
+
+    ENopen(inpname, os.devnull, '')
+    try:
+        nodes = np.arange(1, nnodes+1, dtype=np.intc)
+        links = np.arange(1, nlinks+1, dtype=np.intc)
+        ENopenH()
+        ENinitH(0)
+        ENrunH()
+        record('harvest_loop', timeit(lambda: bench_harvest(nodes, links, False), repeat))
+        record('harvest_bulk', timeit(lambda: bench_harvest(nodes, links, True), repeat))
+        ENcloseH()
+
+        steps = len(bench_eps())
+        record('eps_capture', timeit(bench_eps, repeat), steps=steps)
+
+        npatterns = ENgetcount(EN_PATCOUNT)
+        if npatterns:
+            baseline = [ENgetpattern(k) for k in range(1, npatterns+1)]
+            factors = baseline[0]
+            record('pattern_loop', timeit(lambda: bench_patterns(npatterns, factors, False), repeat),
+                   patterns=npatterns, periods=len(factors))
+            record('pattern_bulk', timeit(lambda: bench_patterns(npatterns, factors, True), repeat),
+                   patterns=npatterns, periods=len(factors))
+            for k, original in enumerate(baseline, 1):
+                ENsetpattern(k, original)
+    finally:
+        ENclose()
+
+    if nscenarios:
+        ENopen(inpname, os.devnull, '', topology=True)
+        junctions = np.array(ENgettopology().junctions, dtype=np.intc)
+        base = ENgetnodevalues(EN_BASEDEMAND, junctions, dtype=np.float64)
+        ENclose()
+        scenarios = [ENscenario('s%d' % k) for k in range(nscenarios)]
+        for k, s in enumerate(scenarios):
+            s.setnodevalues(EN_BASEDEMAND, junctions, base*(0.8 + 0.4*k/max(nscenarios-1, 1)))
+        with ENsession(inpname) as session:
+            timing = timeit(lambda: [session.run(s, (EN_PRESSURE,)) for s in scenarios], repeat)
+        record('scenarios', timing, scenarios=nscenarios, per_second=nscenarios/timing[0])
+    return records
+
+def meta(libpath):
+    return OrderedDict([('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+                        ('machine', platform.machine()), ('platform', platform.platform()),
+                        ('processor', platform.processor()), ('python', platform.python_version()),
+                        ('numpy', np.__version__), ('toolkit', ENgetversion()),
+                        ('library', libpath)])
+
+def compare(records, filename):
+    with open(filename) as f:
+        old = dict(((r['network'], r['benchmark']), r['best']) for r in json.load(f)['results'])
+    print('\n%-12s %-22s %12s %12s %8s' % ('network', 'benchmark', 'before', 'after', 'change'))
+    for r in records:
+        before = old.get((r['network'], r['benchmark']))
+        if before:
+            print('%-12s %-22s %12.6f %12.6f %+7.1f%%' % (r['network'], r['benchmark'], before, r['best'],
+                                                        100.0*(r['best']/before - 1)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the EN_Mod hot paths.')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1000, 10000, 100000],
+                        help='junction counts of the generated grid networks')
+    parser.add_argument('--repeat', type=int, default=5, help='timing rounds per benchmark')
+    parser.add_argument('--scenarios', type=int, default=10,
+                        help='scenarios per throughput round (0 to skip)')
+    parser.add_argument('--inp', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BMV.inp'),
+                        help='Input file benchmarked besides the grids')
+    parser.add_argument('--output', default='benchmark.json', help='JSON results file')
+    parser.add_argument('--compare', help='earlier JSON results file to compare with')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='enbench')
+    try:
+        networks = [(os.path.splitext(os.path.basename(args.inp))[0], args.inp)]
+        for size in args.sizes:
+            inpname = os.path.join(workdir, 'grid%d.inp' % size)
+            gridnetwork(size).write(inpname)
+            networks.append(('grid%d' % size, inpname))
+        records = []
+        for name, inpname in networks:
+            records += run(name, inpname, args.repeat, args.scenarios)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(OrderedDict([('meta', meta(getattr(EN_Mod._lib, '_name', None))),
+                               ('results', records)]), f, indent=1)
+    if args.compare:
+        compare(records, args.compare)
+
+if __name__ == '__main__':
+    main()
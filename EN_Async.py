@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+# asyncio front end for EN_Mod: simulations run on a bounded pool of ENproject
+# workers in executor threads, so that an event loop keeps serving other
+# requests while the toolkit computes. Requires Python 3.6 or later.
+import asyncio
+import concurrent.futures
+import EN_Mod
+from EN_Scenario import ENsession, _newproject, _recorder
+
+class ENasyncpool(object):
+    # Bounded pool of toolkit projects for asyncio code.
+    #
+    # At most size simulations run at once, each on its own ENproject and
+    # executor thread. Further requests wait for a free project without
+    # blocking the event loop, which is the backpressure for bursts of
+    # requests. After a completed simulation a project keeps its network open
+    # (see ENsession) and reuses it for the next request on the same Input
+    # file.
+    #
+    # Example:
+    #     async with ENasyncpool(4) as pool:
+    #         result = await pool.run('net.inp', scenario, (EN_PRESSURE,))
+    #         async with pool.iterH('net.inp', None, (EN_PRESSURE,)) as steps:
+    #             async for t, step in steps:
+    #                 await websocket.send(...)
+    #
+    # Arguments:
+    #     size:    number of simulations run at once (projects and threads)
+    #     libpath: toolkit library loaded by the projects (see ENproject)
+    def __init__(self, size=4, libpath=None):
+        self.size = size
+        self.libpath = libpath
+        self._executor = concurrent.futures.ThreadPoolExecutor(size)
+        self._semaphore = None
+        self._idle = []      # free slots: [project, inpname, session]
+        self._closed = False
+
+    async def _acquire(self, inpname):
+        # Waits for a free slot, preferring one that has inpname open.
+        if self._closed:
+            raise RuntimeError('ENasyncpool is closed')
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.size)
+        await self._semaphore.acquire()
+        for k, slot in enumerate(self._idle):
+            if slot[1] == inpname:
+                return self._idle.pop(k)
+        if self._idle:
+            return self._idle.pop()
+        return [None, None, None]
+
+    def _release(self, slot):
+        self._idle.append(slot)
+        self._semaphore.release()
+
+    def _prepare(self, slot, inpname):
+        # Executor side: gives the slot a project and a session on inpname.
+        project, name, session = slot
+        if session is not None and name != inpname:
+            slot[1] = slot[2] = None
+            session.close()
+        if project is None:
+            slot[0] = _newproject(self.libpath)
+        if slot[2] is None:
+            slot[2] = ENsession(inpname, toolkit=slot[0])
+            slot[1] = inpname
+        return slot[2]
+
+    def iterH(self, inpname, scenario=None, nodevars=(), linkvars=(), nodes=None, links=None,
+              report=True):
+        # Description:
+        #     Async iterator over the hydraulic steps of one simulation.
+        # Arguments:
+        #     inpname:  name of the EPANET Input file
+        #     scenario: ENscenario applied for this simulation, or None
+        #     nodevars, linkvars, nodes, links, report: see ENiterH
+        # Returns:
+        #     ENasyncsteps yielding (t, step) pairs like ENiterH
+        return ENasyncsteps(self, inpname, scenario, (tuple(nodevars), tuple(linkvars), nodes, links, report))
+
+    async def run(self, inpname, scenario=None, nodevars=(), linkvars=(), nodes=None, links=None,
+                  report=True):
+        # Description:
+        #     Runs the extended period hydraulics of one simulation.
+        #     Takes the same arguments as iterH.
+        # Returns:
+        #     ENscenarioresult holding the steps of the simulation
+        recorder = _recorder(getattr(scenario, 'name', None), nodevars, linkvars)
+        async with self.iterH(inpname, scenario, nodevars, linkvars, nodes, links, report) as steps:
+            async for t, step in steps:
+                recorder.add(t, step)
+        return recorder.result()
+
+    async def close(self):
+        # Description: Waits for running simulations, then closes every project.
+        if self._closed:
+            return
+        self._closed = True
+        if self._semaphore is not None:
+            for k in range(self.size):
+                await self._semaphore.acquire()
+        slots, self._idle = self._idle, []
+        await asyncio.wrap_future(self._executor.submit(_closeslots, slots))
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+def _closeslots(slots):
+    for project, name, session in slots:
+        try:
+            if session is not None:
+                session.close()
+        finally:
+            project.ENdeleteproject()
+
+class ENasyncsteps(object):
+    # Async iterator over the hydraulic steps of one simulation, made by
+    # ENasyncpool.iterH. Every ENrunH/ENnextH pair runs in the executor, so
+    # the simulation can be cancelled between two time steps.
+    #
+    # As with ENiterH, the same ENstep is refilled at each step; it is not
+    # touched while the consumer holds it since the next step is only
+    # computed when asked for.
+    #
+    # A pool project is taken with the first step and given back when the
+    # iteration ends, when aclose is called or when the awaiting task is
+    # cancelled. The scenario's overrides are then restored. If the
+    # simulation did not run to its end, the network is closed (ENcloseH,
+    # ENclose) so that the next request starts from a fresh one.
+    #
+    # Leaving an async for early (break, return, an exception in its body)
+    # does not end the iteration: iterate under async with, or call aclose.
+    # Otherwise the project is only given back when the step generator is
+    # finalized, which CPython does when it is garbage collected (through the
+    # event loop's async generator hooks): until then the pool has one
+    # project less, and a pool whose projects are all held this way blocks.
+    def __init__(self, pool, inpname, scenario, options):
+        self._pool = pool
+        self._inpname = inpname
+        self._scenario = scenario
+        self._options = options
+        self._slot = None
+        self._steps = None
+        self._pending = None
+        self._generator = self._generate()
+
+    def _start(self, session):
+        # Executor side: applies the scenario and creates the step generator.
+        if self._scenario is not None:
+            session.apply(self._scenario)
+        nodevars, linkvars, nodes, links, report = self._options
+        self._steps = session.toolkit.ENiterH(nodevars, linkvars, nodes, links, report=report,
+                                              flag=EN_Mod.EN_INITFLOW, openclose=False)
+
+    def _finish(self, completed):
+        # Executor side: stops the simulation and hands the slot back.
+        slot = self._slot
+        try:
+            session = slot[2]
+            if session is not None:
+                try:
+                    if self._steps is not None:
+                        self._steps.close()
+                    session.restore()
+                finally:
+                    if not completed:
+                        slot[1] = slot[2] = None
+                        session.close()
+        finally:
+            self._loop.call_soon_threadsafe(self._pool._release, slot)
+
+    async def _call(self, fn, *args):
+        # Runs fn in the executor.
+        future = self._pending = self._pool._executor.submit(fn, *args)
+        return await asyncio.wrap_future(future)
+
+    def _abandon(self):
+        # Hands the slot back once the running executor call has returned,
+        # without waiting for it (the awaiting task may be cancelled).
+        executor = self._pool._executor
+        self._pending.add_done_callback(lambda future: executor.submit(self._finish, False))
+
+    async def _generate(self):
+        # The simulation; the finally block gives the slot back however the
+        # iteration ends, including when the generator is garbage collected.
+        completed = False
+        try:
+            self._loop = asyncio.get_event_loop()
+            self._slot = await self._pool._acquire(self._inpname)
+            self._pending = concurrent.futures.Future()
+            self._pending.set_result(None)
+            session = await self._call(self._pool._prepare, self._slot, self._inpname)
+            await self._call(self._start, session)
+            while True:
+                item = await self._call(next, self._steps, None)
+                if item is None:
+                    completed = True
+                    break
+                yield item
+        finally:
+            if self._slot is not None:
+                if completed or self._pending.done():
+                    await asyncio.wrap_future(self._pool._executor.submit(self._finish, completed))
+                else:
+                    self._abandon()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._generator.__anext__()
+
+    async def aclose(self):
+        # Description: Ends the simulation and gives the project back to the pool.
+        await self._generator.aclose()
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+# Caches for EN_Mod: a directory of files kept within a size budget with
+# least-recently-used eviction, a cache of solved hydraulics built on it so
+# that water quality runs on unchanged hydraulics skip ENsolveH, and a
+# memoization cache of scenario results keyed by scenario fingerprints.
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from collections import OrderedDict
+import numpy as np
+import EN_Mod
+
+class ENdiskcache(object):
+    # Directory of cached files, one per key, kept under a byte budget.
+    #
+    # A file's modification time records its last use: get() touches the file
+    # it returns and put() evicts the least recently used files until the
+    # directory fits in the budget again. Files are written under a temporary
+    # name and renamed into place, so several processes can share a directory.
+    #
+    # Arguments:
+    #     directory: cache directory (created if missing)
+    #     budget:    maximum total size of the cached files, in bytes
+    #     suffix:    file name extension of the cached files
+    def __init__(self, directory, budget=1 << 30, suffix='.bin'):
+        self.directory = directory
+        self.budget = budget
+        self.suffix = suffix
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key):
+        # Description: Name of the file holding key, whether it exists or not.
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        # Description: Looks up a key.
+        # Returns: name of the cached file (marked as just used), or None
+        path = self.path(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, write):
+        # Description: Adds a file to the cache.
+        # Arguments:
+        #     key:   cache key (used in the file name)
+        #     write: function write(filename) creating the file to cache
+        # Returns: name of the cached file
+        fd, temp = tempfile.mkstemp(suffix=self.suffix, prefix='.tmp', dir=self.directory)
+        os.close(fd)
+        try:
+            write(temp)
+            _replace(temp, self.path(key))
+        except Exception:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        self.evict(keep=key)
+        return self.path(key)
+
+    def evict(self, keep=None):
+        # Description: Removes least recently used files until the cache fits in its budget.
+        # Arguments: keep: key never evicted (the one just added)
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix) or name.startswith('.tmp'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        kept = None if keep is None else keep + self.suffix
+        for mtime, size, name in sorted(entries):
+            if total <= self.budget:
+                break
+            if name == kept:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        # Description: Removes every cached file.
+        for name in os.listdir(self.directory):
+            if name.endswith(self.suffix):
+                os.remove(os.path.join(self.directory, name))
+
+# Input file name -> ((mtime, size), sha1 digest)
+_filedigests= {}
+
+def _filedigest(filename):
+    # Hash of a file's contents, recomputed only when the file changes
+    st = os.stat(filename)
+    stamp = (st.st_mtime, st.st_size)
+    cached = _filedigests.get(filename)
+    if cached is None or cached[0] != stamp:
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        cached = _filedigests[filename] = (stamp, h.digest())
+    return cached[1]
+
+def _replace(source, target):
+    # Renames source over an existing target (os.replace on Python 3)
+    if hasattr(os, 'replace'):
+        os.replace(source, target)
+    else:
+        if os.path.exists(target):
+            os.remove(target)
+        os.rename(source, target)
+
+# Parameters that determine the hydraulic solution (water quality ones such as
+# EN_SOURCEQUAL, EN_KBULK or EN_KWALL are deliberately left out)
+_hyd_node_params= (EN_Mod.EN_ELEVATION, EN_Mod.EN_BASEDEMAND, EN_Mod.EN_PATTERN, EN_Mod.EN_EMITTER)
+_hyd_tank_params= (EN_Mod.EN_TANKLEVEL, EN_Mod.EN_TANKDIAM, EN_Mod.EN_MINVOLUME, EN_Mod.EN_VOLCURVE,
+                   EN_Mod.EN_MINLEVEL, EN_Mod.EN_MAXLEVEL)
+_hyd_link_params= (EN_Mod.EN_DIAMETER, EN_Mod.EN_LENGTH, EN_Mod.EN_ROUGHNESS, EN_Mod.EN_MINORLOSS,
+                   EN_Mod.EN_INITSTATUS, EN_Mod.EN_INITSETTING)
+_hyd_time_params= (EN_Mod.EN_DURATION, EN_Mod.EN_HYDSTEP, EN_Mod.EN_PATTERNSTEP, EN_Mod.EN_PATTERNSTART,
+                   EN_Mod.EN_REPORTSTEP, EN_Mod.EN_REPORTSTART, EN_Mod.EN_RULESTEP)
+_hyd_options= (EN_Mod.EN_TRIALS, EN_Mod.EN_ACCURACY, EN_Mod.EN_EMITEXPON, EN_Mod.EN_DEMANDMULT)
+
+class ENhydcache(object):
+    # Solved hydraulics of networks, kept as toolkit Hydraulics files.
+    #
+    # The key of a network is a hash of its Input file and of every hydraulic
+    # input currently set in the toolkit (node and tank data, link data,
+    # patterns, simple controls, time steps, analysis options, toolkit
+    # version). Water quality inputs are not part of it, so a sweep over
+    # source qualities or reaction coefficients solves the hydraulics once.
+    #
+    # Example:
+    #     cache = ENhydcache('hydcache', budget=2 << 30)
+    #     ENopen('net.inp', 'net.rpt', '', topology=True)
+    #     for kb in bulk_rates:
+    #         ENsetlinkvalues(EN_KBULK, pipes, kb)
+    #         cache.solveH('net.inp')
+    #         for t, step in ENiterQ((EN_QUALITY,), solveH=False, report=True):
+    #             ...
+    #
+    # Arguments:
+    #     directory: cache directory
+    #     budget:    maximum total size of the cached Hydraulics files, in bytes
+    #     toolkit:   ENproject holding the network (default: the module-level toolkit)
+    def __init__(self, directory, budget=1 << 30, toolkit=None):
+        self.files = ENdiskcache(directory, budget, '.hyd')
+        self.toolkit = toolkit or EN_Mod
+    def key(self, inpname):
+        # Description: Cache key of the hydraulics of the network open in the toolkit.
+        # Arguments: inpname: Input file the network was opened from
+        # Notes: Open the network with topology=True: otherwise its structure
+        # is read again through the toolkit at every call.
+        tk = self.toolkit
+        h = hashlib.sha1(_filedigest(inpname))
+        h.update(np.array([tk.ENgetversion(), tk.ENgetflowunits()], dtype=np.int64).tobytes())
+        for code in _hyd_node_params:
+            h.update(tk.ENgetnodevalues(code, dtype=np.float64).tobytes())
+        tanks = (tk.ENgettopology() or EN_Mod.ENtopology(tk)).tanks
+        if len(tanks):
+            for code in _hyd_tank_params:
+                h.update(tk.ENgetnodevalues(code, tanks, dtype=np.float64).tobytes())
+        for code in _hyd_link_params:
+            h.update(tk.ENgetlinkvalues(code, dtype=np.float64).tobytes())
+        for k in range(1, tk.ENgetcount(EN_Mod.EN_PATCOUNT)+1):
+            h.update(tk.ENgetpattern(k, dtype=np.float64).tobytes())
+        for k in range(1, tk.ENgetcount(EN_Mod.EN_CONTROLCOUNT)+1):
+            h.update(np.array(tk.ENgetcontrol(k), dtype=np.float64).tobytes())
+        h.update(np.array([tk.ENgettimeparam(code) for code in _hyd_time_params], dtype=np.int64).tobytes())
+        h.update(np.array([tk.ENgetoption(code) for code in _hyd_options], dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def solveH(self, inpname):
+        # Description:
+        #     Makes the hydraulics of the open network available for a water
+        #     quality analysis: ENusehydfile on a cached Hydraulics file, or
+        #     ENsolveH then caching its Hydraulics file.
+        # Arguments: inpname: Input file the network was opened from
+        # Returns: True if the hydraulics came from the cache
+        # Notes:
+        #     Follow with ENsolveQ, or ENiterQ(..., solveH=False). Once the
+        #     toolkit uses a Hydraulics file it cannot compute hydraulics until
+        #     the network is reopened, so sweeps over hydraulic inputs reopen
+        #     the network for every configuration.
+        tk = self.toolkit
+        key = self.key(inpname)
+        path = self.files.get(key)
+        if path is not None:
+            try:
+                tk.ENusehydfile(path)
+                return True
+            except EN_Mod.ENtoolkitError:
+                pass    # evicted meanwhile or unreadable: solve again
+        try:
+            tk.ENsolveH()
+        except EN_Mod.ENtoolkitError as e:
+            if e.args[0] != 107:
+                raise
+            raise EN_Mod.ENtoolkitError(107, '%s (reopen the network before solving other hydraulic '
+                                             'inputs)' % e.message)
+        self.files.put(key, tk.ENsavehydfile)
+        return False
+
+def ENfingerprint(inpname, scenario, options=()):
+    # Description:
+    #     Fingerprint of a scenario run: a hash of the Input file contents, of
+    #     every override of the scenario (node and link values, patterns,
+    #     controls, time parameters) and of options.
+    # Arguments:
+    #     inpname:  Input file of the base network
+    #     scenario: ENscenario, or None for the base network
+    #     options:  anything else the cached value depends on (captured
+    #               variables, objective name, ...), hashed through its repr,
+    #               arrays through their contents
+    # Returns: hexadecimal digest
+    # Notes: The scenario's name is not part of the fingerprint.
+    h = hashlib.sha1(_filedigest(inpname))
+    _hashoption(h, options)
+    if scenario is not None:
+        for tag, overrides in (('node', scenario.nodevalues), ('link', scenario.linkvalues)):
+            for code in sorted(overrides):
+                indices, values = overrides[code]
+                h.update(('%s %d' % (tag, code)).encode('utf-8'))
+                h.update(np.asarray(indices, dtype=np.int32).tobytes())
+                h.update(np.asarray(values, dtype=np.float64).tobytes())
+        for pattern in sorted(scenario.patterns, key=repr):
+            h.update(('pattern %r' % pattern).encode('utf-8'))
+            h.update(np.asarray(scenario.patterns[pattern], dtype=np.float64).tobytes())
+        for cindex in sorted(scenario.controls):
+            h.update(('control %d' % cindex).encode('utf-8'))
+            h.update(np.asarray(scenario.controls[cindex], dtype=np.float64).tobytes())
+        for code in sorted(scenario.timeparams):
+            h.update(('time %d %d' % (code, scenario.timeparams[code])).encode('utf-8'))
+    return h.hexdigest()
+
+def _hashoption(h, value):
+    # repr abbreviates long arrays, so they are hashed by contents
+    if isinstance(value, np.ndarray):
+        h.update(('array %s %s' % (value.dtype.str, value.shape)).encode('utf-8'))
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (tuple, list)):
+        h.update(('%s %d' % (type(value).__name__, len(value))).encode('utf-8'))
+        for item in value:
+            _hashoption(h, item)
+    else:
+        h.update(repr(value).encode('utf-8'))
+
+def _sizeof(value):
+    # Approximate memory held by a cached value
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if hasattr(value, 'times') and hasattr(value, 'nodes') and hasattr(value, 'links'):
+        return (value.times.nbytes + sum(a.nbytes for a in value.nodes.values()) +
+                sum(a.nbytes for a in value.links.values()))
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(_sizeof(v) for v in value)
+    return sys.getsizeof(value)
+
+class ENresultcache(object):
+    # Memoization of scenario results (ENscenarioresult or objective values).
+    #
+    # Values are kept in an in-memory least-recently-used tier bounded in
+    # bytes and, when a directory is given, in an on-disk tier (an
+    # ENdiskcache of pickled values) that worker processes and later runs
+    # share. A value found on disk is brought back into memory.
+    #
+    # Example:
+    #     cache = ENresultcache(maxbytes=256 << 20, directory='memo')
+    #     with ENsession('net.inp', cache=cache) as session:
+    #         result = session.run(scenario, (EN_PRESSURE,))   # repeats are cache hits
+    #     fitness = cache.memoize(evaluate, 'net.inp', 'cost-v1')
+    #
+    # Arguments:
+    #     maxbytes:  memory budget of the in-memory tier (0 disables it)
+    #     directory: directory of the on-disk tier, or None for memory only
+    #     budget:    maximum total size of the on-disk tier, in bytes
+    # Notes:
+    #     Cached arrays are shared by every hit; treat them as read-only.
+    def __init__(self, maxbytes=256 << 20, directory=None, budget=1 << 30):
+        self.maxbytes = maxbytes
+        self.files = None if directory is None else ENdiskcache(directory, budget, '.pkl')
+        self.memory = OrderedDict()     # key -> (value, size), least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, inpname, scenario, options=()):
+        # Description: Cache key of a scenario run (see ENfingerprint).
+        return ENfingerprint(inpname, scenario, options)
+
+    def get(self, key, default=None):
+        # Description: Looks up a key in memory, then on disk.
+        # Returns: the cached value, or default
+        entry = self.memory.pop(key, None)
+        if entry is not None:
+            self.memory[key] = entry
+            self.hits += 1
+            return entry[0]
+        path = None if self.files is None else self.files.get(key)
+        if path is not None:
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+            except (IOError, OSError, EOFError, pickle.UnpicklingError):
+                value = None    # evicted meanwhile or being replaced
+            else:
+                self._remember(key, value)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        # Description: Caches a value in memory and, if enabled, on disk.
+        self._remember(key, value)
+        if self.files is not None:
+            def write(filename):
+                with open(filename, 'wb') as f:
+                    pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            self.files.put(key, write)
+
+    def _remember(self, key, value):
+        size = _sizeof(value)
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        if size > self.maxbytes:
+            return
+        self.memory[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.maxbytes:
+            evicted, (value, size) = self.memory.popitem(last=False)
+            self.nbytes -= size
+
+    def memoize(self, function, inpname, tag=''):
+        # Description:
+        #     Wraps an evaluation function f(scenario) so that repeated
+        #     scenarios return the cached value.
+        # Arguments:
+        #     function: f(scenario) -> value (picklable if a directory is used)
+        #     inpname:  Input file of the base network the scenarios apply to
+        #     tag:      name of the evaluation, to be changed whenever function changes
+        missing = object()
+        def memoized(scenario):
+            key = self.key(inpname, scenario, ('memoize', tag))
+            value = self.get(key, missing)
+            if value is missing:
+                value = function(scenario)
+                self.put(key, value)
+            return value
+        memoized.__name__ = getattr(function, '__name__', 'memoized')
+        return memoized
+
+    def clear(self):
+        # Description: Empties both tiers.
+        self.memory.clear()
+        self.nbytes = 0
+        if self.files is not None:
+            self.files.clear()
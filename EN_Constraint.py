@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+# Constraint monitoring for EN_Mod: bounds on node and link results (pressure,
+# tank level, velocity, ...) checked at every hydraulic time step, with the
+# option of stopping a simulation as soon as a candidate is infeasible.
+import numpy as np
+import EN_Mod
+
+class _bound(object):
+    # One constraint: lower <= value <= upper for every element, value
+    # being the parameter minus an optional per-element offset, or its
+    # magnitude when absolute is set.
+    def __init__(self, name, node, paramcode, indices, lower, upper, absolute, datum):
+        self.name = name
+        self.node = node
+        self.paramcode = paramcode
+        self.indices = np.asarray(indices, dtype=np.intc).reshape(-1)
+        self.lower = None if lower is None else np.broadcast_to(np.asarray(lower, dtype=np.float64), self.indices.shape)
+        self.upper = None if upper is None else np.broadcast_to(np.asarray(upper, dtype=np.float64), self.indices.shape)
+        self.absolute = absolute
+        self.datum = datum
+        self.offset = None      # datum values, read from the toolkit when first needed
+        self.values = np.empty(len(self.indices), dtype=np.float64)
+        self.excess = np.empty(len(self.indices), dtype=np.float64)
+
+class ENconstraints(object):
+    # Set of bound constraints on simulation results.
+    #
+    # Every constraint applies to a group of nodes or links and gives a lower
+    # and/or upper bound, a single value or one per element. The violation of
+    # an element is its distance outside the bounds.
+    #
+    # Example:
+    #     c = ENconstraints()
+    #     c.addpressure(junctions, lower=20.0)
+    #     c.addtanklevel(tanks, lower=1.0, upper=6.5)
+    #     c.addvelocity(pipes, upper=2.0)
+    #     result = c.evaluate(abort=True)
+    #     fitness = cost + 1e3*result.total
+    def __init__(self):
+        self.bounds = []
+
+    def _add(self, name, node, paramcode, indices, lower, upper, absolute=False, datum=None):
+        if lower is None and upper is None:
+            raise ValueError('a constraint needs a lower or an upper bound')
+        name = name or 'c%d' % (len(self.bounds) + 1)
+        if name in [b.name for b in self.bounds]:
+            raise ValueError('duplicate constraint name %r' % name)
+        self.bounds.append(_bound(name, node, paramcode, indices, lower, upper, absolute, datum))
+        return name
+
+    def addnode(self, paramcode, nodes, lower=None, upper=None, name=None):
+        # Description: Bounds a node parameter (e.g. EN_PRESSURE, EN_QUALITY) on a group of nodes.
+        # Returns: name of the constraint
+        return self._add(name, True, paramcode, nodes, lower, upper)
+
+    def addlink(self, paramcode, links, lower=None, upper=None, name=None, absolute=False):
+        # Description: Bounds a link parameter (e.g. EN_FLOW) on a group of links.
+        # Arguments: absolute: bound the magnitude of the value (flow in either direction)
+        # Returns: name of the constraint
+        return self._add(name, False, paramcode, links, lower, upper, absolute)
+
+    def addpressure(self, nodes, lower=None, upper=None, name=None):
+        # Description: Bounds the pressure of a group of nodes.
+        return self._add(name or 'pressure%d' % (len(self.bounds) + 1), True, EN_Mod.EN_PRESSURE,
+                         nodes, lower, upper)
+
+    def addtanklevel(self, tanks, lower=None, upper=None, name=None):
+        # Description: Bounds the water level (head minus elevation) of a group of tanks.
+        return self._add(name or 'tanklevel%d' % (len(self.bounds) + 1), True, EN_Mod.EN_HEAD,
+                         tanks, lower, upper, datum=EN_Mod.EN_ELEVATION)
+
+    def addvelocity(self, links, upper, name=None):
+        # Description: Bounds the flow velocity (in either direction) of a group of links.
+        return self._add(name or 'velocity%d' % (len(self.bounds) + 1), False, EN_Mod.EN_VELOCITY,
+                         links, None, upper, absolute=True)
+
+    def check(self, time, result, toolkit=None):
+        # Description:
+        #     Checks every constraint against the toolkit's current results and
+        #     adds the violations to result.
+        # Arguments:
+        #     time:   simulation time of the results (seconds)
+        #     result: ENconstraintresult accumulating the violations
+        # Returns: True if no element is outside its bounds by more than result.tolerance
+        tk = toolkit or EN_Mod
+        feasible = True
+        for b in self.bounds:
+            values = b.values
+            if b.node:
+                tk.ENgetnodevalues(b.paramcode, b.indices, out=values)
+            else:
+                tk.ENgetlinkvalues(b.paramcode, b.indices, out=values)
+            if b.datum is not None:
+                if b.offset is None:
+                    b.offset = tk.ENgetnodevalues(b.datum, b.indices, dtype=np.float64)
+                values -= b.offset
+            if b.absolute:
+                np.abs(values, out=values)
+            excess = b.excess
+            excess.fill(0.0)
+            if b.lower is not None:
+                np.maximum(excess, b.lower - values, out=excess)
+            if b.upper is not None:
+                np.maximum(excess, values - b.upper, out=excess)
+            worst = float(excess.max()) if len(excess) else 0.0
+            if worst > result.tolerance:
+                feasible = False
+                result.violation[b.name] += float(excess.sum())
+                result.steps[b.name] += 1
+                if worst > result.worst[b.name]:
+                    result.worst[b.name] = worst
+                    result.where[b.name] = int(b.indices[excess.argmax()])
+                if result.first[b.name] is None:
+                    result.first[b.name] = time
+        return feasible
+
+    def evaluate(self, abort=False, tolerance=0.0, report=False, flag=0, openclose=True, toolkit=None):
+        # Description:
+        #     Runs the extended period hydraulics, checking every constraint at
+        #     each hydraulic time step (each ENrunH).
+        # Arguments:
+        #     abort:     stop the simulation at the first step with a violation
+        #     tolerance: violations up to this magnitude are ignored
+        #     report:    only check at reporting times (see ENiterH)
+        #     flag:      flag passed to ENinitH (EN_INITFLOW to rerun from a clean state)
+        #     openclose: if False, the hydraulics system must already be open and is left open
+        #     toolkit:   ENproject holding the network (default: the module-level toolkit)
+        # Returns: ENconstraintresult
+        # Notes: ENcloseH is called (when openclose is True) even if the run is aborted.
+        tk = toolkit or EN_Mod
+        result = ENconstraintresult([b.name for b in self.bounds], tolerance)
+        for b in self.bounds:
+            if b.datum is not None:
+                # re-read, in case elevations changed since the last run
+                b.offset = tk.ENgetnodevalues(b.datum, b.indices, dtype=np.float64)
+        steps = tk.ENiterH(report=report, flag=flag, openclose=openclose)
+        try:
+            for t, step in steps:
+                result.time = t
+                if not self.check(t, result, tk) and abort:
+                    result.aborted = True
+                    break
+        finally:
+            steps.close()
+        return result
+
+class ENconstraintresult(object):
+    # Violations accumulated over a simulation.
+    #
+    # Attributes (dicts by constraint name):
+    #     violation: sum over checked steps of the violations of all elements
+    #     worst:     largest violation of one element at one step
+    #     where:     node/link index of the worst violation
+    #     first:     time (seconds) of the first violating step, or None
+    #     steps:     number of violating steps
+    # and:
+    #     feasible:  True if no constraint was violated
+    #     aborted:   True if the simulation was stopped early
+    #     time:      simulation time of the last step checked
+    #     total:     sum of all violations, usable as a penalty
+    def __init__(self, names, tolerance=0.0):
+        self.tolerance = tolerance
+        self.violation = dict((name, 0.0) for name in names)
+        self.worst = dict((name, 0.0) for name in names)
+        self.where = dict((name, None) for name in names)
+        self.first = dict((name, None) for name in names)
+        self.steps = dict((name, 0) for name in names)
+        self.aborted = False
+        self.time = 0
+
+    @property
+    def feasible(self):
+        return not any(self.steps.values())
+
+    @property
+    def total(self):
+        return float(sum(self.violation.values()))
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# Streaming export of EN_Mod simulation results to columnar files: the steps
+# of ENiterH or ENiterQ are buffered a chunk of time steps at a time and
+# appended to compressed HDF5 datasets (h5py) or Parquet row groups (pyarrow),
+# with node/link IDs as column labels and the simulation time as the index.
+# Only the buffers of one chunk are held in memory, whatever the run length.
+import os
+import numpy as np
+import EN_Mod
+
+# Names of the node and link parameters, by parameter code
+_node_var_names= ('elevation', 'basedemand', 'pattern', 'emitter', 'initqual', 'sourcequal',
+                  'sourcepat', 'sourcetype', 'tanklevel', 'demand', 'head', 'pressure', 'quality',
+                  'sourcemass', 'initvolume', 'mixmodel', 'mixzonevol', 'tankdiam', 'minvolume',
+                  'volcurve', 'minlevel', 'maxlevel', 'mixfraction', 'tank_kbulk')
+_link_var_names= ('diameter', 'length', 'roughness', 'minorloss', 'initstatus', 'initsetting',
+                  'kbulk', 'kwall', 'flow', 'velocity', 'headloss', 'status', 'setting', 'energy',
+                  'linkqual')
+
+def _var_name(names, prefix, code):
+    # Name of a parameter code, or prefix + code for codes of newer toolkits
+    return names[code] if 0 <= code < len(names) else '%s%d' % (prefix, code)
+
+class _column(object):
+    # One exported variable: its buffer of chunk rows by elements.
+    def __init__(self, group, name, code, ids, chunk):
+        self.group = group
+        self.name = name
+        self.code = code
+        self.ids = ids
+        self.buffer = np.empty((chunk, len(ids)), dtype=np.float32)
+
+class _resultwriter(object):
+    # Buffering shared by the writers; subclasses implement _write(rows) and _close().
+    def __init__(self, nodevars, linkvars, nodes, links, chunk, toolkit):
+        tk = toolkit or EN_Mod
+        topology = tk.ENgettopology()
+        if topology is not None:
+            node_ids, link_ids = topology.node_ids, topology.link_ids
+        else:
+            node_ids = [tk.ENgetnodeid(k) for k in range(1, tk.ENgetcount(EN_Mod.EN_NODECOUNT)+1)]
+            link_ids = [tk.ENgetlinkid(k) for k in range(1, tk.ENgetcount(EN_Mod.EN_LINKCOUNT)+1)]
+        node_ids = _select(node_ids, nodes)
+        link_ids = _select(link_ids, links)
+        self.chunk = int(chunk)
+        self.columns = ([_column('nodes', _var_name(_node_var_names, 'node', code), code, node_ids, self.chunk)
+                         for code in nodevars] +
+                        [_column('links', _var_name(_link_var_names, 'link', code), code, link_ids, self.chunk)
+                         for code in linkvars])
+        self.times = np.empty(self.chunk, dtype=np.int64)
+        self.rows = 0
+        self.count = 0
+        self.closed = False
+
+    def write(self, t, step):
+        # Description: Appends the values of one time step.
+        # Arguments:
+        #     t:    simulation time (seconds)
+        #     step: ENstep holding the exported variables, over the writer's nodes and links
+        k = self.rows
+        self.times[k] = t
+        for column in self.columns:
+            column.buffer[k] = getattr(step, column.group)[column.code]
+        self.rows += 1
+        if self.rows == self.chunk:
+            self.flush()
+
+    def writeall(self, steps):
+        # Description: Appends every (t, step) pair of an iterator such as ENiterH.
+        for t, step in steps:
+            self.write(t, step)
+
+    def flush(self):
+        # Description: Writes the buffered time steps to the file.
+        if self.rows:
+            self._write(self.rows)
+            self.count += self.rows
+            self.rows = 0
+
+    def close(self):
+        # Description: Writes the buffered time steps and closes the file.
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.flush()
+        finally:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _select(ids, indices):
+    if indices is None:
+        return [str(i) for i in ids]
+    return [str(ids[k-1]) for k in np.asarray(indices, dtype=np.intc).reshape(-1)]
+
+class ENhdf5writer(_resultwriter):
+    # Streams results to an HDF5 file (requires h5py).
+    #
+    # Layout:
+    #     /time                   int64 simulation times (seconds), one per row
+    #     /nodes/ids, /links/ids  ID labels of the exported columns
+    #     /nodes/<name>           (ntimes, nnodes) float32, e.g. /nodes/pressure
+    #     /links/<name>           (ntimes, nlinks) float32, e.g. /links/flow
+    # Every dataset grows by chunk rows at a time and is stored in
+    # compressed (chunk, up to 4096 columns) tiles, so the time series of a
+    # few elements reads back without decompressing the whole table.
+    #
+    # Example:
+    #     with ENhdf5writer('run.h5', (EN_PRESSURE,), (EN_FLOW,)) as out:
+    #         out.writeall(ENiterH((EN_PRESSURE,), (EN_FLOW,), report=True))
+    #
+    # Arguments:
+    #     filename:    HDF5 file to create (overwritten)
+    #     nodevars:    node parameter codes to export, as captured in the steps
+    #     linkvars:    link parameter codes to export
+    #     nodes:       node indices the steps hold (default: all nodes)
+    #     links:       link indices the steps hold (default: all links)
+    #     chunk:       time steps buffered between two writes
+    #     compression: h5py compression filter ('gzip', 'lzf' or None)
+    #     toolkit:     ENproject holding the network (default: the module-level toolkit)
+    def __init__(self, filename, nodevars=(), linkvars=(), nodes=None, links=None, chunk=64,
+                 compression='gzip', toolkit=None):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError('ENhdf5writer requires h5py')
+        _resultwriter.__init__(self, nodevars, linkvars, nodes, links, chunk, toolkit)
+        options = dict(compression=compression, shuffle=compression is not None)
+        self.filename = filename
+        self.file = h5py.File(filename, 'w')
+        try:
+            self._time = self.file.create_dataset('time', (0,), maxshape=(None,), dtype=np.int64,
+                                                  chunks=(max(self.chunk, 1024),), **options)
+            self._time.attrs['units'] = 'seconds'
+            self._datasets = []
+            for column in self.columns:
+                if column.group + '/ids' not in self.file:
+                    self.file.create_dataset(column.group + '/ids', data=np.array(column.ids, dtype=object),
+                                             dtype=h5py.string_dtype())
+                width = len(column.ids)
+                dataset = self.file.create_dataset('%s/%s' % (column.group, column.name), (0, width),
+                                                   maxshape=(None, width), dtype=np.float32,
+                                                   chunks=(self.chunk, max(min(width, 4096), 1)), **options)
+                dataset.attrs['paramcode'] = column.code
+                self._datasets.append(dataset)
+        except Exception:
+            self.file.close()
+            raise
+
+    def _write(self, rows):
+        start = self.count
+        self._time.resize((start + rows,))
+        self._time[start:] = self.times[:rows]
+        for column, dataset in zip(self.columns, self._datasets):
+            dataset.resize((start + rows, dataset.shape[1]))
+            dataset[start:] = column.buffer[:rows]
+
+    def _close(self):
+        self.file.close()
+
+class ENparquetwriter(_resultwriter):
+    # Streams results to Parquet files (requires pyarrow).
+    #
+    # Each variable goes to its own file, <directory>/nodes/<name>.parquet or
+    # <directory>/links/<name>.parquet, with an int64 "time" column (seconds)
+    # followed by one float32 column per node or link, labelled with its ID.
+    # Every chunk of time steps is appended as a row group. Read back with
+    # pandas.read_parquet(path).set_index('time'), or pass columns= to read
+    # only some elements.
+    #
+    # Arguments:
+    #     directory:   directory receiving the files (created if missing)
+    #     compression: Parquet codec ('snappy', 'zstd', 'gzip' or None)
+    #     nodevars, linkvars, nodes, links, chunk, toolkit: see ENhdf5writer
+    # Notes:
+    #     Parquet keeps a schema entry per column; for networks of many
+    #     thousand elements, ENhdf5writer writes and opens much faster.
+    def __init__(self, directory, nodevars=(), linkvars=(), nodes=None, links=None, chunk=64,
+                 compression='snappy', toolkit=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError('ENparquetwriter requires pyarrow')
+        _resultwriter.__init__(self, nodevars, linkvars, nodes, links, chunk, toolkit)
+        self._pa = pyarrow
+        self.directory = directory
+        self._writers = []
+        try:
+            for column in self.columns:
+                folder = os.path.join(directory, column.group)
+                if not os.path.isdir(folder):
+                    os.makedirs(folder)
+                schema = pyarrow.schema([pyarrow.field('time', pyarrow.int64())] +
+                                        [pyarrow.field(i, pyarrow.float32()) for i in column.ids])
+                self._writers.append(pyarrow.parquet.ParquetWriter(
+                    os.path.join(folder, column.name + '.parquet'), schema, compression=compression))
+        except Exception:
+            self._close()
+            raise
+
+    def _write(self, rows):
+        pa = self._pa
+        times = pa.array(self.times[:rows])
+        for column, writer in zip(self.columns, self._writers):
+            # Column-major copy so that each element's values are contiguous
+            values = np.asfortranarray(column.buffer[:rows])
+            arrays = [times] + [pa.array(values[:, k]) for k in range(values.shape[1])]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=writer.schema))
+
+    def _close(self):
+        for writer in self._writers:
+            writer.close()
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+# Pure Python/NumPy reader and writer for EPANET Input (.inp) files.
+# Builds a column-oriented model of the network without loading the toolkit,
+# so networks can be inspected, screened and rewritten as variants cheaply.
+import re
+from collections import OrderedDict
+import numpy as np
+
+# Column layout of the tabular sections: (name, kind, default) where kind is
+# 's' for text and 'f' for numbers; None as default marks a required field.
+_table_columns= OrderedDict([
+    ('JUNCTIONS',   [('id', 's', None), ('elevation', 'f', None), ('demand', 'f', 0.0), ('pattern', 's', '')]),
+    ('RESERVOIRS',  [('id', 's', None), ('head', 'f', None), ('pattern', 's', '')]),
+    ('TANKS',       [('id', 's', None), ('elevation', 'f', None), ('initlevel', 'f', None),
+                     ('minlevel', 'f', None), ('maxlevel', 'f', None), ('diameter', 'f', None),
+                     ('minvol', 'f', 0.0), ('volcurve', 's', ''), ('overflow', 's', '')]),
+    ('PIPES',       [('id', 's', None), ('node1', 's', None), ('node2', 's', None),
+                     ('length', 'f', None), ('diameter', 'f', None), ('roughness', 'f', None),
+                     ('minorloss', 'f', 0.0), ('status', 's', 'Open')]),
+    ('PUMPS',       [('id', 's', None), ('node1', 's', None), ('node2', 's', None),
+                     ('head', 's', ''), ('power', 'f', np.nan), ('speed', 'f', 1.0), ('pattern', 's', '')]),
+    ('VALVES',      [('id', 's', None), ('node1', 's', None), ('node2', 's', None),
+                     ('diameter', 'f', None), ('type', 's', None), ('setting', 'f', np.nan),
+                     ('minorloss', 'f', 0.0), ('curve', 's', '')]),
+    ('TAGS',        [('object', 's', None), ('id', 's', None), ('tag', 's', None)]),
+    ('DEMANDS',     [('junction', 's', None), ('demand', 'f', None), ('pattern', 's', '')]),
+    ('STATUS',      [('id', 's', None), ('status', 's', None)]),
+    ('EMITTERS',    [('junction', 's', None), ('coefficient', 'f', None)]),
+    ('QUALITY',     [('node', 's', None), ('initqual', 'f', None)]),
+    ('SOURCES',     [('node', 's', None), ('type', 's', None), ('quality', 'f', None), ('pattern', 's', '')]),
+    ('MIXING',      [('tank', 's', None), ('model', 's', None), ('fraction', 'f', np.nan)]),
+    ('COORDINATES', [('node', 's', None), ('x', 'f', None), ('y', 'f', None)]),
+    ('VERTICES',    [('link', 's', None), ('x', 'f', None), ('y', 'f', None)]),
+    ('LABELS',      [('x', 'f', None), ('y', 'f', None), ('label', 's', None), ('anchor', 's', '')]),
+])
+
+# Sections stored as {KEY: value} with their multi-word keys
+_keyword_sections= {
+    'TIMES':     ('HYDRAULIC TIMESTEP', 'QUALITY TIMESTEP', 'RULE TIMESTEP', 'PATTERN TIMESTEP',
+                  'PATTERN START', 'REPORT TIMESTEP', 'REPORT START', 'START CLOCKTIME'),
+    'OPTIONS':   ('SPECIFIC GRAVITY', 'DEMAND MULTIPLIER', 'EMITTER EXPONENT', 'DEMAND MODEL',
+                  'MINIMUM PRESSURE', 'REQUIRED PRESSURE', 'PRESSURE EXPONENT'),
+    'ENERGY':    ('GLOBAL EFFICIENCY', 'GLOBAL EFFIC', 'GLOBAL PRICE', 'GLOBAL PATTERN', 'DEMAND CHARGE'),
+    'REACTIONS': ('ORDER BULK', 'ORDER WALL', 'ORDER TANK', 'GLOBAL BULK', 'GLOBAL WALL',
+                  'LIMITING POTENTIAL', 'ROUGHNESS CORRELATION'),
+    'BACKDROP':  (),
+}
+
+# Per-element keywords of the keyword sections ([ENERGY] PUMP id ..., [REACTIONS]
+# BULK/WALL/TANK id value). These lines repeat once per element, so they are
+# kept verbatim in the <section>_elements lists rather than in the dict
+_element_keywords= {
+    'ENERGY':    ('PUMP',),
+    'REACTIONS': ('BULK', 'WALL', 'TANK'),
+}
+
+# Sections kept verbatim as a list of lines
+_line_sections= ('TITLE', 'CONTROLS', 'RULES', 'REPORT')
+
+# Order in which ENnetwork.write emits the sections
+_write_order= ('TITLE', 'JUNCTIONS', 'RESERVOIRS', 'TANKS', 'PIPES', 'PUMPS', 'VALVES', 'TAGS',
+               'DEMANDS', 'STATUS', 'PATTERNS', 'CURVES', 'CONTROLS', 'RULES', 'ENERGY',
+               'EMITTERS', 'QUALITY', 'SOURCES', 'REACTIONS', 'MIXING', 'TIMES', 'REPORT',
+               'OPTIONS', 'COORDINATES', 'VERTICES', 'LABELS', 'BACKDROP')
+
+_time_units= {'SEC': 1, 'SECOND': 1, 'SECONDS': 1, 'MIN': 60, 'MINUTE': 60, 'MINUTES': 60,
+              'HOUR': 3600, 'HOURS': 3600, 'DAY': 86400, 'DAYS': 86400}
+
+_quoted= re.compile(r'"[^"]*"|\S+')
+
+def ENreadinp(filename):
+    # Description: Reads an EPANET Input file without using the toolkit.
+    # Arguments:
+    #     filename: name of an EPANET Input file
+    # Returns: ENnetwork instance
+    net = ENnetwork()
+    with open(filename) as f:
+        net._parse(f.read().splitlines(), filename)
+    return net
+
+class ENtable(object):
+    # Column-oriented table of one Input file section.
+    # Columns are NumPy arrays of equal length, accessed as table['name'];
+    # text columns have a str dtype and numeric ones float64.
+    def __init__(self, columns):
+        self.columns = OrderedDict(columns)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        self.columns[name] = values
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __len__(self):
+        for values in self.columns.values():
+            return len(values)
+        return 0
+
+    def keys(self):
+        return list(self.columns.keys())
+
+    def index(self, value, column='id'):
+        # Returns the position (starting from 0) of the first row whose column equals value.
+        found = np.flatnonzero(self.columns[column] == value)
+        if len(found) == 0:
+            raise KeyError(value)
+        return int(found[0])
+
+class ENnetwork(object):
+    # Network model read from an EPANET Input file by ENreadinp.
+    #
+    # Tabular sections are ENtable attributes named after the section in lower
+    # case (junctions, reservoirs, tanks, pipes, pumps, valves, tags, demands,
+    # status, emitters, quality, sources, mixing, coordinates, vertices, labels).
+    # Other sections:
+    #     patterns:   OrderedDict pattern ID -> float array of multipliers
+    #     curves:     OrderedDict curve ID -> (x array, y array)
+    #     times, options, energy, reactions, backdrop:
+    #                 OrderedDict upper-case keyword -> value text
+    #     energy_elements, reactions_elements:
+    #                 lists of the per-element lines of [ENERGY] (PUMP ...) and
+    #                 [REACTIONS] (BULK/WALL/TANK ...), in file order
+    #     title, controls, rules, report: lists of lines
+    #     other:      OrderedDict section name -> lines, for sections not listed above
+    # Values are kept in the units of the file.
+    def __init__(self):
+        for section, columns in _table_columns.items():
+            setattr(self, section.lower(), _empty_table(columns))
+        self.patterns = OrderedDict()
+        self.curves = OrderedDict()
+        for section in _keyword_sections:
+            setattr(self, section.lower(), OrderedDict())
+        for section in _element_keywords:
+            setattr(self, section.lower() + '_elements', [])
+        for section in _line_sections:
+            setattr(self, section.lower(), [])
+        # Sections this reader does not interpret, kept verbatim
+        self.other = OrderedDict()
+        # Order in which [RESERVOIRS]/[TANKS] and [PIPES]/[PUMPS]/[VALVES]
+        # appear, which fixes the toolkit's node and link indices
+        self._node_sections = ['RESERVOIRS', 'TANKS']
+        self._link_sections = ['PIPES', 'PUMPS', 'VALVES']
+
+    def _parse(self, lines, filename):
+        rows = dict((section, []) for section in _table_columns)
+        curves = OrderedDict()
+        section = None
+        seen = []
+        for lineno, line in enumerate(lines, 1):
+            text = line.strip() if section == 'TITLE' else line.split(';', 1)[0].strip()
+            if not text:
+                continue
+            if text.startswith('['):
+                section = text.strip('[] \t').upper()
+                if section == 'END':
+                    break
+                if section not in seen:
+                    seen.append(section)
+                continue
+            try:
+                if section in rows:
+                    if section == 'LABELS':
+                        tokens = [t.strip('"') for t in _quoted.findall(text)]
+                    else:
+                        tokens = text.split()
+                    rows[section].append(tokens)
+                elif section == 'PATTERNS':
+                    tokens = text.split()
+                    pattern = self.patterns.setdefault(tokens[0], [])
+                    pattern.extend(float(v) for v in tokens[1:])
+                elif section == 'CURVES':
+                    tokens = text.split()
+                    curve = curves.setdefault(tokens[0], ([], []))
+                    curve[0].append(float(tokens[1]))
+                    curve[1].append(float(tokens[2]))
+                elif text.split()[0].upper() in _element_keywords.get(section, ()):
+                    getattr(self, section.lower() + '_elements').append(text)
+                elif section in _keyword_sections:
+                    key, value = _keyword(text, _keyword_sections[section])
+                    getattr(self, section.lower())[key] = value
+                elif section in _line_sections:
+                    getattr(self, section.lower()).append(text)
+                elif section is None:
+                    raise ValueError('data found before the first section')
+                else:
+                    self.other.setdefault(section, []).append(text)
+            except (ValueError, IndexError) as e:
+                raise ValueError('%s:%d: [%s] %s' % (filename, lineno, section, e))
+        for section, columns in _table_columns.items():
+            try:
+                if section == 'PUMPS':
+                    table = _pump_table(rows[section])
+                elif section == 'TANKS':
+                    table = _tank_table(rows[section])
+                elif section == 'VALVES':
+                    table = _valve_table(rows[section])
+                else:
+                    table = _table(rows[section], columns)
+            except ValueError as e:
+                raise ValueError('%s: [%s] %s' % (filename, section, e))
+            setattr(self, section.lower(), table)
+        for pid, factors in self.patterns.items():
+            self.patterns[pid] = np.array(factors, dtype=float)
+        for cid, (x, y) in curves.items():
+            self.curves[cid] = (np.array(x, dtype=float), np.array(y, dtype=float))
+        self._node_sections = [s for s in seen if s in ('RESERVOIRS', 'TANKS')]
+        self._link_sections = [s for s in seen if s in ('PIPES', 'PUMPS', 'VALVES')]
+
+    @property
+    def node_ids(self):
+        # Node IDs in toolkit index order: junctions, then reservoirs and
+        # tanks in the order their sections appear.
+        ids = [self.junctions['id']]
+        ids += [getattr(self, s.lower())['id'] for s in self._node_sections]
+        return np.concatenate(ids)
+
+    @property
+    def link_ids(self):
+        # Link IDs in toolkit index order: pipes, pumps and valves in the
+        # order their sections appear.
+        return np.concatenate([getattr(self, s.lower())['id'] for s in self._link_sections])
+
+    def timeparam(self, key):
+        # Description: Retrieves a [TIMES] entry in seconds.
+        # Arguments: key: keyword such as 'DURATION' or 'HYDRAULIC TIMESTEP'
+        # Returns: seconds, or 0 when the entry is absent
+        value = self.times.get(key.upper())
+        if value is None:
+            return 0
+        return _seconds(value)
+
+    def write(self, filename):
+        # Description: Writes the network to an EPANET Input file.
+        # Node and link sections keep their relative order so that the
+        # toolkit assigns the same indices when the file is read back.
+        order = list(_write_order)
+        for sections in (self._node_sections, self._link_sections):
+            slots = sorted(order.index(section) for section in sections)
+            for slot, section in zip(slots, sections):
+                order[slot] = section
+        with open(filename, 'w') as f:
+            for section in order + list(self.other):
+                f.write('[%s]\n' % section)
+                for line in self._section_lines(section):
+                    f.write(line + '\n')
+                f.write('\n')
+            f.write('[END]\n')
+
+    def _section_lines(self, section):
+        name = section.lower()
+        if section in self.other:
+            return list(self.other[section])
+        if section in _line_sections:
+            return list(getattr(self, name))
+        if section in _keyword_sections:
+            lines = ['%s\t%s' % (key, value) for key, value in getattr(self, name).items()]
+            return lines + list(getattr(self, name + '_elements', []))
+        if section == 'PATTERNS':
+            lines = []
+            for pid, factors in self.patterns.items():
+                for k in range(0, max(len(factors), 1), 6):
+                    lines.append('\t'.join([pid] + [_format(v) for v in factors[k:k+6]]))
+            return lines
+        if section == 'CURVES':
+            return ['%s\t%s\t%s' % (cid, _format(xv), _format(yv))
+                    for cid, (x, y) in self.curves.items() for xv, yv in zip(x, y)]
+        table = getattr(self, name)
+        if section == 'PUMPS':
+            return _pump_lines(table)
+        if section == 'VALVES':
+            return _valve_lines(table)
+        if section == 'TANKS':
+            return _tank_lines(table)
+        columns = [table[c] for c, kind, default in _table_columns[section]]
+        lines = []
+        for row in zip(*columns):
+            fields = [_format(v) for v in row]
+            while fields and fields[-1] == '':
+                fields.pop()
+            if section == 'LABELS' and len(fields) > 2:
+                fields[2] = '"%s"' % fields[2]
+            lines.append('\t'.join(fields))
+        return lines
+
+def _keyword(text, multiword):
+    # Splits a keyword line into (KEY, value), matching multi-word keys first.
+    upper = ' '.join(text.split()).upper()
+    for key in multiword:
+        if upper == key or upper.startswith(key + ' '):
+            return key, ' '.join(text.split()[len(key.split()):])
+    tokens = text.split(None, 1)
+    return tokens[0].upper(), tokens[1].strip() if len(tokens) > 1 else ''
+
+def _empty_table(columns):
+    return ENtable((name, np.array([], dtype=str if kind == 's' else float))
+                   for name, kind, default in columns)
+
+def _table(rows, columns):
+    # Turns token rows into columns, filling missing optional trailing fields.
+    ncols = len(columns)
+    required = sum(1 for name, kind, default in columns if default is None)
+    padded = []
+    defaults = [default for name, kind, default in columns]
+    for tokens in rows:
+        if len(tokens) < required:
+            raise ValueError('%s: expected at least %d fields' % (' '.join(tokens), required))
+        padded.append(tokens[:ncols] + defaults[len(tokens):])
+    if not padded:
+        return _empty_table(columns)
+    table = ENtable([])
+    for k, (name, kind, default) in enumerate(columns):
+        values = [row[k] for row in padded]
+        table[name] = np.array(values, dtype=str if kind == 's' else float)
+    return table
+
+def _pump_table(rows):
+    # [PUMPS] rows are "id node1 node2" followed by keyword/value pairs.
+    fixed = []
+    for tokens in rows:
+        if len(tokens) < 3:
+            raise ValueError('%s: expected at least 3 fields' % ' '.join(tokens))
+        options = {'HEAD': '', 'POWER': np.nan, 'SPEED': 1.0, 'PATTERN': ''}
+        for k in range(3, len(tokens) - 1, 2):
+            options[tokens[k].upper()] = tokens[k+1]
+        fixed.append(tokens[:3] + [options['HEAD'], options['POWER'], options['SPEED'], options['PATTERN']])
+    return _table(fixed, _table_columns['PUMPS'])
+
+def _tank_table(rows):
+    # '*' stands for no volume curve when an overflow flag (EPANET 2.2) follows.
+    table = _table(rows, _table_columns['TANKS'])
+    table['volcurve'] = np.where(table['volcurve'] == '*', '', table['volcurve'])
+    return table
+
+def _valve_table(rows):
+    # A GPV's setting field is the ID of its headloss curve.
+    fixed = []
+    for tokens in rows:
+        if len(tokens) < 5:
+            raise ValueError('%s: expected at least 5 fields' % ' '.join(tokens))
+        tokens = tokens[:7] + [np.nan, 0.0][len(tokens) - 5:]
+        curve = ''
+        if tokens[4].upper() == 'GPV':
+            curve, tokens[5] = tokens[5], np.nan
+        fixed.append(tokens + [curve])
+    return _table(fixed, _table_columns['VALVES'])
+
+def _pump_lines(table):
+    lines = []
+    for pid, n1, n2, head, power, speed, pattern in zip(*[table[c] for c, kind, default in _table_columns['PUMPS']]):
+        fields = [pid, n1, n2]
+        if head: fields += ['HEAD', head]
+        if not np.isnan(power): fields += ['POWER', _format(power)]
+        if speed != 1.0: fields += ['SPEED', _format(speed)]
+        if pattern: fields += ['PATTERN', pattern]
+        lines.append('\t'.join(fields))
+    return lines
+
+def _tank_lines(table):
+    lines = []
+    for row in zip(*[table[c] for c, kind, default in _table_columns['TANKS']]):
+        fields = [_format(v) for v in row]
+        if fields[8]:
+            fields[7] = fields[7] or '*'
+        else:
+            fields = fields[:8] if fields[7] else fields[:7]
+        lines.append('\t'.join(fields))
+    return lines
+
+def _valve_lines(table):
+    # A missing setting is only valid without the fields that follow it;
+    # when a minor loss follows, 0 stands in for the setting.
+    lines = []
+    for vid, n1, n2, diam, vtype, setting, minorloss, curve in zip(*[table[c] for c, kind, default in _table_columns['VALVES']]):
+        fields = [vid, n1, n2, _format(diam), vtype]
+        if curve:
+            fields.append(curve)
+        elif not np.isnan(setting):
+            fields.append(_format(setting))
+        elif minorloss != 0.0:
+            fields.append('0')
+        else:
+            lines.append('\t'.join(fields))
+            continue
+        lines.append('\t'.join(fields + [_format(minorloss)]))
+    return lines
+
+def _format(value):
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return ''
+        return '%.12g' % value
+    return str(value)
+
+def _seconds(value):
+    # Converts an Input file time ("24", "1:30", "0:05:30", "6 HOURS", "12 am") to seconds.
+    tokens = value.split()
+    if not tokens:
+        return 0
+    parts = tokens[0].split(':')
+    hours = float(parts[0]) + sum(float(p)/60**k for k, p in enumerate(parts[1:], 1))
+    if len(tokens) > 1:
+        unit = tokens[1].upper()
+        if unit in ('AM', 'PM'):
+            hours = hours % 12 + (12 if unit == 'PM' else 0)
+        elif unit in _time_units:
+            if len(parts) == 1:
+                return int(round(float(parts[0])*_time_units[unit]))
+        else:
+            raise ValueError('unknown time unit %s' % tokens[1])
+    return int(round(hours*3600))
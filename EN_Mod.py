@@ -1,19 +1,93 @@
 # -*- coding: utf-8 -*-
 # Provides C compatible data types, and allows calling functions in DLLs or shared libraries. 
 import ctypes   
+import ctypes.util
+import functools
 import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
 import datetime
+import numpy as np
 
 # Establish current directory
-script_dir = os.path.dirname(__file__)
-dll_dir = os.path.join(script_dir,'epanet2.dll')
+script_dir = os.path.dirname(os.path.abspath(__file__))
 
-# Verify that DLL exists in current working directory
-if os.path.exists(dll_dir):
-    # Load DLL into memory using ctypes
-    _lib = ctypes.cdll.epanet2
+# Toolkit library file names searched for next to this module, in order
+if sys.platform.startswith('win'):
+    _lib_names= ('epanet2.dll',)
+elif sys.platform == 'darwin':
+    _lib_names= ('libepanet2.dylib', 'libepanet.dylib')
 else:
-    raise Exception('epanet2.dll does not exist in working directory.')
+    _lib_names= ('libepanet2.so', 'libepanet.so')
+
+def _find_library(path=None):
+    # Locates the toolkit library: the given path, then the EPANET_LIBRARY
+    # environment variable, then this module's directory, then the system
+    # library search path.
+    if path:
+        return path
+    if os.environ.get('EPANET_LIBRARY'):
+        return os.environ['EPANET_LIBRARY']
+    for name in _lib_names:
+        candidate = os.path.join(script_dir, name)
+        if os.path.exists(candidate):
+            return candidate
+    for name in ('epanet2', 'epanet'):
+        found = ctypes.util.find_library(name)
+        if found:
+            return found
+    raise OSError('EPANET toolkit library not found: put %s next to EN_Mod.py, '
+                  'set EPANET_LIBRARY or pass its path' % ' or '.join(_lib_names))
+
+class _MissingLibrary(object):
+    # Stands in for _lib when no toolkit library could be loaded at import,
+    # so that the module can still be imported and ENloadlibrary called.
+    def __init__(self, reason):
+        self.reason = reason
+    def __getattr__(self, name):
+        raise OSError(self.reason)
+    def __call__(self, *args):
+        # stands in for the toolkit functions bound by ENloadlibrary too
+        raise OSError(self.reason)
+
+def ENloadlibrary(path=None):
+    # Description:
+    #     Loads the toolkit library used by the module-level EN functions.
+    # Arguments:
+    #     path: path of epanet2.dll / libepanet2.so; searched for when omitted
+    #           (EPANET_LIBRARY environment variable, this module's directory,
+    #           system library path)
+    # Returns:
+    #     the loaded ctypes library
+    global _lib, _nodegetter, _linkgetter, _nodebulkgetter, _linkbulkgetter, _nodesetter, _linksetter
+    lib = ctypes.CDLL(_find_library(path))
+    _nodegetter = lib.ENgetnodevalue
+    _linkgetter = lib.ENgetlinkvalue
+    _nodebulkgetter = getattr(lib, 'ENgetnodevalues', None)
+    _linkbulkgetter = getattr(lib, 'ENgetlinkvalues', None)
+    _nodesetter = _setter(lib, 'ENsetnodevalue')
+    _linksetter = _setter(lib, 'ENsetlinkvalue')
+    _lib = lib
+    _plans.clear()
+    return _lib
+
+def _setter(lib, name):
+    # Typed prototype int name(int, int, float) of a legacy toolkit setter.
+    return ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_float)((name, lib))
+
+# Index plans of the module-level bulk getters (see _getvalues)
+_plans= {}
+
+# Load DLL into memory using ctypes
+try:
+    ENloadlibrary()
+except OSError as e:
+    _lib = _MissingLibrary(str(e))
+    _nodegetter = _linkgetter = _nodesetter = _linksetter = _lib
+    _nodebulkgetter = _linkbulkgetter = None
 
 # Specify error and ID_label character lengths
 _max_label_len= 32
@@ -21,10 +95,33 @@ _err_max_char= 80
 
 _current_simulation_time=  ctypes.c_long()
 
+# This module, as the default toolkit of ENtopology/ENstep: an ENproject
+# provides the same EN functions as methods
+_module= sys.modules[__name__]
+
+def _cstr(text):
+    # Encodes a file name or ID label for a char* argument.
+    return text if isinstance(text, bytes) else text.encode('latin-1')
+
+def _pystr(value):
+    # Decodes a label returned by the toolkit to the native str type.
+    return value if isinstance(value, str) else value.decode('latin-1')
+
+# Topology cache built by ENopen(..., topology=True), dropped by ENclose
+_topology= None
+
+# Set by ENusehydfile until the network is closed: the toolkit then refuses
+# to compute hydraulics (error 107), and the 2.0 library crashes if asked to
+_hydfile_used= False
+
+# Names returned by ENgetnodetype/ENgetlinktype, indexed by type code
+_node_type_names= ('Junction', 'Reservoir', 'Tank')
+_link_type_names= ('CVPIPE', 'PIPE', 'PUMP', 'PRV', 'PSV', 'PBV', 'FCV', 'TCV', 'GPV')
+
 # ============================================================================================================
 # Open/Close Toolkit Operations
 # ============================================================================================================
-def ENopen(inpname, repname='report.txt', binname=''):
+def ENopen(inpname, repname='report.txt', binname='', topology=False):
     # Description:
     #     Opens the Toolkit to analyze a particular distribution system.
     #     Defines global structure EN_SIZE.
@@ -32,11 +129,15 @@ def ENopen(inpname, repname='report.txt', binname=''):
     #     inpname:	name of an EPANET Input file
     #     repname:	name of an output Report file
     #     binname:	name of an optional binary Output file.
+    #     topology: if True, build the ENtopology cache (see ENgettopology) so that
+    #               ID, index and type lookups no longer call the DLL
     # Returns:
     #     Returns a dictionary of network size (number of nodes, links and tanks)
     #     Outputs to console if network was successfully launched
-    
-    errcode = _lib.ENopen(ctypes.c_char_p(inpname), ctypes.c_char_p(repname), ctypes.c_char_p(binname))
+    global _topology, _hydfile_used
+    _topology = None
+    _hydfile_used = False
+    errcode = _lib.ENopen(ctypes.c_char_p(_cstr(inpname)), ctypes.c_char_p(_cstr(repname)), ctypes.c_char_p(_cstr(binname)))
     if errcode!=0: 
         raise ENtoolkitError(errcode)
     else:
@@ -45,6 +146,8 @@ def ENopen(inpname, repname='report.txt', binname=''):
         nnodes = ENgetcount(EN_NODECOUNT)
         nlinks = ENgetcount(EN_LINKCOUNT)
         ntanks = ENgetcount(EN_TANKCOUNT)
+        if topology:
+            _topology = ENtopology()
     return {'nodes':nnodes, 'links':nlinks, 'tanks':ntanks}
 
 def ENclose():
@@ -55,6 +158,9 @@ def ENclose():
    # Notes:
    #   ENclose must be called when all processing has been completed,
    #   even if an error condition was encountered.
+   global _topology, _hydfile_used
+   _topology = None
+   _hydfile_used = False
    errcode = _lib.ENclose()
    if errcode!=0: raise ENtoolkitError(errcode)
 # ============================================================================================================
@@ -70,8 +176,10 @@ def ENgetnodeindex(nodeid):
    #     index: node index
    # Notes:
    #     Node indexes are consecutive integers starting from 1.
+    if _topology is not None and _pystr(nodeid) in _topology.node_index:
+        return _topology.node_index[_pystr(nodeid)]
     j= ctypes.c_int()
-    errcode = _lib.ENgetnodeindex(ctypes.c_char_p(nodeid), ctypes.byref(j))
+    errcode = _lib.ENgetnodeindex(ctypes.c_char_p(_cstr(nodeid)), ctypes.byref(j))
     if errcode!=0: raise ENtoolkitError(errcode)
     return j.value
 
@@ -85,10 +193,12 @@ def ENgetnodeid(index):
    #    id:ID label of node
    # Notes:
    #    The ID label string should be sized to hold at least 15 characters.   
+    if _topology is not None and 0 < index <= len(_topology.node_ids):
+        return _topology.node_ids[index-1]
     label = ctypes.create_string_buffer(_max_label_len)
     errcode= _lib.ENgetnodeid(index, ctypes.byref(label))
     if errcode!=0: raise ENtoolkitError(errcode)
-    return label.value
+    return _pystr(label.value)
 
 def ENgetnodetype(index):
    # Description:
@@ -109,11 +219,12 @@ def ENgetnodetype(index):
    # EN_JUNCTION	0	Junction node
    # EN_RESERVOIR	1	Reservoir node
    # EN_TANK	        2	Tank node
+    if _topology is not None and 0 < index <= len(_topology.node_ids):
+        return _node_type_names[_topology.node_types[index-1]]
     j= ctypes.c_int()
     errcode= _lib.ENgetnodetype(index, ctypes.byref(j))
     if errcode!=0: raise ENtoolkitError(errcode)
-    node_type = {'0':'Junction', '1':'Reservoir', '2':'Tank'}
-    return node_type[str(j.value)]
+    return _node_type_names[j.value]
 
 def ENgetnodevalue(index, paramcode):
     # Description:
@@ -154,6 +265,26 @@ def ENgetnodevalue(index, paramcode):
     errcode= _lib.ENgetnodevalue(index, paramcode, ctypes.byref(j))
     if errcode!=0: raise ENtoolkitError(errcode)
     return j.value
+
+def ENgetnodevalues(paramcode, indices=None, out=None, dtype=np.float32):
+    # Description:
+    #     Retrieves the value of a node parameter for many nodes in one pass.
+    # Arguments:
+    #     paramcode: node parameter code (see ENgetnodevalue)
+    #     indices:   sequence of node indices (default: all nodes 1..EN_NODECOUNT)
+    #     out:       optional preallocated 1-D NumPy array to fill
+    #     dtype:     dtype of the array allocated when out is not given
+    # Returns:
+    #     NumPy array of values, out[k] holding the value of node indices[k]
+    # Notes:
+    #     Uses the toolkit's ENgetnodevalues when the loaded library exports it
+    #     (EPANET 2.3). Otherwise ENgetnodevalue is still called once per node,
+    #     so the time taken stays proportional to the number of nodes: only
+    #     the Python overhead of each call is smaller than in a loop over
+    #     ENgetnodevalue, the pointers it writes through being prepared once
+    #     per set of indices.
+    return _getvalues(_nodegetter, _nodebulkgetter,
+                      _count(EN_NODECOUNT, _topology, ENgetcount), 203, paramcode, indices, out, dtype)
     
 def ENsetnodevalue(index, paramcode, value):
    # Description:
@@ -191,6 +322,18 @@ def ENsetnodevalue(index, paramcode, value):
    # Values are supplied in units which depend on the units used for flow rate in the EPANET input file (see Units of Measurement).
     errcode= _lib.ENsetnodevalue(ctypes.c_int(index), ctypes.c_int(paramcode), ctypes.c_float(value))
     if errcode!=0: raise ENtoolkitError(errcode)
+
+def ENsetnodevalues(paramcode, indices, values):
+    # Description:
+    #     Sets the value of a node parameter for many nodes in one pass.
+    # Arguments:
+    #     paramcode: node parameter code (see ENsetnodevalue)
+    #     indices:   sequence of node indices
+    #     values:    sequence of values, one per index, or a single value for all
+    # Notes:
+    #     Every node is attempted; if any fail an ENbulkError listing all the
+    #     failing indices and their error codes is raised at the end.
+    _setvalues(_nodesetter, paramcode, indices, values)
     
 # ============================================================================================================
 # Link Manipulation
@@ -199,8 +342,10 @@ def ENgetlinkindex(linkid):
     # Description: Retrieves the index of a link with a specified ID.
     # Arguments: linkid: link ID label
     # Returns:link index
+    if _topology is not None and _pystr(linkid) in _topology.link_index:
+        return _topology.link_index[_pystr(linkid)]
     j= ctypes.c_int()
-    errcode= _lib.ENgetlinkindex(ctypes.c_char_p(linkid), ctypes.byref(j))
+    errcode= _lib.ENgetlinkindex(ctypes.c_char_p(_cstr(linkid)), ctypes.byref(j))
     if errcode!=0: raise ENtoolkitError(errcode)
     return j.value
 
@@ -208,10 +353,12 @@ def ENgetlinkid(index):
     # Description: Retrieves the ID label of a link with a specified index.
     # Arguments: index: link index
     # Returns: linkid: link ID label
+    if _topology is not None and 0 < index <= len(_topology.link_ids):
+        return _topology.link_ids[index-1]
     label = ctypes.create_string_buffer(_max_label_len)
     errcode= _lib.ENgetlinkid(index, ctypes.byref(label))
     if errcode!=0: raise ENtoolkitError(errcode)
-    return label.value
+    return _pystr(label.value)
 
 def ENgetlinktype(index):
     # Description: Retrieves the link-type code for a specific link.
@@ -228,16 +375,19 @@ def ENgetlinktype(index):
     # EN_FCV           = 6
     # EN_TCV           = 7
     # EN_GPV           = 8
+    if _topology is not None and 0 < index <= len(_topology.link_ids):
+        return _link_type_names[_topology.link_types[index-1]]
     j= ctypes.c_int()
     errcode= _lib.ENgetlinktype(index, ctypes.byref(j))
     if errcode!=0: raise ENtoolkitError(errcode)
-    link_type = {'0':'CVPIPE', '1':'PIPE', '2':'PUMP','3':'PRV','4':'PSV','5':'PBV','6':'FCV', '7':'TCV', '8':'GPV'}
-    return link_type[str(j.value)]
+    return _link_type_names[j.value]
 
 def ENgetlinknodes(index):
     # Description: Retrieves the indexes of the end nodes of a specified link.
     # Arguments: index: link index
     # Returns: integer indices of end nodes
+    if _topology is not None and 0 < index <= len(_topology.link_ids):
+        return tuple(_topology.link_nodes[index-1].tolist())
     j1= ctypes.c_int()
     j2= ctypes.c_int()
     errcode= _lib.ENgetlinknodes(index,ctypes.byref(j1),ctypes.byref(j2))
@@ -263,12 +413,29 @@ def ENgetlinkvalue(index, paramcode):
     #             EN_STATUS       * Actual link status (0 = closed, 1 = open)
     #             EN_SETTING      * Roughness for pipes, actual speed for pumps, actual setting for valves
     #             EN_ENERGY       * Energy expended in kwatts
+    #             EN_LINKQUAL     * Average water quality in the link
     #               * computed values
     j= ctypes.c_float()
     errcode= _lib.ENgetlinkvalue(index, paramcode, ctypes.byref(j))
     if errcode!=0: raise ENtoolkitError(errcode)
     return j.value
 
+def ENgetlinkvalues(paramcode, indices=None, out=None, dtype=np.float32):
+    # Description:
+    #     Retrieves the value of a link parameter for many links in one pass.
+    # Arguments:
+    #     paramcode: link parameter code (see ENgetlinkvalue)
+    #     indices:   sequence of link indices (default: all links 1..EN_LINKCOUNT)
+    #     out:       optional preallocated 1-D NumPy array to fill
+    #     dtype:     dtype of the array allocated when out is not given
+    # Returns:
+    #     NumPy array of values, out[k] holding the value of link indices[k]
+    # Notes:
+    #     As ENgetnodevalues, one toolkit call per link unless the library
+    #     exports ENgetlinkvalues.
+    return _getvalues(_linkgetter, _linkbulkgetter,
+                      _count(EN_LINKCOUNT, _topology, ENgetcount), 204, paramcode, indices, out, dtype)
+
 def ENsetlinkvalue(index, paramcode, value):
     # Sets the value of a parameter for a specific link.
     # Arguments:
@@ -290,7 +457,108 @@ def ENsetlinkvalue(index, paramcode, value):
     # value:parameter value
     errcode= _lib.ENsetlinkvalue(ctypes.c_int(index), ctypes.c_int(paramcode), ctypes.c_float(value))
     if errcode!=0: raise ENtoolkitError(errcode)
+
+def ENsetlinkvalues(paramcode, indices, values):
+    # Description:
+    #     Sets the value of a link parameter for many links in one pass.
+    # Arguments:
+    #     paramcode: link parameter code (see ENsetlinkvalue)
+    #     indices:   sequence of link indices
+    #     values:    sequence of values, one per index, or a single value for all
+    # Notes:
+    #     Every link is attempted; if any fail an ENbulkError listing all the
+    #     failing indices and their error codes is raised at the end.
+    _setvalues(_linksetter, paramcode, indices, values)
     
+# ============================================================================================================
+# Bulk value helpers
+# ============================================================================================================
+def _count(countcode, topology, getcount):
+    # Number of nodes (EN_NODECOUNT) or links (EN_LINKCOUNT), from the
+    # topology cache when there is one, otherwise from getcount.
+    if topology is not None:
+        return len(topology.node_ids if countcode == EN_NODECOUNT else topology.link_ids)
+    return getcount(countcode)
+
+class _valueplan(object):
+    # What _getvalues derives from a set of indices, kept for later calls
+    # with the same indices: a buffer of the toolkit's type and, for the
+    # bulk getter, a pointer to it and the 0-based positions read from it
+    # (None for all elements); for the per-element getter, the (index,
+    # pointer into the buffer) pairs of the calls.
+    def __init__(self, indices, total, real, bulk):
+        self.count = total if indices is None else len(indices)
+        self.valid = indices is None or not self.count or (indices.min() >= 1 and indices.max() <= total)
+        self.positions = None
+        if bulk:
+            self.buffer = np.empty(total, dtype=real)
+            self.pointer = self.buffer.ctypes.data_as(ctypes.POINTER(real))
+            if indices is not None and self.valid:
+                self.positions = (indices - 1).astype(np.intp)
+        else:
+            self.buffer = np.empty(self.count, dtype=real)
+            address = self.buffer.ctypes.data
+            size = ctypes.sizeof(real)
+            numbers = range(1, self.count+1) if indices is None else indices.tolist()
+            self.elements = [(index, ctypes.c_void_p(address + k*size)) for k, index in enumerate(numbers)]
+
+def _plan(plans, indices, total, real, bulk):
+    # Cached _valueplan of indices (None for all elements), keyed by their
+    # values so that an array modified in place gets a new plan.
+    if indices is not None:
+        indices = np.ascontiguousarray(indices, dtype=np.intc).reshape(-1)
+    key = (total, real, bulk, None if indices is None else indices.tobytes())
+    plan = plans.get(key)
+    if plan is None:
+        if len(plans) >= 32:
+            plans.clear()
+        plan = plans[key] = _valueplan(indices, total, real, bulk)
+    return plan
+
+def _getvalues(getter, bulkgetter, total, rangeerr, paramcode, indices, out, dtype,
+               real=ctypes.c_float, error=None, plans=None):
+    # Shared body of ENgetnodevalues/ENgetlinkvalues.
+    # getter is the per-element toolkit function, bulkgetter the optional
+    # whole-network one (None when the library does not export it), total the
+    # number of nodes/links, rangeerr the toolkit error code for an undefined
+    # node/link index, real the ctypes type of the toolkit's values, error
+    # the exception factory for toolkit error codes and plans the toolkit's
+    # cache of index plans (see _plan).
+    error = error or ENtoolkitError
+    plan = _plan(_plans if plans is None else plans, indices, total, real, bulkgetter is not None)
+    count = plan.count
+    if out is None:
+        out = np.empty(count, dtype=dtype)
+    elif out.shape[0] < count:
+        raise ValueError('out has %d elements, %d are needed' % (out.shape[0], count))
+    if bulkgetter is not None:
+        if not plan.valid:
+            raise error(rangeerr)
+        errcode = bulkgetter(ctypes.c_int(paramcode), plan.pointer)
+        if errcode!=0: raise error(errcode)
+        out[:count] = plan.buffer if plan.positions is None else plan.buffer[plan.positions]
+        return out
+    for index, pointer in plan.elements:
+        errcode = getter(index, paramcode, pointer)
+        if errcode!=0: raise error(errcode)
+    out[:count] = plan.buffer
+    return out
+
+def _setvalues(setter, paramcode, indices, values, geterror=None):
+    # Shared body of ENsetnodevalues/ENsetlinkvalues. setter is a typed
+    # prototype of the toolkit function, which converts plain Python numbers
+    # in C so that no ctypes.c_int/c_float objects are built per element;
+    # geterror gives the text of an error code.
+    indices = np.asarray(indices, dtype=np.intc)
+    values = np.broadcast_to(np.asarray(values, dtype=np.float64), indices.shape)
+    failures = []
+    for index, value in zip(indices.tolist(), values.tolist()):
+        errcode = setter(index, paramcode, value)
+        if errcode!=0: failures.append((index, errcode))
+    if failures:
+        geterror = geterror or ENgeterror
+        raise ENbulkError(failures, [geterror(ierr) for index, ierr in failures])
+
 # ============================================================================================================
 # Pattern Manipulation
 # ============================================================================================================
@@ -301,14 +569,14 @@ def ENgetpatternid(index):
     label = ctypes.create_string_buffer(_max_label_len)
     errcode= _lib.ENgetpatternid(index, ctypes.byref(label))
     if errcode!=0: raise ENtoolkitError(errcode)
-    return label.value
+    return _pystr(label.value)
 
 def ENgetpatternindex(patternid):
     # Description: Retrieves the index of a particular time pattern.
     # Arguments:
     # id: pattern ID label
     j= ctypes.c_int()
-    errcode= _lib.ENgetpatternindex(ctypes.c_char_p(patternid), ctypes.byref(j))
+    errcode= _lib.ENgetpatternindex(ctypes.c_char_p(_cstr(patternid)), ctypes.byref(j))
     if errcode!=0: raise ENtoolkitError(errcode)
     return j.value
 
@@ -345,27 +613,91 @@ def ENaddpattern(patternid):
     #      ENaddpattern(patId);  
     #      ENgetpatternindex(patId, patIndex);  
     #      ENsetpattern(patIndex, patFactors, 6);
-    errcode= _lib.ENaddpattern(ctypes.c_char_p(patternid))
+    errcode= _lib.ENaddpattern(ctypes.c_char_p(_cstr(patternid)))
     if errcode!=0: raise ENtoolkitError(errcode)
 
+def ENgetpattern(index, out=None, dtype=np.float32):
+    # Description: Retrieves all of the multiplier factors of a time pattern.
+    # Arguments:
+    #     index: time pattern index
+    #     out:   optional preallocated 1-D NumPy array to fill
+    #     dtype: dtype of the array allocated when out is not given
+    # Returns: NumPy array of the factors, period k+1 in position k
+    index = int(index)
+    return _getpattern(_lib.ENgetpatternvalue, ENgetpatternlen(index), index, out, dtype)
+
 def ENsetpattern(index, factors):
     # Description: Sets all of the multiplier factors for a specific time pattern.
     # Arguments:
     #     index:    time pattern index
-    #     factors:  multiplier factors list for the entire pattern
+    #     factors:  multiplier factors for the entire pattern (sequence or NumPy array)
     # Notes:
     #      Pattern indexes are consecutive integers starting from 1.  
     #     factors points to a zero-based array that contains nfactors elements.  
     #     Use this function to redefine (and resize) a time pattern all at once; 
     #     use ENsetpatternvalue to revise pattern factors in specific time periods of a pattern.  
-    nfactors= len(factors)
-    cfactors_type= ctypes.c_float* nfactors
-    cfactors= cfactors_type()
-    for i in range(nfactors):
-       cfactors[i]= float(factors[i] )
-    errcode= _lib.ENsetpattern(ctypes.c_int(index), cfactors, ctypes.c_int(nfactors) )
+    #     A contiguous float32 array is passed to the toolkit as it is, without a copy.
+    cfactors= np.ascontiguousarray(factors, dtype=np.float32)
+    errcode= _lib.ENsetpattern(ctypes.c_int(index), cfactors.ctypes.data_as(ctypes.POINTER(ctypes.c_float)),
+                               ctypes.c_int(len(cfactors)))
     if errcode!=0: raise ENtoolkitError(errcode)
 
+def ENsetpatterns(patternids, factors, nodes=None):
+    # Description: Sets many time patterns at once, adding those that do not exist yet.
+    # Arguments:
+    #     patternids: sequence of pattern ID labels
+    #     factors:    sequence of factor arrays, one per pattern, or a 2-D array
+    #                 with one row per pattern
+    #     nodes:      optional sequence, one entry per pattern, of a node index or
+    #                 a sequence of node indices whose demand pattern (EN_PATTERN)
+    #                 becomes that pattern; None entries are skipped
+    # Returns: NumPy array of the pattern indices
+    # Example:
+    #     ENsetpatterns(['fc%d' % k for k in demand_nodes], forecasts, demand_nodes)
+    return _setpatterns(_module, patternids, factors, nodes)
+
+def _getpattern(getter, length, index, out, dtype, real=ctypes.c_float, error=None):
+    # Shared body of ENgetpattern: the factors are written straight into a
+    # buffer of the toolkit's type (out itself when it has that layout).
+    error = error or ENtoolkitError
+    if out is None:
+        out = np.empty(length, dtype=dtype)
+    elif out.shape[0] < length:
+        raise ValueError('out has %d elements, %d are needed' % (out.shape[0], length))
+    target = out[:length]
+    native = np.dtype(real)
+    direct = target.dtype == native and target.flags.c_contiguous and target.flags.writeable
+    buf = target if direct else np.empty(length, dtype=native)
+    cbuf = (real*length).from_buffer(buf)
+    byref = ctypes.byref
+    size = ctypes.sizeof(real)
+    for k in range(length):
+        errcode = getter(index, k+1, byref(cbuf, k*size))
+        if errcode!=0: raise error(errcode)
+    if buf is not target:
+        target[:] = buf
+    return out
+
+def _setpatterns(tk, patternids, factors, nodes):
+    # Body of ENsetpatterns for a toolkit tk (this module or an ENproject).
+    if len(factors) != len(patternids) or (nodes is not None and len(nodes) != len(patternids)):
+        raise ValueError('patternids, factors and nodes must have the same length')
+    indices = np.empty(len(patternids), dtype=np.intc)
+    for k, patternid in enumerate(patternids):
+        try:
+            index = tk.ENgetpatternindex(patternid)
+        except ENtoolkitError as e:
+            if e.args[0] != 205: raise
+            tk.ENaddpattern(patternid)
+            index = tk.ENgetpatternindex(patternid)
+        tk.ENsetpattern(index, factors[k])
+        indices[k] = index
+    if nodes is not None:
+        for k, entry in enumerate(nodes):
+            if entry is not None:
+                tk.ENsetnodevalues(EN_PATTERN, np.atleast_1d(entry), indices[k])
+    return indices
+
 def ENsetpatternvalue( index, period, value):
     # Description: Sets the multiplier factor for a specific period within a time pattern.
     # Arguments:
@@ -529,7 +861,7 @@ def ENgettimeparam(paramcode):
     #            EN_RULESTEP
     #            EN_STATISTIC
     #            EN_PERIODS"""
-    j= ctypes.c_int()
+    j= ctypes.c_long()
     errcode= _lib.ENgettimeparam(paramcode, ctypes.byref(j))
     if errcode!=0: raise ENtoolkitError(errcode)
     return j.value
@@ -542,7 +874,7 @@ def ENgetoption(optioncode):
     #            EN_TOLERANCE 
     #            EN_EMITEXPON 
     #            EN_DEMANDMULT
-    j= ctypes.c_int()
+    j= ctypes.c_float()
     errcode= _lib.ENgetoption(optioncode, ctypes.byref(j))
     if errcode!=0: raise ENtoolkitError(errcode)
     return j.value
@@ -574,7 +906,7 @@ def  ENsettimeparam(paramcode, timevalue):
     #                  EN_MINIMUM  minimums
     #                  EN_MAXIMUM  maximums
     #                  EN_RANGE    ranges
-    errcode= _lib.ENsettimeparam(ctypes.c_int(paramcode), ctypes.c_int(timevalue))
+    errcode= _lib.ENsettimeparam(ctypes.c_int(paramcode), ctypes.c_long(timevalue))
     if errcode!=0: raise ENtoolkitError(errcode)
 
 def ENsetoption( optioncode, value):
@@ -586,9 +918,70 @@ def ENsetoption( optioncode, value):
     #                          EN_EMITEXPON 
     #                          EN_DEMANDMULT
     #  value:  option value
-    errcode= _lib.ENsetoption(ctypes.c_int(paramcode), ctypes.c_float(value))
+    errcode= _lib.ENsetoption(ctypes.c_int(optioncode), ctypes.c_float(value))
     if errcode!=0: raise ENtoolkitError(errcode)
 # ============================================================================================================
+# Network topology cache
+# ============================================================================================================
+
+def ENgettopology():
+    # Description: Retrieves the ENtopology cache built by ENopen(..., topology=True).
+    # Returns: ENtopology instance, or None if no cache has been built for the open network.
+    return _topology
+
+class ENtopology(object):
+    # Immutable snapshot of the network structure, read once from the toolkit.
+    #
+    # Attributes:
+    #     node_ids, link_ids:        tuples of ID labels, position k holding index k+1
+    #     node_index, link_index:    dicts mapping ID label -> index
+    #     node_types, link_types:    int arrays of type codes (EN_JUNCTION.., EN_CVPIPE..)
+    #     link_nodes:                (nlinks, 2) int array of start/end node indices
+    #     junctions, reservoirs,
+    #     tanks:                     node index arrays per node type
+    #     pipes, pumps, valves:      link index arrays per link type (pipes include CV pipes)
+    #
+    # All arrays are read-only. The toolkit cannot add or remove nodes and links,
+    # so the cache stays valid until ENclose or the next ENopen discards it.
+    # It is built from the module-level functions or from an ENproject.
+    def __init__(self, toolkit=None):
+        # toolkit: ENproject to read the network from (default: this module)
+        tk = toolkit or _module
+        nnodes = tk.ENgetcount(EN_NODECOUNT)
+        nlinks = tk.ENgetcount(EN_LINKCOUNT)
+        node_ids = tuple(tk.ENgetnodeid(i) for i in range(1, nnodes+1))
+        link_ids = tuple(tk.ENgetlinkid(i) for i in range(1, nlinks+1))
+        node_types = np.array([_node_type_names.index(tk.ENgetnodetype(i)) for i in range(1, nnodes+1)],
+                              dtype=np.intc).reshape(nnodes)
+        link_types = np.array([_link_type_names.index(tk.ENgetlinktype(i)) for i in range(1, nlinks+1)],
+                              dtype=np.intc).reshape(nlinks)
+        link_nodes = np.array([tk.ENgetlinknodes(i) for i in range(1, nlinks+1)],
+                              dtype=np.intc).reshape(nlinks, 2)
+        d = self.__dict__
+        d['node_ids'] = node_ids
+        d['link_ids'] = link_ids
+        d['node_index'] = dict((nid, i+1) for i, nid in enumerate(node_ids))
+        d['link_index'] = dict((lid, i+1) for i, lid in enumerate(link_ids))
+        d['node_types'] = node_types
+        d['link_types'] = link_types
+        d['link_nodes'] = link_nodes
+        d['junctions'] = np.flatnonzero(node_types == EN_JUNCTION).astype(np.intc) + 1
+        d['reservoirs'] = np.flatnonzero(node_types == EN_RESERVOIR).astype(np.intc) + 1
+        d['tanks'] = np.flatnonzero(node_types == EN_TANK).astype(np.intc) + 1
+        d['pipes'] = np.flatnonzero(link_types <= EN_PIPE).astype(np.intc) + 1
+        d['pumps'] = np.flatnonzero(link_types == EN_PUMP).astype(np.intc) + 1
+        d['valves'] = np.flatnonzero(link_types >= EN_PRV).astype(np.intc) + 1
+        for value in d.values():
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ENtopology is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('ENtopology is immutable')
+
+# ============================================================================================================
 # Hydraulic Analysis
 # ============================================================================================================
 
@@ -606,12 +999,15 @@ def ENsolveH():
     # ENsolveQ();
     # ENreport();
     # ENclose();
+    if _hydfile_used: raise ENtoolkitError(107)
     errcode= _lib.ENsolveH()
     if errcode!=0: raise ENtoolkitError(errcode)
 
 def ENopenH(): 
     """Opens the hydraulics analysis system"""
+    if _hydfile_used: raise ENtoolkitError(107)
     errcode= _lib.ENopenH()
+    if errcode!=0: raise ENtoolkitError(errcode)
 
 def ENinitH(flag=None):
     # Description:
@@ -704,6 +1100,166 @@ def ENcloseH():
     errcode= _lib.ENcloseH()
     if errcode!=0: raise ENtoolkitError(errcode)
 
+def ENiterH(nodevars=(), linkvars=(), nodes=None, links=None, dtype=np.float32, flag=0,
+            report=False, stats=False, openclose=True):
+    # Description:
+    #  Generator running an extended period hydraulic analysis, yielding the
+    #  results of every hydraulic event (each ENrunH call).
+    # Arguments:
+    #  nodevars: node parameter codes to retrieve at each event (e.g. EN_HEAD, EN_PRESSURE)
+    #  linkvars: link parameter codes to retrieve at each event (e.g. EN_FLOW, EN_STATUS)
+    #  nodes:    node indices to retrieve (default: all nodes)
+    #  links:    link indices to retrieve (default: all links)
+    #  dtype:    dtype of the result buffers
+    #  flag:     saveflag passed to ENinitH (EN_NOSAVE or EN_SAVE)
+    #  report:   if True, only retrieve and yield results at reporting times
+    #            (EN_REPORTSTART + k*EN_REPORTSTEP); intermediate events such as
+    #            tank fill/empty or control actions are stepped over
+    #  stats:    with report=True, also keep running min/max/mean of every
+    #            event in each reporting interval (see ENstats); this retrieves
+    #            results at every event again
+    #  openclose: if False, the hydraulics system must already be open (ENopenH)
+    #            and is left open afterwards, so repeated runs reuse its memory
+    # Yields:
+    #  (t, step) where t is the simulation time in seconds and step an ENstep
+    #  whose nodes/links dicts map each parameter code to a NumPy array.
+    # Notes:
+    #  The same ENstep and arrays are refilled at every event: copy them if
+    #  they must outlive the iteration. ENopenH/ENinitH are called when
+    #  iteration starts and ENcloseH is always called when the generator
+    #  finishes, is closed (break / del) or raises.
+    # Example:
+    #  for t, step in ENiterH((EN_PRESSURE,), (EN_FLOW,)):
+    #      sink.write(t, step.nodes[EN_PRESSURE], step.links[EN_FLOW])
+    return _iterH(_module, _current_simulation_time, nodevars, linkvars, nodes, links, dtype,
+                  flag, report, stats, openclose)
+
+def _iterH(tk, clock, nodevars, linkvars, nodes, links, dtype, flag, report, stats, openclose):
+    # Body of ENiterH for a toolkit tk (this module or an ENproject); clock
+    # is the c_long its ENrunH writes the simulation time into.
+    if stats and not report:
+        raise ValueError('stats requires report=True')
+    if openclose:
+        tk.ENopenH()
+    try:
+        tk.ENinitH(flag)
+        step = ENstep(nodevars, linkvars, nodes, links, dtype, tk)
+        if report:
+            rstart = tk.ENgettimeparam(EN_REPORTSTART)
+            # a zero reporting step reports the start and end times only
+            rstep = tk.ENgettimeparam(EN_REPORTSTEP) or tk.ENgettimeparam(EN_DURATION) or 1
+        if stats:
+            step.nodestats = ENstats(step.nodes)
+            step.linkstats = ENstats(step.links)
+            allstats = (step.nodestats, step.linkstats)
+        first = True
+        while True:
+            warning = tk.ENrunH()
+            t = clock.value
+            reported = not report or (t >= rstart and (t - rstart) % rstep == 0)
+            if reported or stats:
+                step.warning = warning
+                step.time = t
+                step.fetch()
+            if stats:
+                for st in allstats:
+                    if first: st.reset()
+                    else: st.update()
+                first = False
+            if reported:
+                if stats:
+                    for st in allstats: st.finish()
+                yield t, step
+                if stats:
+                    for st in allstats: st.reset()
+            dt = tk.ENnextH()
+            if stats:
+                for st in allstats: st.accumulate(dt)
+            if dt <= 0:
+                break
+    finally:
+        if openclose:
+            tk.ENcloseH()
+
+class ENstep(object):
+    # Reusable result buffers for one simulation time step.
+    #
+    # Attributes:
+    #  time:      simulation time (seconds) of the values held
+    #  warning:   warning message returned by ENrunH at that time, or None
+    #  nodes:     dict node parameter code -> array over nodeindices
+    #  links:     dict link parameter code -> array over linkindices
+    #  nodestats, linkstats: ENstats of the reporting interval, or None
+    #  nodeindices, linkindices: element indices (None means all elements)
+    # toolkit is the ENproject the values are read from (default: this module).
+    def __init__(self, nodevars=(), linkvars=(), nodes=None, links=None, dtype=np.float32,
+                 toolkit=None):
+        tk = self._tk = toolkit or _module
+        self.time = 0
+        self.warning = None
+        self.nodestats = None
+        self.linkstats = None
+        self.nodeindices = None if nodes is None else np.asarray(nodes, dtype=np.intc)
+        self.linkindices = None if links is None else np.asarray(links, dtype=np.intc)
+        nnodes = tk.ENgetcount(EN_NODECOUNT) if nodes is None else len(self.nodeindices)
+        nlinks = tk.ENgetcount(EN_LINKCOUNT) if links is None else len(self.linkindices)
+        self.nodes = dict((code, np.zeros(nnodes, dtype=dtype)) for code in nodevars)
+        self.links = dict((code, np.zeros(nlinks, dtype=dtype)) for code in linkvars)
+
+    def fetch(self):
+        # Refills every buffer with the toolkit's current values.
+        for code, buf in self.nodes.items():
+            self._tk.ENgetnodevalues(code, self.nodeindices, out=buf)
+        for code, buf in self.links.items():
+            self._tk.ENgetlinkvalues(code, self.linkindices, out=buf)
+
+class ENstats(object):
+    # Running statistics of a dict of result buffers over one reporting
+    # interval, as kept by ENiterH(..., report=True, stats=True).
+    #
+    # Attributes (dicts parameter code -> array, like ENstep.nodes/links):
+    #  min, max:  extremes over every event from the previous reporting time
+    #             (or the start of the simulation) up to the current one
+    #  mean:      time-weighted mean over the same interval, each event's
+    #             values holding until the next event; at the first reporting
+    #             time of a run it equals the current values
+    def __init__(self, values):
+        self.values = values
+        self.min = dict((code, buf.copy()) for code, buf in values.items())
+        self.max = dict((code, buf.copy()) for code, buf in values.items())
+        self.mean = dict((code, buf.copy()) for code, buf in values.items())
+        self._sum = dict((code, np.zeros(buf.shape)) for code, buf in values.items())
+        self._duration = 0
+
+    def reset(self):
+        # Starts a new interval at the current values.
+        for code, buf in self.values.items():
+            self.min[code][:] = buf
+            self.max[code][:] = buf
+            self._sum[code][:] = 0
+        self._duration = 0
+
+    def update(self):
+        # Folds the current values into the extremes.
+        for code, buf in self.values.items():
+            np.minimum(self.min[code], buf, out=self.min[code])
+            np.maximum(self.max[code], buf, out=self.max[code])
+
+    def accumulate(self, dt):
+        # Weights the current values by the dt seconds they hold for.
+        if dt > 0:
+            for code, buf in self.values.items():
+                self._sum[code] += buf*dt
+            self._duration += dt
+
+    def finish(self):
+        # Computes the means of the interval ending at the current event.
+        for code, buf in self.values.items():
+            if self._duration > 0:
+                self.mean[code][:] = self._sum[code]/self._duration
+            else:
+                self.mean[code][:] = buf
+
 # ============================================================================================================
 # Running a quality analysis
 # ============================================================================================================
@@ -717,6 +1273,7 @@ def ENsolveQ():
 def ENopenQ():
     # Description: Opens the water quality analysis system
     errcode= _lib.ENopenQ()
+    if errcode!=0: raise ENtoolkitError(errcode)
 
 def ENinitQ(flag=None):
     # Description: Initializes water quality and the simulation clock time prior to running a water quality analysis.
@@ -740,10 +1297,113 @@ def ENnextQ():
     if errcode!=0: raise ENtoolkitError(errcode)
     return _deltat.value
 
+def ENstepQ():
+    # Description: Advances the water quality simulation one water quality time step.
+    # Returns: time (seconds) remaining in the overall simulation, 0 at its end.
+    _tleft= ctypes.c_long()
+    errcode= _lib.ENstepQ(ctypes.byref(_tleft))
+    if errcode!=0: raise ENtoolkitError(errcode)
+    return _tleft.value
+
 def ENcloseQ():
     # Description: Closes the water quality analysis system, freeing all allocated memory.
     errcode= _lib.ENcloseQ()
     if errcode!=0: raise ENtoolkitError(errcode)
+
+def ENgetqualtype():
+    # Description: Retrieves the type of water quality analysis called for.
+    # Returns: (qualcode, tracenode): EN_NONE, EN_CHEM, EN_AGE or EN_TRACE, and the
+    #          index of the node traced in a source tracing analysis
+    qualcode= ctypes.c_int()
+    tracenode= ctypes.c_int()
+    errcode= _lib.ENgetqualtype(ctypes.byref(qualcode), ctypes.byref(tracenode))
+    if errcode!=0: raise ENtoolkitError(errcode)
+    return qualcode.value, tracenode.value
+
+def ENsetqualtype(qualcode, chemname='', chemunits='', tracenode=''):
+    # Description: Sets the type of water quality analysis called for.
+    # Arguments:
+    #     qualcode:  EN_NONE, EN_CHEM, EN_AGE or EN_TRACE
+    #     chemname:  name of the chemical being analyzed (EN_CHEM)
+    #     chemunits: units the chemical is measured in (EN_CHEM)
+    #     tracenode: ID of the node traced in a source tracing analysis (EN_TRACE)
+    errcode= _lib.ENsetqualtype(ctypes.c_int(qualcode), ctypes.c_char_p(_cstr(chemname)),
+                                ctypes.c_char_p(_cstr(chemunits)), ctypes.c_char_p(_cstr(tracenode)))
+    if errcode!=0: raise ENtoolkitError(errcode)
+
+def ENiterQ(nodevars=(), linkvars=(), nodes=None, links=None, dtype=np.float32, flag=0,
+            qualsteps=False, report=False, solveH=True, openclose=True):
+    # Description:
+    #  Generator running a water quality analysis, yielding the results of
+    #  every hydraulic period or, with qualsteps=True, every water quality step.
+    # Arguments:
+    #  nodevars:  node parameter codes to retrieve (e.g. EN_QUALITY, EN_SOURCEMASS)
+    #  linkvars:  link parameter codes to retrieve (e.g. EN_LINKQUAL, EN_FLOW)
+    #  nodes:     node indices to retrieve (default: all nodes)
+    #  links:     link indices to retrieve (default: all links)
+    #  dtype:     dtype of the result buffers
+    #  flag:      saveflag passed to ENinitQ (EN_NOSAVE or EN_SAVE)
+    #  qualsteps: advance with ENstepQ (every EN_QUALSTEP) instead of ENnextQ
+    #             (every hydraulic period)
+    #  report:    if True, only retrieve and yield results at reporting times
+    #             (EN_REPORTSTART + k*EN_REPORTSTEP)
+    #  solveH:    run ENsolveH first; if False the hydraulics must already have
+    #             been solved (or ENusehydfile called)
+    #  openclose: if False, the quality system must already be open (ENopenQ)
+    #             and is left open afterwards
+    # Yields:
+    #  (t, step) as ENiterH: t the simulation time in seconds, step an ENstep
+    #  whose arrays are refilled at every step.
+    # Notes:
+    #  Results are retrieved with ENgetnodevalues/ENgetlinkvalues into the
+    #  step's preallocated buffers. With qualsteps=True and report=True the
+    #  quality steps between two reporting times are stepped over without
+    #  retrieving anything. ENcloseQ is always called when the generator
+    #  finishes, is closed or raises.
+    # Example:
+    #  ENsetqualtype(EN_AGE)
+    #  for t, step in ENiterQ((EN_QUALITY,), qualsteps=True, report=True):
+    #      age[t // rstep] = step.nodes[EN_QUALITY]
+    return _iterQ(_module, _current_simulation_time, nodevars, linkvars, nodes, links, dtype,
+                  flag, qualsteps, report, solveH, openclose)
+
+def _iterQ(tk, clock, nodevars, linkvars, nodes, links, dtype, flag, qualsteps, report, solveH, openclose):
+    # Body of ENiterQ for a toolkit tk (this module or an ENproject); clock
+    # is the c_long its ENrunQ writes the simulation time into.
+    if solveH:
+        tk.ENsolveH()
+    if openclose:
+        tk.ENopenQ()
+    try:
+        tk.ENinitQ(flag)
+        step = ENstep(nodevars, linkvars, nodes, links, dtype, tk)
+        if report:
+            rstart = tk.ENgettimeparam(EN_REPORTSTART)
+            # a zero reporting step reports the start and end times only
+            rstep = tk.ENgettimeparam(EN_REPORTSTEP) or tk.ENgettimeparam(EN_DURATION) or 1
+        advance = tk.ENstepQ if qualsteps else tk.ENnextQ
+        while True:
+            warning = tk.ENrunQ()
+            t = clock.value
+            if not report or (t >= rstart and (t - rstart) % rstep == 0):
+                step.warning = warning
+                step.time = t
+                step.fetch()
+                yield t, step
+            if advance() <= 0:
+                break
+        if qualsteps:
+            # The last ENstepQ reaches the end of the simulation without an
+            # ENrunQ reporting it: its state is retrieved as it stands.
+            t_end = tk.ENgettimeparam(EN_DURATION)
+            if t_end > t and (not report or (t_end >= rstart and (t_end - rstart) % rstep == 0)):
+                step.warning = None
+                step.time = t_end
+                step.fetch()
+                yield t_end, step
+    finally:
+        if openclose:
+            tk.ENcloseQ()
     
 # ============================================================================================================
 
@@ -753,9 +1413,26 @@ def ENsaveH():
     errcode= _lib.ENsaveH()
     if errcode!=0: raise ENtoolkitError(errcode)
 
+def ENsavehydfile(fname):
+    # Description: Saves the current contents of the binary Hydraulics file to a file.
+    # Notes: The hydraulics must have been solved (ENsolveH, or ENinitH with EN_SAVE).
+    errcode= _lib.ENsavehydfile(ctypes.c_char_p(_cstr(fname)))
+    if errcode!=0: raise ENtoolkitError(errcode)
+
+def ENusehydfile(fname):
+    # Description: Uses the contents of a previously saved binary Hydraulics file
+    # as the hydraulics of the open network.
+    # Notes: The file must have been saved for the same network and hydraulic
+    # inputs; it replaces a call to ENsolveH before a water quality analysis.
+    # Hydraulics can no longer be computed until the network is reopened.
+    global _hydfile_used
+    errcode= _lib.ENusehydfile(ctypes.c_char_p(_cstr(fname)))
+    if errcode!=0: raise ENtoolkitError(errcode)
+    _hydfile_used = True
+
 def ENsaveinpfile(fname):
     # Description: Writes all current network input data to a file using the format of an EPANET input file.
-    errcode= _lib.ENsaveinpfile( ctypes.c_char_p(fname))
+    errcode= _lib.ENsaveinpfile( ctypes.c_char_p(_cstr(fname)))
     if errcode!=0: raise ENtoolkitError(errcode)
 
 def ENreport():
@@ -767,18 +1444,630 @@ def ENgeterror(errcode):
     # Description: Retrieves the text of the message associated with a particular error or warning code.
     errmsg= ctypes.create_string_buffer(_err_max_char)
     _lib.ENgeterror( errcode,ctypes.byref(errmsg), _err_max_char )
-    return errmsg.value
+    return _pystr(errmsg.value)
 
 class ENtoolkitError(Exception):
-    def __init__(self, ierr):
+    def __init__(self, ierr, message=None):
       self.warning= ierr < 100
       self.args= (ierr,)
-      self.message= ENgeterror(ierr)
+      self.message= ENgeterror(ierr) if message is None else message
       if self.message=='' and ierr!=0:
          self.message='ENtoolkit Undocumented Error '+str(ierr)+': look at text.h in epanet sources'
     def __str__(self):
       return self.message
+    def __reduce__(self):
+      return (self.__class__, (self.args[0], self.message))
+
+class ENbulkError(ENtoolkitError):
+    # Raised by the bulk setters once every element has been attempted.
+    # failures holds one (index, errcode) pair per element that was rejected,
+    # messages the matching error texts.
+    def __init__(self, failures, messages=None):
+      if messages is None:
+         messages= [ENgeterror(ierr) for index, ierr in failures]
+      self.failures= failures
+      self.messages= messages
+      ENtoolkitError.__init__(self, failures[0][1], '%d value(s) could not be set: %s' % (len(failures),
+                    '; '.join('index %d: %s' % (index, text) for (index, ierr), text in zip(failures, messages))))
+      self.warning= all(ierr < 100 for index, ierr in failures)
+    def __reduce__(self):
+      return (ENbulkError, (self.failures, self.messages))
       
+# ============================================================================================================
+# Independent toolkit instances
+# ============================================================================================================
+
+# Legacy (2.0) libraries in use by an open ENproject, by library handle: their
+# single set of globals can hold one network at a time
+_legacy_owners= {}
+_legacy_lock= threading.Lock()
+
+class ENproject(object):
+    # Toolkit instance with its own library handle and simulation state.
+    #
+    # Methods are named, take the same arguments and return the same values as
+    # the module-level EN functions (ENopen, ENgetnodevalues, ENiterH, ...), so
+    # code written against this module runs unchanged against a project:
+    #
+    #     with ENproject() as p:
+    #         p.ENopen('net.inp', 'net.rpt', '')
+    #         for t, step in p.ENiterH((EN_PRESSURE,)):
+    #             ...
+    #
+    # With EPANET 2.2 or later the project is created with EN_createproject and
+    # every call goes through its handle, so several projects can be open and
+    # simulated at the same time, each from its own thread. Values are then
+    # exchanged with the toolkit in double precision.
+    #
+    # The 2.0 toolkit keeps one network in library globals. A project on such a
+    # library can only be opened while no other project holds it; private=True
+    # loads a copy of the library file, which gets globals of its own.
+    #
+    # Arguments:
+    #     libpath: toolkit library to load (found like ENloadlibrary when omitted)
+    #     private: load a private copy of the library file (2.0 toolkits)
+    #
+    # The concurrent attribute tells whether the project can run alongside
+    # other projects on the same library (project handle or private copy).
+    #
+    # Toolkit calls are made through ctypes.CDLL, which releases the GIL for
+    # the duration of every call: a long ENsolveH or ENrunH in one thread
+    # does not stop other threads from running Python code or their own
+    # projects' simulations.
+    def __init__(self, libpath=None, private=False):
+        path = _find_library(libpath)
+        self._tempdir = None
+        if private:
+            if not os.path.isfile(path):
+                raise OSError('private=True needs the path of the library file, not %s' % path)
+            self._tempdir = tempfile.mkdtemp(prefix='epanet')
+            path = shutil.copy(path, self._tempdir)
+        self._lib = ctypes.CDLL(path)
+        if self._tempdir is not None and os.name == 'posix':
+            # the loaded image stays mapped; nothing else can reach the copy
+            shutil.rmtree(self._tempdir, ignore_errors=True)
+            self._tempdir = None
+        self._ph = None
+        self._opened = False
+        self._topology = None
+        self._hydfile_used = False
+        self._t = ctypes.c_long()
+        if hasattr(self._lib, 'EN_createproject'):
+            ph = ctypes.c_void_p()
+            self._check(self._lib.EN_createproject(ctypes.byref(ph)))
+            self._ph = ph
+            self._real = ctypes.c_double
+            prototype = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_double)
+            self._nodesetter = functools.partial(prototype(('EN_setnodevalue', self._lib)), ph)
+            self._linksetter = functools.partial(prototype(('EN_setlinkvalue', self._lib)), ph)
+        else:
+            self._real = ctypes.c_float
+            self._nodesetter = _setter(self._lib, 'ENsetnodevalue')
+            self._linksetter = _setter(self._lib, 'ENsetlinkvalue')
+        self._nodegetter = self._function('getnodevalue')
+        self._linkgetter = self._function('getlinkvalue')
+        self._nodebulkgetter = self._function('getnodevalues') if hasattr(self._lib, 'EN_getnodevalues') else None
+        self._linkbulkgetter = self._function('getlinkvalues') if hasattr(self._lib, 'EN_getlinkvalues') else None
+        self._plans = {}
+        self.concurrent = bool(private) or self._ph is not None
+
+    def _function(self, name):
+        # Toolkit function name ('getnodevalue', ...) of this project, bound to
+        # its handle when the library has one.
+        if self._ph is None:
+            return getattr(self._lib, 'EN' + name)
+        return functools.partial(getattr(self._lib, 'EN_' + name), self._ph)
+
+    def _call(self, name, *args):
+        if self._ph is None:
+            return getattr(self._lib, 'EN' + name)(*args)
+        return getattr(self._lib, 'EN_' + name)(self._ph, *args)
+
+    def _error(self, errcode):
+        return ENtoolkitError(errcode, self.ENgeterror(errcode))
+
+    def _check(self, errcode):
+        if errcode!=0: raise self._error(errcode)
+
+    # ---- Open/Close ----------------------------------------------------------------------------------------
+    def ENopen(self, inpname, repname='report.txt', binname='', topology=False):
+        # Description: Opens a network in this project (see ENopen).
+        # Returns: dictionary of network size (number of nodes, links and tanks)
+        if self._opened:
+            raise RuntimeError('the project already has an open network')
+        if self._ph is None:
+            with _legacy_lock:
+                owner = _legacy_owners.get(self._lib._handle)
+                if owner is not None:
+                    raise RuntimeError('this EPANET 2.0 library already holds an open network: '
+                                       'use ENproject(private=True) or EPANET 2.2+')
+                _legacy_owners[self._lib._handle] = self
+        self._topology = None
+        self._hydfile_used = False
+        try:
+            self._check(self._call('open', ctypes.c_char_p(_cstr(inpname)), ctypes.c_char_p(_cstr(repname)),
+                                   ctypes.c_char_p(_cstr(binname))))
+        except Exception:
+            self._release()
+            raise
+        self._opened = True
+        if topology:
+            self._topology = ENtopology(self)
+        return {'nodes':self.ENgetcount(EN_NODECOUNT), 'links':self.ENgetcount(EN_LINKCOUNT),
+                'tanks':self.ENgetcount(EN_TANKCOUNT)}
+
+    def _release(self):
+        if self._ph is None:
+            with _legacy_lock:
+                if _legacy_owners.get(self._lib._handle) is self:
+                    del _legacy_owners[self._lib._handle]
+
+    def ENclose(self):
+        # Description: Closes the network of this project (see ENclose).
+        self._topology = None
+        self._opened = False
+        self._hydfile_used = False
+        try:
+            self._check(self._call('close'))
+        finally:
+            self._release()
+
+    def ENdeleteproject(self):
+        # Description: Closes any open network and frees the project.
+        # Notes: The project cannot be used afterwards.
+        try:
+            if self._opened:
+                self.ENclose()
+        finally:
+            if self._ph is not None and self._ph.value:
+                self._lib.EN_deleteproject(self._ph)
+                self._ph.value = None
+            if self._tempdir is not None:
+                shutil.rmtree(self._tempdir, ignore_errors=True)
+                self._tempdir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.ENdeleteproject()
+
+    def ENgettopology(self):
+        # Description: Retrieves the ENtopology built by ENopen(..., topology=True), or None.
+        return self._topology
+
+    # ---- Nodes ---------------------------------------------------------------------------------------------
+    def ENgetnodeindex(self, nodeid):
+        if self._topology is not None and _pystr(nodeid) in self._topology.node_index:
+            return self._topology.node_index[_pystr(nodeid)]
+        j= ctypes.c_int()
+        self._check(self._call('getnodeindex', ctypes.c_char_p(_cstr(nodeid)), ctypes.byref(j)))
+        return j.value
+
+    def ENgetnodeid(self, index):
+        if self._topology is not None and 0 < index <= len(self._topology.node_ids):
+            return self._topology.node_ids[index-1]
+        label = ctypes.create_string_buffer(_max_label_len)
+        self._check(self._call('getnodeid', index, ctypes.byref(label)))
+        return _pystr(label.value)
+
+    def ENgetnodetype(self, index):
+        if self._topology is not None and 0 < index <= len(self._topology.node_ids):
+            return _node_type_names[self._topology.node_types[index-1]]
+        j= ctypes.c_int()
+        self._check(self._call('getnodetype', index, ctypes.byref(j)))
+        return _node_type_names[j.value]
+
+    def ENgetnodevalue(self, index, paramcode):
+        j= self._real()
+        self._check(self._call('getnodevalue', index, paramcode, ctypes.byref(j)))
+        return j.value
+
+    def ENgetnodevalues(self, paramcode, indices=None, out=None, dtype=np.float32):
+        return _getvalues(self._nodegetter, self._nodebulkgetter, _count(EN_NODECOUNT, self._topology, self.ENgetcount), 203,
+                          paramcode, indices, out, dtype, self._real, self._error, self._plans)
+
+    def ENsetnodevalue(self, index, paramcode, value):
+        self._check(self._call('setnodevalue', ctypes.c_int(index), ctypes.c_int(paramcode), self._real(value)))
+
+    def ENsetnodevalues(self, paramcode, indices, values):
+        _setvalues(self._nodesetter, paramcode, indices, values, self.ENgeterror)
+
+    # ---- Links ---------------------------------------------------------------------------------------------
+    def ENgetlinkindex(self, linkid):
+        if self._topology is not None and _pystr(linkid) in self._topology.link_index:
+            return self._topology.link_index[_pystr(linkid)]
+        j= ctypes.c_int()
+        self._check(self._call('getlinkindex', ctypes.c_char_p(_cstr(linkid)), ctypes.byref(j)))
+        return j.value
+
+    def ENgetlinkid(self, index):
+        if self._topology is not None and 0 < index <= len(self._topology.link_ids):
+            return self._topology.link_ids[index-1]
+        label = ctypes.create_string_buffer(_max_label_len)
+        self._check(self._call('getlinkid', index, ctypes.byref(label)))
+        return _pystr(label.value)
+
+    def ENgetlinktype(self, index):
+        if self._topology is not None and 0 < index <= len(self._topology.link_ids):
+            return _link_type_names[self._topology.link_types[index-1]]
+        j= ctypes.c_int()
+        self._check(self._call('getlinktype', index, ctypes.byref(j)))
+        return _link_type_names[j.value]
+
+    def ENgetlinknodes(self, index):
+        if self._topology is not None and 0 < index <= len(self._topology.link_ids):
+            return tuple(self._topology.link_nodes[index-1].tolist())
+        j1= ctypes.c_int()
+        j2= ctypes.c_int()
+        self._check(self._call('getlinknodes', index, ctypes.byref(j1), ctypes.byref(j2)))
+        return j1.value, j2.value
+
+    def ENgetlinkvalue(self, index, paramcode):
+        j= self._real()
+        self._check(self._call('getlinkvalue', index, paramcode, ctypes.byref(j)))
+        return j.value
+
+    def ENgetlinkvalues(self, paramcode, indices=None, out=None, dtype=np.float32):
+        return _getvalues(self._linkgetter, self._linkbulkgetter, _count(EN_LINKCOUNT, self._topology, self.ENgetcount), 204,
+                          paramcode, indices, out, dtype, self._real, self._error, self._plans)
+
+    def ENsetlinkvalue(self, index, paramcode, value):
+        self._check(self._call('setlinkvalue', ctypes.c_int(index), ctypes.c_int(paramcode), self._real(value)))
+
+    def ENsetlinkvalues(self, paramcode, indices, values):
+        _setvalues(self._linksetter, paramcode, indices, values, self.ENgeterror)
+
+    # ---- Patterns and controls -----------------------------------------------------------------------------
+    def ENgetpatternid(self, index):
+        label = ctypes.create_string_buffer(_max_label_len)
+        self._check(self._call('getpatternid', index, ctypes.byref(label)))
+        return _pystr(label.value)
+
+    def ENgetpatternindex(self, patternid):
+        j= ctypes.c_int()
+        self._check(self._call('getpatternindex', ctypes.c_char_p(_cstr(patternid)), ctypes.byref(j)))
+        return j.value
+
+    def ENgetpatternlen(self, index):
+        j= ctypes.c_int()
+        self._check(self._call('getpatternlen', index, ctypes.byref(j)))
+        return j.value
+
+    def ENgetpatternvalue(self, index, period):
+        j= self._real()
+        self._check(self._call('getpatternvalue', index, period, ctypes.byref(j)))
+        return j.value
+
+    def ENaddpattern(self, patternid):
+        self._check(self._call('addpattern', ctypes.c_char_p(_cstr(patternid))))
+
+    def ENgetpattern(self, index, out=None, dtype=np.float32):
+        index = int(index)
+        return _getpattern(self._function('getpatternvalue'), self.ENgetpatternlen(index), index, out, dtype,
+                           self._real, self._error)
+
+    def ENsetpattern(self, index, factors):
+        cfactors= np.ascontiguousarray(factors, dtype=self._real)
+        self._check(self._call('setpattern', ctypes.c_int(index), cfactors.ctypes.data_as(ctypes.POINTER(self._real)),
+                               ctypes.c_int(len(cfactors))))
+
+    def ENsetpatterns(self, patternids, factors, nodes=None):
+        return _setpatterns(self, patternids, factors, nodes)
+
+    def ENsetpatternvalue(self, index, period, value):
+        self._check(self._call('setpatternvalue', ctypes.c_int(index), ctypes.c_int(period), self._real(value)))
+
+    def ENgetcontrol(self, cindex):
+        ctype = ctypes.c_int()
+        lindex = ctypes.c_int()
+        setting = self._real()
+        nindex = ctypes.c_int()
+        level = self._real()
+        self._check(self._call('getcontrol', cindex, ctypes.byref(ctype), ctypes.byref(lindex),
+                               ctypes.byref(setting), ctypes.byref(nindex), ctypes.byref(level)))
+        return [ctype.value, lindex.value, setting.value, nindex.value, level.value]
+
+    def ENsetcontrol(self, cindex, ctype, lindex, setting, nindex, level):
+        self._check(self._call('setcontrol', ctypes.c_int(cindex), ctypes.c_int(ctype), ctypes.c_int(lindex),
+                               self._real(setting), ctypes.c_int(nindex), self._real(level)))
+
+    # ---- Network information and options -------------------------------------------------------------------
+    def ENgetcount(self, countcode):
+        j= ctypes.c_int()
+        self._check(self._call('getcount', countcode, ctypes.byref(j)))
+        return j.value
+
+    def ENgetflowunits(self):
+        j= ctypes.c_int()
+        self._check(self._call('getflowunits', ctypes.byref(j)))
+        return j.value
+
+    def ENgettimeparam(self, paramcode):
+        j= ctypes.c_long()
+        self._check(self._call('gettimeparam', paramcode, ctypes.byref(j)))
+        return j.value
+
+    def ENgetoption(self, optioncode):
+        j= self._real()
+        self._check(self._call('getoption', optioncode, ctypes.byref(j)))
+        return j.value
+
+    def ENgetversion(self):
+        j= ctypes.c_int()
+        self._check(self._lib.ENgetversion(ctypes.byref(j)))
+        return j.value
+
+    def ENsettimeparam(self, paramcode, timevalue):
+        self._check(self._call('settimeparam', ctypes.c_int(paramcode), ctypes.c_long(timevalue)))
+
+    def ENsetoption(self, optioncode, value):
+        self._check(self._call('setoption', ctypes.c_int(optioncode), self._real(value)))
+
+    # ---- Hydraulic analysis --------------------------------------------------------------------------------
+    def ENsolveH(self):
+        if self._hydfile_used: raise self._error(107)
+        self._check(self._call('solveH'))
+
+    def ENopenH(self):
+        if self._hydfile_used: raise self._error(107)
+        self._check(self._call('openH'))
+
+    def ENinitH(self, flag=None):
+        self._check(self._call('initH', flag))
+
+    def ENrunH(self):
+        errcode= self._call('runH', ctypes.byref(self._t))
+        if errcode>=100:
+            raise self._error(errcode)
+        elif errcode>0:
+            return self.ENgeterror(errcode)
+
+    def ENsimtime(self):
+        return datetime.timedelta(seconds= self._t.value)
+
+    def ENnextH(self):
+        deltat= ctypes.c_long()
+        self._check(self._call('nextH', ctypes.byref(deltat)))
+        return deltat.value
+
+    def ENcloseH(self):
+        self._check(self._call('closeH'))
+
+    def ENiterH(self, nodevars=(), linkvars=(), nodes=None, links=None, dtype=np.float32, flag=0,
+                report=False, stats=False, openclose=True):
+        # Description: Generator running an extended period hydraulic analysis (see ENiterH).
+        return _iterH(self, self._t, nodevars, linkvars, nodes, links, dtype, flag, report, stats, openclose)
+
+    # ---- Quality analysis ----------------------------------------------------------------------------------
+    def ENsolveQ(self):
+        self._check(self._call('solveQ'))
+
+    def ENopenQ(self):
+        self._check(self._call('openQ'))
+
+    def ENinitQ(self, flag=None):
+        self._check(self._call('initQ', flag))
+
+    def ENrunQ(self):
+        errcode= self._call('runQ', ctypes.byref(self._t))
+        if errcode>=100:
+            raise self._error(errcode)
+        elif errcode>0:
+            return self.ENgeterror(errcode)
+
+    def ENnextQ(self):
+        deltat= ctypes.c_long()
+        self._check(self._call('nextQ', ctypes.byref(deltat)))
+        return deltat.value
+
+    def ENstepQ(self):
+        tleft= ctypes.c_long()
+        self._check(self._call('stepQ', ctypes.byref(tleft)))
+        return tleft.value
+
+    def ENcloseQ(self):
+        self._check(self._call('closeQ'))
+
+    def ENgetqualtype(self):
+        qualcode= ctypes.c_int()
+        tracenode= ctypes.c_int()
+        self._check(self._call('getqualtype', ctypes.byref(qualcode), ctypes.byref(tracenode)))
+        return qualcode.value, tracenode.value
+
+    def ENsetqualtype(self, qualcode, chemname='', chemunits='', tracenode=''):
+        self._check(self._call('setqualtype', ctypes.c_int(qualcode), ctypes.c_char_p(_cstr(chemname)),
+                               ctypes.c_char_p(_cstr(chemunits)), ctypes.c_char_p(_cstr(tracenode))))
+
+    def ENiterQ(self, nodevars=(), linkvars=(), nodes=None, links=None, dtype=np.float32, flag=0,
+                qualsteps=False, report=False, solveH=True, openclose=True):
+        # Description: Generator running a water quality analysis (see ENiterQ).
+        return _iterQ(self, self._t, nodevars, linkvars, nodes, links, dtype, flag, qualsteps, report,
+                      solveH, openclose)
+
+    # ---- Output --------------------------------------------------------------------------------------------
+    def ENsaveH(self):
+        self._check(self._call('saveH'))
+
+    def ENsavehydfile(self, fname):
+        self._check(self._call('savehydfile', ctypes.c_char_p(_cstr(fname))))
+
+    def ENusehydfile(self, fname):
+        self._check(self._call('usehydfile', ctypes.c_char_p(_cstr(fname))))
+        self._hydfile_used = True
+
+    def ENsaveinpfile(self, fname):
+        self._check(self._call('saveinpfile', ctypes.c_char_p(_cstr(fname))))
+
+    def ENreport(self):
+        self._check(self._call('report'))
+
+    def ENgeterror(self, errcode):
+        errmsg= ctypes.create_string_buffer(_err_max_char)
+        self._lib.ENgeterror(errcode, ctypes.byref(errmsg), _err_max_char)
+        return _pystr(errmsg.value)
+
+# ============================================================================================================
+# Profiling
+# ============================================================================================================
+
+# Wall clock used for profiling
+_clock= getattr(time, 'perf_counter', time.time)
+
+# Module functions left alone while profiling
+_unprofiled= ('ENloadlibrary',)
+
+# Toolkit (this module or an ENproject) being profiled -> its ENprofiling
+_profiled= {}
+
+# Toolkit functions bound when the library is loaded, called without going
+# through _lib: attribute -> library function name (without its EN/EN_ prefix)
+_bound= (('_nodegetter', 'getnodevalue'), ('_linkgetter', 'getlinkvalue'),
+         ('_nodebulkgetter', 'getnodevalues'), ('_linkbulkgetter', 'getlinkvalues'),
+         ('_nodesetter', 'setnodevalue'), ('_linksetter', 'setlinkvalue'))
+
+class ENprofile(object):
+    # Call counts and wall time per function, collected by ENprofiling.
+    #
+    # stats maps (layer, name) to [calls, seconds] where layer is 'python'
+    # for the EN functions of this module (or ENproject methods) and 'dll'
+    # for the toolkit library functions they call. Times are inclusive: the
+    # time of ENgetnodevalues includes its calls to ENgetcount and to the DLL,
+    # so python time minus the DLL time it triggers is the ctypes and Python
+    # overhead.
+    def __init__(self):
+        self.stats = {}
+
+    def _timed(self, layer, name, func):
+        record = self.stats.setdefault((layer, name), [0, 0.0])
+        clock = _clock
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record[0] += 1
+                record[1] += clock() - start
+        timed.__name__ = name
+        timed.__doc__ = getattr(func, '__doc__', None)
+        return timed
+
+    def records(self):
+        # Description: Statistics as a list of dicts (e.g. for pandas.DataFrame).
+        # Returns: one dict per function with keys layer, function, calls, seconds
+        #          and mean (seconds per call), by decreasing total time
+        rows = [{'layer': layer, 'function': name, 'calls': calls, 'seconds': seconds,
+                 'mean': seconds/calls if calls else 0.0}
+                for (layer, name), (calls, seconds) in self.stats.items() if calls]
+        rows.sort(key=lambda row: -row['seconds'])
+        return rows
+
+    def reset(self):
+        # Description: Sets every count and time back to zero.
+        for record in self.stats.values():
+            record[0] = 0
+            record[1] = 0.0
+
+    def report(self):
+        # Description: Statistics as a text table.
+        lines = ['%-6s %-24s %10s %12s %12s' % ('layer', 'function', 'calls', 'seconds', 'us/call')]
+        for row in self.records():
+            lines.append('%-6s %-24s %10d %12.6f %12.3f' % (row['layer'], row['function'], row['calls'],
+                                                            row['seconds'], 1e6*row['mean']))
+        return '\n'.join(lines)
+
+class _timedlibrary(object):
+    # Stands in for a toolkit library while profiling: every function fetched
+    # from it is timed under the 'dll' layer.
+    def __init__(self, lib, profile):
+        self._lib = lib
+        self._profile = profile
+        self._handle = getattr(lib, '_handle', None)
+
+    def __getattr__(self, name):
+        func = getattr(self._lib, name)
+        timed = self._profile._timed('dll', name, func)
+        self.__dict__[name] = timed
+        return timed
+
+class ENprofiling(object):
+    # Context manager timing every EN function and toolkit library call.
+    #
+    # While active, the EN functions of this module (or the methods of an
+    # ENproject) and the library they call through are replaced by timed
+    # versions; they are put back on exit, so nothing is added to the calls
+    # made when profiling is off.
+    #
+    # Example:
+    #     with ENprofiling() as profile:
+    #         for t, step in EN_Mod.ENiterH((EN_PRESSURE,)):
+    #             pass
+    #     print(profile.report())
+    #
+    # Arguments:
+    #     toolkit: ENproject to profile (default: this module)
+    #     profile: ENprofile to add to (default: a new one)
+    # Notes:
+    #     Names imported with "from EN_Mod import *" before profiling starts
+    #     still refer to the original functions: call them through the module
+    #     (EN_Mod.ENrunH) for those calls to be counted. The per-element
+    #     getters and setters bound at load time are counted in the dll layer
+    #     too. Generators (ENiterH, ENiterQ) are timed when created; the toolkit
+    #     functions they call are counted as usual.
+    def __init__(self, toolkit=None, profile=None):
+        self.toolkit = toolkit or _module
+        self.profile = profile or ENprofile()
+        self._saved = None
+
+    def start(self):
+        tk = self.toolkit
+        if tk in _profiled:
+            raise RuntimeError('this toolkit is already being profiled')
+        if tk is _module:
+            namespace = globals()
+            names = [name for name, value in namespace.items()
+                     if name.startswith('EN') and name not in _unprofiled and type(value) is type(ENopen)]
+            self._saved = dict((name, namespace[name]) for name in names + ['_lib'] + [a for a, f in _bound])
+            for name in names:
+                namespace[name] = self.profile._timed('python', name, namespace[name])
+            namespace['_lib'] = _timedlibrary(_lib, self.profile)
+            for attr, function in _bound:
+                if namespace[attr] is not None:
+                    namespace[attr] = self.profile._timed('dll', 'EN' + function, namespace[attr])
+        else:
+            names = [name for name in dir(type(tk)) if name.startswith('EN')]
+            self._saved = dict((name, getattr(tk, name)) for name in ['_lib'] + [a for a, f in _bound])
+            for name in names:
+                setattr(tk, name, self.profile._timed('python', name, getattr(tk, name)))
+            tk._lib = _timedlibrary(tk._lib, self.profile)
+            prefix = 'EN' if tk._ph is None else 'EN_'
+            for attr, function in _bound:
+                if getattr(tk, attr) is not None:
+                    setattr(tk, attr, self.profile._timed('dll', prefix + function, getattr(tk, attr)))
+        _profiled[tk] = self
+
+    def stop(self):
+        tk = self.toolkit
+        if _profiled.get(tk) is not self:
+            return
+        if tk is _module:
+            globals().update(self._saved)
+        else:
+            for name in dir(type(tk)):
+                if name.startswith('EN'):
+                    tk.__dict__.pop(name, None)
+            for name, value in self._saved.items():
+                setattr(tk, name, value)
+        self._saved = None
+        del _profiled[tk]
+
+    def __enter__(self):
+        self.start()
+        return self.profile
+
+    def __exit__(self, *exc):
+        self.stop()
+
 # ============================================================================================================
 # Parameter Glossary
 # ============================================================================================================
@@ -825,6 +2114,7 @@ EN_HEADLOSS      = 10
 EN_STATUS        = 11
 EN_SETTING       = 12
 EN_ENERGY        = 13
+EN_LINKQUAL      = 14
 
 # Time parameters
 EN_DURATION      = 0     
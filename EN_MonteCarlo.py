@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+# Monte Carlo analysis of demand uncertainty for EN_Mod: random base demands
+# and pattern multipliers are drawn with NumPy a batch at a time, run as
+# scenarios on one pool of workers (see EN_Scenario) and reduced as each run
+# finishes to per-node histograms, moments and threshold probabilities, so
+# that no realization is kept once it has been counted.
+import multiprocessing
+import multiprocessing.pool
+import numpy as np
+import EN_Mod
+from EN_Scenario import ENscenario, _initworker, _runworker, _threadworkers
+
+class ENdemandsampler(object):
+    # Random demand realizations around the base network.
+    #
+    # Each realization scales every junction's base demand and every factor
+    # of every pattern by independent random multipliers of mean 1, drawn
+    # from a lognormal distribution with the given coefficient of variation
+    # (cv), or from a normal one clipped at 0.
+    #
+    # Arguments:
+    #     junctions:    node indices whose EN_BASEDEMAND is drawn
+    #     basedemands:  their base demands
+    #     patterns:     dict pattern index -> base factors, drawn when patterncv > 0
+    #     demandcv:     coefficient of variation of the demand multipliers
+    #     patterncv:    coefficient of variation of the pattern factor multipliers
+    #     distribution: 'lognormal' or 'normal'
+    #     seed:         seed of the random generator, for reproducible runs
+    def __init__(self, junctions, basedemands, patterns=None, demandcv=0.1, patterncv=0.0,
+                 distribution='lognormal', seed=None):
+        if distribution not in ('lognormal', 'normal'):
+            raise ValueError("distribution must be 'lognormal' or 'normal'")
+        self.junctions = np.asarray(junctions, dtype=np.intc).reshape(-1)
+        self.basedemands = np.asarray(basedemands, dtype=np.float64).reshape(-1)
+        self.patterns = dict((k, np.asarray(v, dtype=np.float64)) for k, v in (patterns or {}).items())
+        self.demandcv = demandcv
+        self.patterncv = patterncv
+        self.distribution = distribution
+        self.random = np.random.RandomState(seed)
+
+    @classmethod
+    def fromtoolkit(cls, demandcv=0.1, patterncv=0.0, distribution='lognormal', seed=None, toolkit=None):
+        # Description:
+        #     Sampler around the network open in the toolkit: every junction,
+        #     and the patterns of the junctions' demands.
+        tk = toolkit or EN_Mod
+        junctions = (tk.ENgettopology() or EN_Mod.ENtopology(tk)).junctions
+        basedemands = tk.ENgetnodevalues(EN_Mod.EN_BASEDEMAND, junctions, dtype=np.float64)
+        used = np.unique(tk.ENgetnodevalues(EN_Mod.EN_PATTERN, junctions, dtype=np.float64)).astype(int)
+        patterns = dict((k, tk.ENgetpattern(k, dtype=np.float64)) for k in used.tolist() if k > 0)
+        return cls(junctions, basedemands, patterns, demandcv, patterncv, distribution, seed)
+
+    def _multipliers(self, cv, shape):
+        if cv <= 0:
+            return np.ones(shape)
+        if self.distribution == 'lognormal':
+            sigma2 = np.log1p(cv*cv)
+            return self.random.lognormal(-0.5*sigma2, np.sqrt(sigma2), shape)
+        return np.maximum(self.random.normal(1.0, cv, shape), 0.0)
+
+    def sample(self, size):
+        # Description: Draws a batch of realizations.
+        # Returns:
+        #     (demands, patterns): (size, njunctions) array of base demands and
+        #     dict pattern index -> (size, nfactors) array of pattern factors
+        demands = self.basedemands*self._multipliers(self.demandcv, (size, len(self.junctions)))
+        patterns = {}
+        if self.patterncv > 0:
+            for index, factors in self.patterns.items():
+                patterns[index] = factors*self._multipliers(self.patterncv, (size, len(factors)))
+        return demands, patterns
+
+    def scenarios(self, size, start=0):
+        # Description: Draws a batch of realizations as ENscenario objects named by run number.
+        demands, patterns = self.sample(size)
+        batch = []
+        for k in range(size):
+            s = ENscenario(start + k)
+            s.nodevalues[EN_Mod.EN_BASEDEMAND] = (self.junctions, demands[k])
+            for index, factors in patterns.items():
+                s.patterns[index] = factors[k]
+            batch.append(s)
+        return batch
+
+class ENmontecarlostats(object):
+    # Online reduction of one value per node and run.
+    #
+    # Values are counted in a fixed-bin histogram per node (plus an underflow
+    # and an overflow bin), in Welford running means and variances, running
+    # minima and maxima, and in exact counters for the thresholds given up
+    # front. Percentiles are interpolated within the histogram bins, so their
+    # resolution is the bin width.
+    #
+    # Arguments:
+    #     nnodes:     number of values per run
+    #     range:      (low, high) covered by the histogram bins
+    #     bins:       number of histogram bins
+    #     thresholds: values whose exceedance probabilities are counted exactly
+    #     below:      count runs with value < threshold (e.g. minimum pressure)
+    #                 rather than value > threshold
+    def __init__(self, nnodes, range, bins=200, thresholds=(), below=True):
+        self.low, self.high = float(range[0]), float(range[1])
+        if not self.high > self.low:
+            raise ValueError('range must be (low, high) with high > low')
+        self.bins = int(bins)
+        self.width = (self.high - self.low)/self.bins
+        self.counts = np.zeros((nnodes, self.bins + 2), dtype=np.int64)
+        self.count = 0
+        self.mean = np.zeros(nnodes)
+        self._m2 = np.zeros(nnodes)
+        self.min = np.full(nnodes, np.inf)
+        self.max = np.full(nnodes, -np.inf)
+        self.below = below
+        self.thresholds = dict((float(t), np.zeros(nnodes, dtype=np.int64)) for t in thresholds)
+        self._rows = np.arange(nnodes)
+
+    def add(self, values):
+        # Description: Counts the values of one run.
+        values = np.asarray(values, dtype=np.float64)
+        k = np.floor((values - self.low)/self.width) + 1
+        k = np.clip(np.nan_to_num(k), 0, self.bins + 1).astype(np.intp)
+        self.counts[self._rows, k] += 1
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta/self.count
+        self._m2 += delta*(values - self.mean)
+        np.minimum(self.min, values, out=self.min)
+        np.maximum(self.max, values, out=self.max)
+        for threshold, counts in self.thresholds.items():
+            counts += (values < threshold) if self.below else (values > threshold)
+
+    @property
+    def std(self):
+        # Sample standard deviation of each node's values
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return np.sqrt(self._m2/(self.count - 1))
+
+    def probability(self, threshold):
+        # Description: Fraction of runs beyond a threshold given to the constructor.
+        # Returns: array of probabilities per node
+        return self.thresholds[float(threshold)]/float(max(self.count, 1))
+
+    def percentile(self, q):
+        # Description: Percentile of each node's values, interpolated in the histogram.
+        # Arguments: q: percentile, between 0 and 100
+        # Returns: array of values per node (NaN before the first run)
+        if not self.count:
+            return np.full(len(self.mean), np.nan)
+        target = q/100.0*self.count
+        cum = np.cumsum(self.counts, axis=1)
+        k = np.argmax(cum >= max(target, 1e-9), axis=1)
+        before = np.where(k > 0, cum[self._rows, np.maximum(k-1, 0)], 0)
+        inside = self.counts[self._rows, k]
+        fraction = (target - before)/np.maximum(inside, 1)
+        values = self.low + (k - 1 + fraction)*self.width
+        values = np.where(k == 0, self.min, np.where(k == self.bins + 1, self.max, values))
+        return np.clip(values, self.min, self.max)
+
+# Reductions over time of a run's results, per node
+_statistics= {'min': np.min, 'max': np.max, 'mean': np.mean}
+
+def ENmontecarlo(inpname, sampler, runs, range, paramcode=EN_Mod.EN_PRESSURE, statistic='min',
+                 nodes=None, bins=200, thresholds=(), below=True, batch=1000, report=True,
+                 processes=None, threads=None, libpath=None):
+    # Description:
+    #     Runs demand realizations of a network and reduces a node result of
+    #     every run as it finishes.
+    # Arguments:
+    #     inpname:    name of the EPANET Input file
+    #     sampler:    ENdemandsampler drawing the realizations
+    #     runs:       number of realizations
+    #     range:      (low, high) of the histogram bins (see ENmontecarlostats)
+    #     paramcode:  node parameter reduced (default EN_PRESSURE)
+    #     statistic:  reduction over time of each run: 'min', 'max', 'mean' or
+    #                 a function f(values, axis=0) of the (ntimes, nnodes) results
+    #     nodes:      node indices reduced (default: all nodes)
+    #     bins, thresholds, below: see ENmontecarlostats
+    #     batch:      realizations drawn and run at a time
+    #     report:     reduce reporting times only (see ENiterH)
+    #     processes, threads, libpath: see ENiterscenarios
+    # Returns:
+    #     ENmontecarlostats over the runs
+    # Example:
+    #     ENopen('net.inp', 'net.rpt', '')
+    #     sampler = ENdemandsampler.fromtoolkit(demandcv=0.2, patterncv=0.1, seed=1)
+    #     ENclose()
+    #     stats = ENmontecarlo('net.inp', sampler, 5000, range=(0, 100), thresholds=(20,))
+    #     p95 = stats.percentile(5)           # minimum pressure exceeded in 95 % of runs
+    #     risk = stats.probability(20)        # probability of falling below 20 m
+    # Notes:
+    #     One pool runs every batch: its workers open the network once and
+    #     keep it open until the last run. Only one batch of scenarios exists
+    #     at a time, so batch bounds the memory held by the realizations.
+    reduce = _statistics[statistic] if statistic in _statistics else statistic
+    nnodes = None if nodes is None else len(np.asarray(nodes).reshape(-1))
+    options = ((paramcode,), (), nodes, None, report)
+    if threads is None:
+        workers = None
+        pool = multiprocessing.Pool(processes, _initworker, (inpname, options))
+        run = _runworker
+    else:
+        workers = _threadworkers(inpname, libpath, options)
+        pool = multiprocessing.pool.ThreadPool(threads)
+        run = workers.run
+    stats = None
+    done = 0
+    try:
+        while done < runs:
+            scenarios = sampler.scenarios(min(batch, runs - done), done)
+            for position, result in pool.imap_unordered(run, enumerate(scenarios)):
+                values = reduce(result.nodes[paramcode], axis=0)
+                if stats is None:
+                    stats = ENmontecarlostats(nnodes or len(values), range, bins, thresholds, below)
+                stats.add(values)
+            done += len(scenarios)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        if workers is not None:
+            workers.close()
+    return stats
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Reader for the binary Output file written by the EPANET toolkit (the binname
+# passed to ENopen). The file is memory-mapped and every table is exposed as a
+# read-only NumPy view, so nothing is read from disk until it is indexed.
+import mmap
+import struct
+import numpy as np
+
+# Magic number found at the start and at the end of a complete Output file
+_magic_number= 516114521
+
+# Fixed-size string fields of the prolog (bytes)
+_title_len= 80
+_fname_len= 260
+_id_len= 32
+
+# Node result variables, in the order they are stored for each period
+EN_OUT_DEMAND    = 0
+EN_OUT_HEAD      = 1
+EN_OUT_PRESSURE  = 2
+EN_OUT_QUALITY   = 3
+
+# Link result variables, in the order they are stored for each period
+EN_OUT_FLOW      = 0
+EN_OUT_VELOCITY  = 1
+EN_OUT_HEADLOSS  = 2
+EN_OUT_LINKQUAL  = 3
+EN_OUT_STATUS    = 4
+EN_OUT_SETTING   = 5
+EN_OUT_REACTION  = 6
+EN_OUT_FRICTION  = 7
+
+_n_node_vars= 4
+_n_link_vars= 8
+
+# One record of the energy usage section, per pump
+_energy_dtype= np.dtype([('link', '<i4'),          # pump link index
+                         ('utilization', '<f4'),   # percent of time online
+                         ('efficiency', '<f4'),    # average efficiency (percent)
+                         ('kwh_per_volume', '<f4'),# average kwatt-hours per unit volume
+                         ('avg_kw', '<f4'),        # average kwatts
+                         ('peak_kw', '<f4'),       # peak kwatts
+                         ('cost_per_day', '<f4')]) # average cost per day
+
+class ENoutput(object):
+    # Memory-mapped view of an EPANET binary Output file.
+    #
+    # Prolog attributes:
+    #     version, nnodes, ntanks, nlinks, npumps, nvalves, qualflag, traceflag,
+    #     flowunits, pressunits, statflag, reportstart, reportstep, duration,
+    #     title (3 lines), inpfile, rptfile, chemname, chemunits,
+    #     node_ids, link_ids (lists of ID labels, position k holding index k+1),
+    #     link_start, link_end, link_types, tank_nodes, tank_areas,
+    #     node_elevations, link_lengths, link_diameters (NumPy views)
+    # Energy attributes:
+    #     energy:       structured array with one record per pump (see _energy_dtype)
+    #     peak_demand:  peak energy usage charge
+    # Results:
+    #     node_results: (nperiods, 4, nnodes) float32 view, variables EN_OUT_DEMAND..EN_OUT_QUALITY
+    #     link_results: (nperiods, 8, nlinks) float32 view, variables EN_OUT_FLOW..EN_OUT_FRICTION
+    #     times:        reporting time (seconds) of each period
+    # Epilog attributes:
+    #     bulk_rate, wall_rate, tank_rate, source_rate, nperiods, warning
+    #
+    # Arrays are views into the mapped file: slicing one variable over all
+    # periods (node_results[:, EN_OUT_PRESSURE, :]) only touches the pages that
+    # hold it. Release the views before calling close().
+    #
+    # Example:
+    #     with ENoutput('net.out') as out:
+    #         pressure = np.array(out.noderesults(EN_OUT_PRESSURE))
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        try:
+            self._read()
+        except Exception:
+            self.close()
+            raise
+
+    def _read(self):
+        # The layout is validated with struct before any NumPy view of the
+        # map exists, so a bad file can still be unmapped cleanly.
+        buf = self._map
+        size = len(buf)
+        if size < 15*4 + 28:
+            raise ValueError('%s is not an EPANET Output file' % self.filename)
+        head = struct.unpack_from('<15i', buf, 0)
+        if head[0] != _magic_number:
+            raise ValueError('%s is not an EPANET Output file' % self.filename)
+        (self.version, self.nnodes, self.ntanks, self.nlinks, self.npumps,
+         self.nvalves, self.qualflag, self.traceflag, self.flowunits,
+         self.pressunits, self.statflag, self.reportstart, self.reportstep,
+         self.duration) = head[1:]
+        nnodes, nlinks, ntanks, npumps = self.nnodes, self.nlinks, self.ntanks, self.npumps
+
+        # Epilog: 4 average reaction rates, number of periods, warning flag, magic number
+        epilog = size - 28
+        (self.bulk_rate, self.wall_rate, self.tank_rate, self.source_rate,
+         self.nperiods, self.warning, magic) = struct.unpack_from('<4f3i', buf, epilog)
+        if magic != _magic_number:
+            raise ValueError('%s is incomplete: the simulation did not finish writing it' % self.filename)
+
+        # Each period holds 4 node variables then 8 link variables, every
+        # variable being a contiguous float32 block over all nodes/links.
+        prolog = 884 + 36*nnodes + 52*nlinks + 8*ntanks
+        energy = npumps*_energy_dtype.itemsize + 4
+        period = 4*(_n_node_vars*nnodes + _n_link_vars*nlinks)
+        if prolog + energy + self.nperiods*period != epilog:
+            raise ValueError('%s has an unexpected size for %d reporting periods'
+                             % (self.filename, self.nperiods))
+
+        offset = 15*4
+        self.title = [self._string(offset + k*_title_len, _title_len) for k in range(3)]
+        offset += 3*_title_len
+        self.inpfile = self._string(offset, _fname_len)
+        self.rptfile = self._string(offset + _fname_len, _fname_len)
+        offset += 2*_fname_len
+        self.chemname = self._string(offset, _id_len)
+        self.chemunits = self._string(offset + _id_len, _id_len)
+        offset += 2*_id_len
+        self.node_ids = [self._string(offset + k*_id_len, _id_len) for k in range(nnodes)]
+        offset += nnodes*_id_len
+        self.link_ids = [self._string(offset + k*_id_len, _id_len) for k in range(nlinks)]
+        offset += nlinks*_id_len
+        self.link_start, offset = self._array('<i4', nlinks, offset)
+        self.link_end, offset = self._array('<i4', nlinks, offset)
+        self.link_types, offset = self._array('<i4', nlinks, offset)
+        self.tank_nodes, offset = self._array('<i4', ntanks, offset)
+        self.tank_areas, offset = self._array('<f4', ntanks, offset)
+        self.node_elevations, offset = self._array('<f4', nnodes, offset)
+        self.link_lengths, offset = self._array('<f4', nlinks, offset)
+        self.link_diameters, offset = self._array('<f4', nlinks, offset)
+
+        self.energy = np.frombuffer(buf, dtype=_energy_dtype, count=npumps, offset=offset)
+        offset += npumps*_energy_dtype.itemsize
+        self.peak_demand, = struct.unpack_from('<f', buf, offset)
+        offset += 4
+        self.node_results = np.ndarray((self.nperiods, _n_node_vars, nnodes), dtype='<f4',
+                                       buffer=buf, offset=offset,
+                                       strides=(period, 4*nnodes, 4))
+        self.link_results = np.ndarray((self.nperiods, _n_link_vars, nlinks), dtype='<f4',
+                                       buffer=buf, offset=offset + 4*_n_node_vars*nnodes,
+                                       strides=(period, 4*nlinks, 4))
+        self.times = self.reportstart + self.reportstep*np.arange(self.nperiods)
+
+    def _string(self, offset, length):
+        return self._map[offset:offset+length].split(b'\0', 1)[0].decode('latin-1').strip()
+
+    def _array(self, dtype, count, offset):
+        array = np.frombuffer(self._map, dtype=dtype, count=count, offset=offset)
+        return array, offset + array.nbytes
+
+    def noderesults(self, var, nodes=None):
+        # Description: Retrieves one node variable over all reporting periods.
+        # Arguments:
+        #     var:   node variable (EN_OUT_DEMAND, EN_OUT_HEAD, EN_OUT_PRESSURE, EN_OUT_QUALITY)
+        #     nodes: optional node indices (starting from 1); all nodes by default
+        # Returns: (nperiods, nnodes) array, a view into the file when nodes is None
+        values = self.node_results[:, var, :]
+        if nodes is not None:
+            values = values[:, np.asarray(nodes) - 1]
+        return values
+
+    def linkresults(self, var, links=None):
+        # Description: Retrieves one link variable over all reporting periods.
+        # Arguments:
+        #     var:   link variable (EN_OUT_FLOW .. EN_OUT_FRICTION)
+        #     links: optional link indices (starting from 1); all links by default
+        # Returns: (nperiods, nlinks) array, a view into the file when links is None
+        values = self.link_results[:, var, :]
+        if links is not None:
+            values = values[:, np.asarray(links) - 1]
+        return values
+
+    def nodeindex(self, nodeid):
+        # Description: Retrieves the index (starting from 1) of a node with a specified ID.
+        return self.node_ids.index(nodeid) + 1
+
+    def linkindex(self, linkid):
+        # Description: Retrieves the index (starting from 1) of a link with a specified ID.
+        return self.link_ids.index(linkid) + 1
+
+    def close(self):
+        # Description: Unmaps and closes the file.
+        # Notes: Views handed out earlier must have been released first.
+        for name in ('node_results', 'link_results', 'energy', 'link_start', 'link_end',
+                     'link_types', 'tank_nodes', 'tank_areas', 'node_elevations',
+                     'link_lengths', 'link_diameters'):
+            self.__dict__.pop(name, None)
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
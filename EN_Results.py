@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# Compact in-memory store of EN_Mod simulation results: every variable is one
+# contiguous float32 (times x elements) array, filled step by step from
+# ENiterH or ENiterQ, and read back through NumPy views by ID and time range.
+import numpy as np
+import EN_Mod
+
+class ENresults(object):
+    # Results of one simulation, stored as float32 struct-of-arrays.
+    #
+    # The store keeps one (capacity, nelements) float32 array per variable,
+    # sized from EN_DURATION/EN_REPORTSTEP and doubled when a run has more
+    # steps (hydraulic events between reporting times). Only the variables
+    # and elements asked for are kept: 8760 hourly steps of one variable on
+    # 50000 nodes take 1.75 GB, against 3.5 GB as float64.
+    #
+    # Example:
+    #     res = ENresults((EN_PRESSURE,), (EN_FLOW,))
+    #     res.record(ENiterH((EN_PRESSURE,), (EN_FLOW,), report=True))
+    #     p = res.node(EN_PRESSURE, 'J12')                 # view over all times
+    #     q = res.link(EN_FLOW, start=3600, stop=7200)     # view over 01:00-02:00
+    #     q64 = res.link(EN_FLOW, ['P1', 'P2'], dtype=np.float64)
+    #
+    # Arguments:
+    #     nodevars: node parameter codes stored (as captured in the steps)
+    #     linkvars: link parameter codes stored
+    #     nodes:    node indices the steps hold (default: all nodes)
+    #     links:    link indices the steps hold (default: all links)
+    #     capacity: number of time steps to allocate for (default: from the time parameters)
+    #     toolkit:  ENproject holding the network (default: the module-level toolkit)
+    def __init__(self, nodevars=(), linkvars=(), nodes=None, links=None, capacity=None, toolkit=None):
+        tk = toolkit or EN_Mod
+        topology = tk.ENgettopology()
+        if topology is not None:
+            node_ids, link_ids = topology.node_ids, topology.link_ids
+        else:
+            node_ids = [tk.ENgetnodeid(k) for k in range(1, tk.ENgetcount(EN_Mod.EN_NODECOUNT)+1)]
+            link_ids = [tk.ENgetlinkid(k) for k in range(1, tk.ENgetcount(EN_Mod.EN_LINKCOUNT)+1)]
+        self.nodeindices = (np.arange(1, len(node_ids)+1, dtype=np.intc) if nodes is None
+                            else np.asarray(nodes, dtype=np.intc).reshape(-1))
+        self.linkindices = (np.arange(1, len(link_ids)+1, dtype=np.intc) if links is None
+                            else np.asarray(links, dtype=np.intc).reshape(-1))
+        self.node_ids = tuple(node_ids[k-1] for k in self.nodeindices)
+        self.link_ids = tuple(link_ids[k-1] for k in self.linkindices)
+        self._nodecolumn = dict((nid, k) for k, nid in enumerate(self.node_ids))
+        self._linkcolumn = dict((lid, k) for k, lid in enumerate(self.link_ids))
+        if capacity is None:
+            duration = tk.ENgettimeparam(EN_Mod.EN_DURATION)
+            rstep = tk.ENgettimeparam(EN_Mod.EN_REPORTSTEP) or duration or 1
+            capacity = duration // rstep + 1
+        capacity = max(int(capacity), 1)
+        self._times = np.empty(capacity, dtype=np.int64)
+        self._nodes = dict((code, np.empty((capacity, len(self.node_ids)), dtype=np.float32))
+                           for code in nodevars)
+        self._links = dict((code, np.empty((capacity, len(self.link_ids)), dtype=np.float32))
+                           for code in linkvars)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def times(self):
+        # Simulation times (seconds) of the stored steps, as a view
+        return self._times[:self.count]
+
+    @property
+    def nbytes(self):
+        # Memory allocated for the stored values
+        return self._times.nbytes + sum(a.nbytes for a in self._nodes.values()) + \
+               sum(a.nbytes for a in self._links.values())
+
+    def _grow(self, capacity):
+        self._times = _resized(self._times, capacity, self.count)
+        for arrays in (self._nodes, self._links):
+            for code in arrays:
+                arrays[code] = _resized(arrays[code], capacity, self.count)
+
+    def append(self, t, step):
+        # Description: Stores the values of one time step.
+        # Arguments:
+        #     t:    simulation time (seconds)
+        #     step: ENstep holding the stored variables, over the store's nodes and links
+        k = self.count
+        if k == len(self._times):
+            self._grow(max(2*k, 16))
+        self._times[k] = t
+        for code, values in self._nodes.items():
+            values[k] = step.nodes[code]
+        for code, values in self._links.items():
+            values[k] = step.links[code]
+        self.count = k + 1
+
+    def record(self, steps):
+        # Description: Stores every (t, step) pair of an iterator such as ENiterH.
+        # Returns: self
+        for t, step in steps:
+            self.append(t, step)
+        return self
+
+    def trim(self):
+        # Description: Releases the memory allocated beyond the stored steps.
+        if self.count < len(self._times):
+            self._grow(self.count)
+
+    def _rows(self, start, stop):
+        # Slice of the stored steps with start <= time < stop
+        times = self.times
+        first = 0 if start is None else int(np.searchsorted(times, start, 'left'))
+        last = self.count if stop is None else int(np.searchsorted(times, stop, 'left'))
+        return slice(first, max(first, last))
+
+    def _get(self, arrays, columns, code, ids, start, stop, dtype):
+        values = arrays[code][self._rows(start, stop)]
+        if ids is not None:
+            if isinstance(ids, (list, tuple, np.ndarray)):
+                values = values[:, [columns[str(i)] for i in ids]]
+            else:
+                values = values[:, columns[str(ids)]]
+        if dtype is not None:
+            values = values.astype(dtype, copy=False)
+        return values
+
+    def node(self, code, ids=None, start=None, stop=None, dtype=None):
+        # Description: Values of a node variable.
+        # Arguments:
+        #     code:  node parameter code
+        #     ids:   one node ID (returns a 1-D time series), a list of IDs, or None for all nodes
+        #     start: first simulation time (seconds) included
+        #     stop:  simulation time (seconds) excluded
+        #     dtype: type of the values returned (e.g. np.float64), by default float32
+        # Returns:
+        #     (ntimes, nnodes) or (ntimes,) array. It is a view into the store
+        #     unless a list of IDs or another dtype is asked for.
+        return self._get(self._nodes, self._nodecolumn, code, ids, start, stop, dtype)
+
+    def link(self, code, ids=None, start=None, stop=None, dtype=None):
+        # Description: Values of a link variable. Takes the same arguments as node().
+        return self._get(self._links, self._linkcolumn, code, ids, start, stop, dtype)
+
+def _resized(array, capacity, count):
+    resized = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    resized[:count] = array[:count]
+    return resized
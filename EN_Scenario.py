@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+# What-if scenarios for EN_Mod: parameter overrides applied to a base network
+# and run in parallel on a pool of workers. Worker processes each hold one
+# network in the module-level toolkit; worker threads each hold an ENproject.
+import multiprocessing
+import multiprocessing.pool
+import os
+import threading
+import numpy as np
+import EN_Mod
+
+class ENscenario(object):
+    # Parameter overrides describing one simulation of a base network.
+    #
+    # Attributes:
+    #     name:        optional label, returned with the results
+    #     nodevalues:  dict node parameter code -> (indices, values)
+    #     linkvalues:  dict link parameter code -> (indices, values)
+    #     patterns:    dict pattern index or ID -> multiplier factors
+    #     controls:    dict control index -> (ctype, lindex, setting, nindex, level)
+    #     timeparams:  dict time parameter code -> value in seconds
+    #
+    # Example:
+    #     s = ENscenario('high demand')
+    #     s.setnodevalues(EN_BASEDEMAND, junctions, 1.2*base)
+    #     s.setlinkvalues(EN_INITSTATUS, pumps, [1, 0])
+    def __init__(self, name=None, nodevalues=None, linkvalues=None, patterns=None,
+                 controls=None, timeparams=None):
+        self.name = name
+        self.nodevalues = dict(nodevalues or {})
+        self.linkvalues = dict(linkvalues or {})
+        self.patterns = dict(patterns or {})
+        self.controls = dict(controls or {})
+        self.timeparams = dict(timeparams or {})
+
+    def setnodevalues(self, paramcode, indices, values):
+        self.nodevalues[paramcode] = (np.asarray(indices, dtype=np.intc),
+                                      np.broadcast_to(np.asarray(values, dtype=np.float64), np.shape(indices)).copy())
+
+    def setlinkvalues(self, paramcode, indices, values):
+        self.linkvalues[paramcode] = (np.asarray(indices, dtype=np.intc),
+                                      np.broadcast_to(np.asarray(values, dtype=np.float64), np.shape(indices)).copy())
+
+    def setpattern(self, pattern, factors):
+        self.patterns[pattern] = np.asarray(factors, dtype=np.float64)
+
+    def setcontrol(self, cindex, ctype, lindex, setting, nindex, level):
+        self.controls[cindex] = (ctype, lindex, setting, nindex, level)
+
+    def settimeparam(self, paramcode, timevalue):
+        self.timeparams[paramcode] = int(timevalue)
+
+class ENscenarioresult(object):
+    # Results of one scenario, captured at reporting times.
+    #
+    # Attributes:
+    #     name:   name of the scenario
+    #     times:  int array of reporting times (seconds)
+    #     nodes:  dict node parameter code -> (ntimes, nnodes) float32 array
+    #     links:  dict link parameter code -> (ntimes, nlinks) float32 array
+    def __init__(self, name, times, nodes, links):
+        self.name = name
+        self.times = times
+        self.nodes = nodes
+        self.links = links
+
+class ENsession(object):
+    # Base network kept open for many scenario evaluations.
+    #
+    # The Input file is read and the hydraulics system opened once. Baseline
+    # values of the patterns, link initial status/settings, controls and tank
+    # initial levels are read at that point; other parameters are read the
+    # first time a scenario overrides them. After each run only the
+    # parameters the scenario touched are set back to their baseline.
+    #
+    # Example:
+    #     with ENsession('net.inp') as session:
+    #         for scenario in candidates:
+    #             result = session.run(scenario, (EN_PRESSURE,))
+    #
+    # toolkit is the ENproject holding the network (default: the module-level
+    # toolkit). The session opens and closes the network, not the project.
+    # With an ENresultcache (see EN_Cache), run() returns the cached result of
+    # a scenario already run with the same overrides and capture settings.
+    def __init__(self, inpname, repname=os.devnull, toolkit=None, cache=None):
+        tk = self.toolkit = toolkit or EN_Mod
+        self.inpname = inpname
+        self.cache = cache
+        tk.ENopen(inpname, repname, '', topology=True)
+        try:
+            topology = tk.ENgettopology()
+            nlinks = len(topology.link_ids)
+            self._nodevalues = {}
+            self._linkvalues = {}
+            self._timeparams = {}
+            self._baseline(self._nodevalues, tk.ENgetnodevalues, len(topology.node_ids),
+                           EN_Mod.EN_TANKLEVEL, topology.tanks)
+            for code in (EN_Mod.EN_INITSTATUS, EN_Mod.EN_INITSETTING):
+                self._baseline(self._linkvalues, tk.ENgetlinkvalues, nlinks, code,
+                               np.arange(1, nlinks+1, dtype=np.intc))
+            self._patterns = [None] + [tk.ENgetpattern(k, dtype=np.float64) for k in
+                                       range(1, tk.ENgetcount(EN_Mod.EN_PATCOUNT)+1)]
+            self._controls = [None] + [tk.ENgetcontrol(k) for k in
+                                       range(1, tk.ENgetcount(EN_Mod.EN_CONTROLCOUNT)+1)]
+            self._touched = []
+            tk.ENopenH()
+        except Exception:
+            tk.ENclose()
+            raise
+
+    @staticmethod
+    def _baseline(baseline, getter, count, code, indices):
+        # Records the values of code at indices, unknown values being NaN.
+        indices = np.asarray(indices, dtype=np.intc)
+        if len(indices) and (indices.min() < 1 or indices.max() > count):
+            getter(code, indices)   # raises the toolkit's undefined node/link error
+        values = baseline.get(code)
+        if values is None:
+            values = baseline[code] = np.full(count + 1, np.nan)
+        missing = indices[np.isnan(values[indices])]
+        if len(missing):
+            values[missing] = getter(code, missing, dtype=np.float64)
+        return values
+
+    def apply(self, scenario):
+        # Description: Applies the overrides of a scenario on top of the current state.
+        # Notes: Values overridden here are set back to baseline by restore().
+        tk = self.toolkit
+        touched = self._touched
+        for code, seconds in scenario.timeparams.items():
+            if code not in self._timeparams:
+                self._timeparams[code] = tk.ENgettimeparam(code)
+            touched.append(('time', code))
+            tk.ENsettimeparam(code, seconds)
+        for pattern, factors in scenario.patterns.items():
+            index = pattern if isinstance(pattern, (int, np.integer)) else tk.ENgetpatternindex(pattern)
+            if not 0 < index < len(self._patterns):
+                raise ValueError('pattern %r has no baseline in this session (patterns added after the '
+                                 'session was opened cannot be overridden)' % (pattern,))
+            touched.append(('pattern', index))
+            tk.ENsetpattern(index, factors)
+        for cindex, control in scenario.controls.items():
+            touched.append(('control', cindex))
+            tk.ENsetcontrol(cindex, *control)
+        nnodes = len(tk.ENgettopology().node_ids)
+        nlinks = len(tk.ENgettopology().link_ids)
+        for code, (indices, values) in scenario.nodevalues.items():
+            self._baseline(self._nodevalues, tk.ENgetnodevalues, nnodes, code, indices)
+            touched.append(('node', code, indices))
+            tk.ENsetnodevalues(code, indices, values)
+        for code, (indices, values) in scenario.linkvalues.items():
+            self._baseline(self._linkvalues, tk.ENgetlinkvalues, nlinks, code, indices)
+            touched.append(('link', code, indices))
+            tk.ENsetlinkvalues(code, indices, values)
+
+    def restore(self):
+        # Description: Sets every parameter overridden since the last restore back to baseline.
+        tk = self.toolkit
+        while self._touched:
+            item = self._touched.pop()
+            kind, key = item[0], item[1]
+            if kind == 'time':
+                tk.ENsettimeparam(key, self._timeparams[key])
+            elif kind == 'pattern':
+                tk.ENsetpattern(key, self._patterns[key])
+            elif kind == 'control':
+                tk.ENsetcontrol(key, *self._controls[key])
+            elif kind == 'node':
+                tk.ENsetnodevalues(key, item[2], self._nodevalues[key][item[2]])
+            else:
+                tk.ENsetlinkvalues(key, item[2], self._linkvalues[key][item[2]])
+
+    def run(self, scenario, nodevars=(), linkvars=(), nodes=None, links=None, report=True):
+        # Description:
+        #     Runs the hydraulics of one scenario and restores the baseline.
+        # Arguments:
+        #     scenario: ENscenario, or None to run the baseline network
+        #     nodevars, linkvars, nodes, links, report: see ENiterscenarios
+        # Returns: ENscenarioresult
+        name = getattr(scenario, 'name', None)
+        if self.cache is not None:
+            key = self.cache.key(self.inpname, scenario, (tuple(nodevars), tuple(linkvars), nodes, links, report))
+            result = self.cache.get(key)
+            if result is not None:
+                return _renamed(result, name)
+        try:
+            if scenario is not None:
+                self.apply(scenario)
+            result = _simulate(self.toolkit, name, nodevars, linkvars, nodes, links, report)
+        finally:
+            self.restore()
+        if self.cache is not None:
+            self.cache.put(key, result)
+        return result
+
+    def close(self):
+        # Description: Closes the hydraulics system and the network.
+        tk = self.toolkit
+        try:
+            tk.ENcloseH()
+        finally:
+            tk.ENclose()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _simulate(tk, name, nodevars, linkvars, nodes, links, report):
+    # Runs the hydraulics of the network open in toolkit tk (hydraulics
+    # system already open), keeping a float32 copy of the requested variables
+    # at each yielded step. Flows are re-initialised so that a run does not
+    # depend on the solution left by the previous one.
+    recorder = _recorder(name, nodevars, linkvars)
+    for t, step in tk.ENiterH(nodevars, linkvars, nodes, links, report=report,
+                              flag=EN_Mod.EN_INITFLOW, openclose=False):
+        recorder.add(t, step)
+    return recorder.result()
+
+def _renamed(result, name):
+    # Cached result under the name of the scenario asking for it (arrays shared)
+    if result.name == name:
+        return result
+    return ENscenarioresult(name, result.times, result.nodes, result.links)
+
+class _recorder(object):
+    # Accumulates copies of the steps of one run into an ENscenarioresult.
+    def __init__(self, name, nodevars, linkvars):
+        self.name = name
+        self.times = []
+        self.nodes = dict((code, []) for code in nodevars)
+        self.links = dict((code, []) for code in linkvars)
+
+    def add(self, t, step):
+        self.times.append(t)
+        for code, buf in step.nodes.items():
+            self.nodes[code].append(buf.copy())
+        for code, buf in step.links.items():
+            self.links[code].append(buf.copy())
+
+    def result(self):
+        return ENscenarioresult(self.name, np.array(self.times, dtype=np.int64),
+                                dict((code, np.array(rows, dtype=np.float32)) for code, rows in self.nodes.items()),
+                                dict((code, np.array(rows, dtype=np.float32)) for code, rows in self.links.items()))
+
+def _newproject(libpath):
+    # ENproject that can run alongside others: on a private copy of the
+    # library when it is an EPANET 2.0 toolkit.
+    project = EN_Mod.ENproject(libpath)
+    if not project.concurrent:
+        project.ENdeleteproject()
+        project = EN_Mod.ENproject(libpath, private=True)
+    return project
+
+# Per-process state of a pool worker: its session and the capture settings
+_worker_session= None
+_worker_options= None
+
+def _initworker(inpname, options):
+    # Pool initializer: opens the base network once in this worker process.
+    global _worker_session, _worker_options
+    _worker_session = ENsession(inpname)
+    _worker_options = options
+
+def _runworker(job):
+    position, scenario = job
+    return position, _worker_session.run(scenario, *_worker_options)
+
+class _threadworkers(object):
+    # Sessions of the threads of a ThreadPool, each on its own ENproject.
+    # A session is opened by the first scenario a thread runs, so that an
+    # error opening the network is raised by the iteration.
+    def __init__(self, inpname, libpath, options):
+        self.inpname = inpname
+        self.libpath = libpath
+        self.options = options
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.sessions = []
+
+    def _session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            project = _newproject(self.libpath)
+            try:
+                session = ENsession(self.inpname, toolkit=project)
+            except Exception:
+                project.ENdeleteproject()
+                raise
+            self.local.session = session
+            with self.lock:
+                self.sessions.append(session)
+        return session
+
+    def run(self, job):
+        position, scenario = job
+        return position, self._session().run(scenario, *self.options)
+
+    def close(self):
+        for session in self.sessions:
+            try:
+                session.close()
+            finally:
+                session.toolkit.ENdeleteproject()
+        del self.sessions[:]
+
+def ENiterscenarios(inpname, scenarios, nodevars=(), linkvars=(), nodes=None, links=None,
+                    report=True, processes=None, threads=None, libpath=None, cache=None):
+    # Description:
+    #     Runs scenarios of a base network on a pool of worker processes or
+    #     threads, yielding results as soon as each scenario finishes.
+    # Arguments:
+    #     inpname:   name of the EPANET Input file of the base network
+    #     scenarios: iterable of ENscenario
+    #     nodevars:  node parameter codes to capture (e.g. EN_PRESSURE)
+    #     linkvars:  link parameter codes to capture (e.g. EN_FLOW)
+    #     nodes:     node indices to capture (default: all nodes)
+    #     links:     link indices to capture (default: all links)
+    #     report:    capture at reporting times only (see ENiterH)
+    #     processes: number of worker processes (default: number of CPUs)
+    #     threads:   if given, run on this many worker threads instead of processes
+    #     libpath:   toolkit library loaded by the worker threads (see ENproject)
+    #     cache:     ENresultcache (see EN_Cache) of results already computed
+    # Yields:
+    #     (position, result) pairs in completion order, position being the
+    #     scenario's place in scenarios and result an ENscenarioresult
+    # Notes:
+    #     Each worker holds an ENsession: the Input file is opened once and
+    #     after every scenario the parameters it overrode are set back to
+    #     baseline before the next one is run.
+    #
+    #     Worker threads each hold an ENproject, on a private copy of the
+    #     library when it is an EPANET 2.0 toolkit. The GIL is released during
+    #     every toolkit call, so the simulations overlap and results reach the
+    #     caller without being pickled.
+    #
+    #     With a cache, scenarios found in it are yielded first without
+    #     running, and scenarios identical to one another (same overrides)
+    #     run once; the results of the scenarios run are added to the cache.
+    options = (tuple(nodevars), tuple(linkvars), nodes, links, report)
+    jobs = enumerate(scenarios)
+    if cache is not None:
+        keys = {}
+        waiting = {}    # key -> [(position, name)] of the scenarios waiting for it
+        jobs = []
+        for position, scenario in enumerate(scenarios):
+            name = getattr(scenario, 'name', None)
+            key = cache.key(inpname, scenario, options)
+            if key in waiting:
+                waiting[key].append((position, name))
+                continue
+            result = cache.get(key)
+            if result is not None:
+                yield position, _renamed(result, name)
+                continue
+            waiting[key] = [(position, name)]
+            keys[position] = key
+            jobs.append((position, scenario))
+        if not jobs:
+            return
+    if threads is None:
+        workers = None
+        pool = multiprocessing.Pool(processes, _initworker, (inpname, options))
+        run = _runworker
+    else:
+        workers = _threadworkers(inpname, libpath, options)
+        pool = multiprocessing.pool.ThreadPool(threads)
+        run = workers.run
+    try:
+        for position, result in pool.imap_unordered(run, jobs):
+            if cache is not None:
+                key = keys[position]
+                cache.put(key, result)
+                for other, name in waiting[key][1:]:
+                    yield other, _renamed(result, name)
+            yield position, result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+        if workers is not None:
+            workers.close()
+
+def ENrunscenarios(inpname, scenarios, nodevars=(), linkvars=(), nodes=None, links=None,
+                   report=True, processes=None, threads=None, libpath=None, cache=None):
+    # Description:
+    #     Runs scenarios of a base network on a pool of worker processes or threads.
+    #     Takes the same arguments as ENiterscenarios.
+    # Returns:
+    #     list of ENscenarioresult, in the order of scenarios
+    results = {}
+    for position, result in ENiterscenarios(inpname, scenarios, nodevars, linkvars, nodes, links,
+                                            report, processes, threads, libpath, cache):
+        results[position] = result
+    return [results[k] for k in range(len(results))]
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# Pump schedules for EN_Mod: a (pumps x periods) matrix of pump speeds, 0
+# meaning off and 1 on at normal speed, applied to the open network either by
+# setting pump settings between hydraulic steps or as timer controls, with the
+# energy and cost of each pump metered over the simulation.
+import numpy as np
+import EN_Mod
+
+def _check(pumps, schedule):
+    pumps = np.asarray(pumps, dtype=np.intc).reshape(-1)
+    schedule = np.asarray(schedule, dtype=np.float64)
+    if schedule.ndim != 2 or schedule.shape[0] != len(pumps):
+        raise ValueError('schedule must have one row per pump, got shape %s for %d pumps'
+                         % (schedule.shape, len(pumps)))
+    if (schedule < 0).any():
+        raise ValueError('pump speeds cannot be negative')
+    return pumps, schedule
+
+def _changes(pumps, schedule):
+    # For every period, the (indices, speeds) of the pumps whose speed differs
+    # from the previous period; the first period sets every pump.
+    changed = np.ones(schedule.shape, dtype=bool)
+    changed[:, 1:] = schedule[:, 1:] != schedule[:, :-1]
+    return [(pumps[changed[:, k]], schedule[changed[:, k], k]) for k in range(schedule.shape[1])]
+
+def ENschedulecontrols(pumps, schedule, period):
+    # Description:
+    #     Compiles a pump schedule into simple timer controls.
+    # Arguments:
+    #     pumps:    link indices of the scheduled pumps
+    #     schedule: (npumps, nperiods) array of speeds, 0 for off, 1 for normal speed
+    #     period:   length of a schedule period, in seconds
+    # Returns:
+    #     (initial, controls): initial is a list of (pump, speed) for time 0 and
+    #     controls a list of (EN_TIMER, pump, speed, 0, time) tuples, as taken by
+    #     ENsetcontrol, one per later change of a pump's speed
+    pumps, schedule = _check(pumps, schedule)
+    changes = _changes(pumps, schedule)
+    initial = list(zip(changes[0][0].tolist(), changes[0][1].tolist()))
+    controls = []
+    for k in range(1, len(changes)):
+        for pump, speed in zip(changes[k][0].tolist(), changes[k][1].tolist()):
+            controls.append((EN_Mod.EN_TIMER, pump, speed, 0, k*period))
+    return initial, controls
+
+def ENsetschedule(pumps, schedule, period, controls, toolkit=None):
+    # Description:
+    #     Installs a pump schedule in the network as initial pump settings and
+    #     timer controls.
+    # Arguments:
+    #     pumps, schedule, period: see ENschedulecontrols
+    #     controls: indices of the simple controls the schedule may overwrite
+    #               (e.g. placeholder timer controls in the Input file); those
+    #               left over are disabled
+    #     toolkit:  ENproject holding the network (default: the module-level toolkit)
+    # Returns:
+    #     number of controls used
+    # Notes:
+    #     The toolkit cannot add controls, only change existing ones, so the
+    #     Input file must provide as many as the schedule has speed changes.
+    #     Once installed, the schedule is part of the network: ENsolveH,
+    #     ENiterH or ENrunschedule(pumps, None, ...) run it entirely in the DLL.
+    tk = toolkit or EN_Mod
+    initial, compiled = ENschedulecontrols(pumps, schedule, period)
+    controls = list(controls)
+    if len(compiled) > len(controls):
+        raise ValueError('the schedule needs %d controls, %d were given' % (len(compiled), len(controls)))
+    for pump, speed in initial:
+        tk.ENsetlinkvalue(pump, EN_Mod.EN_INITSTATUS, 1 if speed > 0 else 0)
+        if speed > 0:
+            tk.ENsetlinkvalue(pump, EN_Mod.EN_INITSETTING, speed)
+    for cindex, control in zip(controls, compiled):
+        tk.ENsetcontrol(cindex, *control)
+    for cindex in controls[len(compiled):]:
+        tk.ENsetcontrol(cindex, EN_Mod.EN_TIMER, 0, 0, 0, 0)
+    return len(compiled)
+
+def ENrunschedule(pumps, schedule, period=None, tariff=0, flag=0, openclose=True, toolkit=None):
+    # Description:
+    #     Runs the extended period hydraulics under a pump schedule and meters
+    #     the energy used by each pump.
+    # Arguments:
+    #     pumps:     link indices of the pumps (scheduled and metered)
+    #     schedule:  (npumps, nperiods) array of speeds applied at the start of
+    #                each period, 0 for off; None to run the network's own
+    #                controls (e.g. installed by ENsetschedule) and only meter
+    #     period:    length of a schedule period, in seconds; must be a
+    #                multiple of EN_PATTERNSTEP so that every period starts a
+    #                hydraulic time step (default: EN_PATTERNSTEP)
+    #     tariff:    energy price per kwatt-hour, a single value or one value per period
+    #     flag:      flag passed to ENinitH (EN_INITFLOW to rerun from a clean state)
+    #     openclose: if False, the hydraulics system must already be open and is left open
+    #     toolkit:   ENproject holding the network (default: the module-level toolkit)
+    # Returns:
+    #     (energy, cost): arrays of kwatt-hours used and their cost per pump
+    # Notes:
+    #     Pump speeds are set with ENsetlinkvalues(EN_SETTING) for the pumps
+    #     whose speed changes at a period boundary, before that step is solved.
+    #     After the last period the pumps keep their last speed. Energy is
+    #     EN_ENERGY (kwatts) of each step times the step length.
+    tk = toolkit or EN_Mod
+    pumps = np.asarray(pumps, dtype=np.intc).reshape(-1)
+    changes = None
+    pstep = tk.ENgettimeparam(EN_Mod.EN_PATTERNSTEP)
+    if period is None:
+        period = pstep
+    if schedule is not None:
+        pumps, schedule = _check(pumps, schedule)
+        changes = _changes(pumps, schedule)
+        pstart = tk.ENgettimeparam(EN_Mod.EN_PATTERNSTART)
+        if period % pstep or pstart % pstep:
+            raise ValueError('period (%d s) must be a multiple of the pattern step (%d s) with a '
+                             'pattern start aligned on it' % (period, pstep))
+    tariff = np.asarray(tariff, dtype=np.float64)
+    nperiods = None if tariff.ndim == 0 else len(tariff)
+    energy = np.zeros(len(pumps))
+    cost = np.zeros(len(pumps))
+    kw = np.empty(len(pumps), dtype=np.float64)
+    if openclose:
+        tk.ENopenH()
+    try:
+        tk.ENinitH(flag)
+        t = 0
+        applied = 0
+        while True:
+            if changes is not None and applied < len(changes) and t >= applied*period:
+                indices, speeds = changes[applied]
+                if len(indices):
+                    tk.ENsetlinkvalues(EN_Mod.EN_SETTING, indices, speeds)
+                applied += 1
+            tk.ENrunH()
+            tk.ENgetlinkvalues(EN_Mod.EN_ENERGY, pumps, out=kw)
+            dt = tk.ENnextH()
+            if dt <= 0:
+                break
+            kwh = kw*(dt/3600.0)
+            energy += kwh
+            if nperiods is None:
+                cost += kwh*float(tariff)
+            else:
+                cost += kwh*tariff[min(t//period, nperiods-1)]
+            t += dt
+    finally:
+        if openclose:
+            tk.ENcloseH()
+    return energy, cost
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# Sensitivities for model calibration with EN_Mod: the Jacobian of observed
+# results (e.g. pressures at gauged nodes) with respect to groups of
+# parameters (e.g. roughness of pipe groups, demand of demand zones) by
+# central finite differences, the perturbed runs being batched over a pool of
+# workers that keep the network open (see EN_Scenario), and a damped
+# Gauss-Newton calibration built on it.
+import multiprocessing
+import multiprocessing.pool
+import os
+import numpy as np
+import EN_Mod
+from EN_Scenario import ENscenario, _initworker, _runworker, _threadworkers
+
+# Default relative step: results are captured (and read through the legacy
+# toolkit functions) in single precision, whose rounding error eps makes
+# eps**(1/3) the step of least total error for central differences
+_step= float(np.finfo(np.float32).eps)**(1.0/3)
+
+class _group(object):
+    # Parameter group: one multiplier scales paramcode of every element.
+    def __init__(self, name, node, paramcode, indices):
+        self.name = name
+        self.node = node
+        self.paramcode = paramcode
+        self.indices = np.asarray(indices, dtype=np.intc).reshape(-1)
+        self.baseline = None
+
+class ENsensitivity(object):
+    # Finite-difference sensitivities of simulated observations to
+    # multipliers of parameter groups.
+    #
+    # The parameters are one multiplier per group, applied to the baseline
+    # values of the group's elements (x = 1 is the network as read from the
+    # Input file). The observations are the values of paramcode at the
+    # observed nodes and times, flattened time by time into one vector.
+    #
+    # Runs go to a pool of worker processes or threads created with the first
+    # evaluation and kept until close(); each worker keeps the network open
+    # and only resets what a run overrode (see ENsession). Groups left at
+    # their baseline multiplier are not set at all, so a perturbation of one
+    # group only sets that group's elements.
+    #
+    # Example:
+    #     with ENsensitivity('net.inp', gauges, threads=8) as s:
+    #         for pipes in pipe_groups:
+    #             s.addroughness(pipes)
+    #         x, history = s.calibrate(field_pressures, reuse=0.05)
+    #
+    # Arguments:
+    #     inpname:   name of the EPANET Input file
+    #     nodes:     node indices observed
+    #     times:     simulation times (seconds) observed, among the reporting
+    #                times (default: every reporting time)
+    #     paramcode: node parameter observed (default EN_PRESSURE)
+    #     step:      relative finite-difference step of the multipliers
+    #                (default: cube root of the float32 machine epsilon, about 5e-3)
+    #     batch:     runs submitted to the pool at a time
+    #     processes, threads, libpath: see ENiterscenarios
+    #     toolkit:   toolkit used to read the baseline values (default: the
+    #                module-level toolkit; the network is opened and closed)
+    def __init__(self, inpname, nodes, times=None, paramcode=EN_Mod.EN_PRESSURE, step=_step, batch=256,
+                 processes=None, threads=None, libpath=None, toolkit=None):
+        self.inpname = inpname
+        self.nodes = np.asarray(nodes, dtype=np.intc).reshape(-1)
+        self.times = None if times is None else np.asarray(times, dtype=np.int64).reshape(-1)
+        self.paramcode = paramcode
+        self.step = step
+        self.batch = batch
+        self.processes = processes
+        self.threads = threads
+        self.libpath = libpath
+        self.toolkit = toolkit or EN_Mod
+        self.groups = []
+        self.runs = 0
+        self._pool = None
+        self._workers = None
+        self._columns = {}     # group position -> (x when computed, column)
+
+    def _add(self, name, node, paramcode, indices):
+        if self._pool is not None:
+            raise RuntimeError('groups must be added before the first evaluation')
+        self.groups.append(_group(name or 'g%d' % (len(self.groups) + 1), node, paramcode, indices))
+        return len(self.groups) - 1
+
+    def addnode(self, paramcode, nodes, name=None):
+        # Description: Adds a group scaling a node parameter (e.g. EN_BASEDEMAND) of a group of nodes.
+        # Returns: position of the group in the parameter vector
+        return self._add(name, True, paramcode, nodes)
+
+    def addlink(self, paramcode, links, name=None):
+        # Description: Adds a group scaling a link parameter (e.g. EN_ROUGHNESS) of a group of links.
+        # Returns: position of the group in the parameter vector
+        return self._add(name, False, paramcode, links)
+
+    def addroughness(self, links, name=None):
+        # Description: Adds a group scaling the roughness coefficient of a group of pipes.
+        return self.addlink(EN_Mod.EN_ROUGHNESS, links, name)
+
+    def adddemand(self, nodes, name=None):
+        # Description: Adds a group scaling the base demand of a group of junctions.
+        return self.addnode(EN_Mod.EN_BASEDEMAND, nodes, name)
+
+    def _start(self):
+        # Reads the baseline values and starts the worker pool.
+        tk = self.toolkit
+        tk.ENopen(self.inpname, os.devnull, '')
+        try:
+            for g in self.groups:
+                getter = tk.ENgetnodevalues if g.node else tk.ENgetlinkvalues
+                g.baseline = getter(g.paramcode, g.indices, dtype=np.float64)
+        finally:
+            tk.ENclose()
+        options = ((self.paramcode,), (), self.nodes, None, True)
+        if self.threads is None:
+            self._pool = multiprocessing.Pool(self.processes, _initworker, (self.inpname, options))
+            self._run = _runworker
+        else:
+            self._workers = _threadworkers(self.inpname, self.libpath, options)
+            self._pool = multiprocessing.pool.ThreadPool(self.threads)
+            self._run = self._workers.run
+
+    def _scenario(self, x):
+        # ENscenario setting the groups whose multiplier is not 1
+        scenario = ENscenario()
+        merged = {}
+        for g, multiplier in zip(self.groups, x):
+            if multiplier != 1.0:
+                entry = merged.setdefault((g.node, g.paramcode), ([], []))
+                entry[0].append(g.indices)
+                entry[1].append(g.baseline*multiplier)
+        for (node, code), (indices, values) in merged.items():
+            overrides = scenario.nodevalues if node else scenario.linkvalues
+            overrides[code] = (np.concatenate(indices), np.concatenate(values))
+        return scenario
+
+    def evaluate(self, xs):
+        # Description: Simulates the observations for several parameter vectors.
+        # Arguments: xs: (nruns, ngroups) multipliers
+        # Returns: (nruns, nobservations) float64 array
+        xs = np.atleast_2d(np.asarray(xs, dtype=np.float64))
+        if xs.shape[1] != len(self.groups):
+            raise ValueError('expected %d multipliers per run, got %d' % (len(self.groups), xs.shape[1]))
+        if self._pool is None:
+            self._start()
+        out = None
+        for first in range(0, len(xs), self.batch):
+            jobs = [(first + k, self._scenario(x)) for k, x in enumerate(xs[first:first+self.batch])]
+            for position, result in self._pool.imap_unordered(self._run, jobs):
+                values = result.nodes[self.paramcode]
+                if self.times is not None:
+                    values = values[np.isin(result.times, self.times)]
+                if out is None:
+                    out = np.empty((len(xs), values.size))
+                out[position] = values.reshape(-1)
+        self.runs += len(xs)
+        return out
+
+    def simulate(self, x):
+        # Description: Simulates the observations for one parameter vector.
+        # Returns: float64 array of nobservations values
+        return self.evaluate([x])[0]
+
+    def jacobian(self, x, reuse=None, y=None):
+        # Description:
+        #     Central finite-difference Jacobian of the observations at x: two
+        #     runs per column, each group's multiplier moved by +h and -h.
+        # Arguments:
+        #     x:     multipliers of the groups
+        #     reuse: if given, a column computed at an earlier x is reused
+        #            while its group's multiplier has changed by less than this
+        #            relative amount since (columns of parameters a calibration
+        #            barely moves are not recomputed); None recomputes every column
+        #     y:     observations already simulated at x, if known
+        # Returns:
+        #     (J, y): (nobservations, ngroups) Jacobian and observations at x
+        x = np.asarray(x, dtype=np.float64)
+        recompute = []
+        for j in range(len(x)):
+            cached = self._columns.get(j)
+            if reuse is None or cached is None or abs(x[j] - cached[0]) > reuse*abs(cached[0]):
+                recompute.append(j)
+        h = self.step*np.maximum(np.abs(x), 1e-3)
+        n = len(recompute)
+        xs = np.repeat(x[np.newaxis], 2*n, axis=0)
+        xs[np.arange(n), recompute] += h[recompute]
+        xs[np.arange(n, 2*n), recompute] -= h[recompute]
+        if y is None:
+            xs = np.vstack([x[np.newaxis], xs])
+        ys = self.evaluate(xs)
+        if y is None:
+            y, ys = ys[0], ys[1:]
+        for k, j in enumerate(recompute):
+            self._columns[j] = (x[j], (ys[k] - ys[n+k])/(2*h[j]))
+        J = np.empty((len(y), len(x)))
+        for j in range(len(x)):
+            J[:, j] = self._columns[j][1]
+        return J, y
+
+    def calibrate(self, observed, x0=None, iterations=10, damping=1e-2, lower=0.1, upper=10.0,
+                  tolerance=1e-6, reuse=None, weights=None):
+        # Description:
+        #     Fits the multipliers to observations by damped Gauss-Newton
+        #     (Levenberg-Marquardt) iterations.
+        # Arguments:
+        #     observed:   observations, (ntimes, nnodes) or flattened; NaN for missing values
+        #     x0:         starting multipliers (default: all 1)
+        #     iterations: maximum number of Jacobian evaluations
+        #     damping:    initial Levenberg-Marquardt damping
+        #     lower, upper: bounds of the multipliers (scalars or one per group)
+        #     tolerance:  stop when the relative decrease of the sum of squares is below it
+        #     reuse:      column reuse tolerance (see jacobian)
+        #     weights:    weight of each observation (default: 1)
+        # Returns:
+        #     (x, history): fitted multipliers and the weighted sum of squared
+        #     residuals after each accepted step, starting with x0's
+        observed = np.asarray(observed, dtype=np.float64).reshape(-1)
+        w = np.ones(len(observed)) if weights is None else np.asarray(weights, dtype=np.float64).reshape(-1)
+        w = np.where(np.isnan(observed), 0.0, w)
+        observed = np.nan_to_num(observed)
+        x = np.ones(len(self.groups)) if x0 is None else np.array(x0, dtype=np.float64)
+        y = self.simulate(x)
+        sse = float(np.sum(w*(observed - y)**2))
+        history = [sse]
+        for iteration in range(iterations):
+            J, y = self.jacobian(x, reuse, y)
+            r = observed - y
+            JtW = J.T*w
+            A = JtW.dot(J)
+            g = JtW.dot(r)
+            diag = np.maximum(np.diag(A), 1e-12)
+            while True:
+                dx = np.linalg.solve(A + damping*np.diag(diag), g)
+                trial = np.clip(x + dx, lower, upper)
+                ytrial = self.simulate(trial)
+                trialsse = float(np.sum(w*(observed - ytrial)**2))
+                if trialsse < sse or damping > 1e8:
+                    break
+                damping *= 10.0
+            if trialsse >= sse:
+                break
+            damping = max(damping/10.0, 1e-12)
+            decrease = (sse - trialsse)/max(sse, 1e-300)
+            x, y, sse = trial, ytrial, trialsse
+            history.append(sse)
+            if decrease < tolerance:
+                break
+        return x, history
+
+    def close(self):
+        # Description: Stops the worker pool.
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        try:
+            pool.close()
+            pool.join()
+        finally:
+            if self._workers is not None:
+                self._workers.close()
+                self._workers = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
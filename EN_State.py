@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# Rolling-horizon simulation for EN_Mod: the hydraulic state reached during an
+# extended period simulation is captured and later used as the initial
+# conditions of a new simulation, so that each replanning cycle only
+# simulates its own horizon.
+import numpy as np
+import EN_Mod
+
+class ENstate(object):
+    # Hydraulic state of the network at one time of a simulation.
+    #
+    # Attributes:
+    #     time:       elapsed time (seconds) since the start of the original simulation
+    #     tanks:      node indices of the tanks
+    #     tanklevels: water level of each tank above its bottom
+    #     links:      link indices of the links with a status (all but CV pipes)
+    #     status:     status of each link (0 closed, 1 open)
+    #     controlled: link indices of the pumps and valves
+    #     settings:   speed of each pump, setting of each valve
+    def __init__(self, time, tanks, tanklevels, links, status, controlled, settings):
+        self.time = time
+        self.tanks = tanks
+        self.tanklevels = tanklevels
+        self.links = links
+        self.status = status
+        self.controlled = controlled
+        self.settings = settings
+
+class ENhorizon(object):
+    # Checkpoint and restart of the network open in the toolkit.
+    #
+    # The initial conditions that a restart overwrites (tank levels, link
+    # status and settings, pattern start, simple controls) are read when the
+    # ENhorizon is created, and every restart is computed from them: a state
+    # captured in a restarted simulation still carries the time elapsed since
+    # the original start.
+    #
+    # Example:
+    #     horizon = ENhorizon()
+    #     for t, step in ENiterH():
+    #         if t == 900:
+    #             state = horizon.checkpoint()
+    #             break
+    #     horizon.restore(state)      # next simulation starts at 00:15
+    #     ENsettimeparam(EN_DURATION, 24*3600)
+    #     plan = ENiterH(...)
+    #
+    # Notes:
+    #     Patterns are shifted through EN_PATTERNSTART, timer controls are
+    #     moved back by the elapsed time (disabled once they are past) and
+    #     time-of-day controls are moved back modulo one day. Time conditions
+    #     in rule-based controls cannot be reached by the toolkit and are
+    #     left unchanged.
+    def __init__(self, toolkit=None):
+        tk = self.toolkit = toolkit or EN_Mod
+        topology = tk.ENgettopology() or EN_Mod.ENtopology(tk)
+        self.tanks = np.array(topology.tanks, dtype=np.intc)
+        self.links = np.flatnonzero(topology.link_types != EN_Mod.EN_CVPIPE).astype(np.intc) + 1
+        self.controlled = np.sort(np.concatenate((topology.pumps, topology.valves))).astype(np.intc)
+        self._elevations = tk.ENgetnodevalues(EN_Mod.EN_ELEVATION, self.tanks, dtype=np.float64)
+        self._minlevels = tk.ENgetnodevalues(EN_Mod.EN_MINLEVEL, self.tanks, dtype=np.float64)
+        self._maxlevels = tk.ENgetnodevalues(EN_Mod.EN_MAXLEVEL, self.tanks, dtype=np.float64)
+        self._patternstart = tk.ENgettimeparam(EN_Mod.EN_PATTERNSTART)
+        self._controls = [tk.ENgetcontrol(k) for k in range(1, tk.ENgetcount(EN_Mod.EN_CONTROLCOUNT)+1)]
+        self.initial = ENstate(0, self.tanks, tk.ENgetnodevalues(EN_Mod.EN_TANKLEVEL, self.tanks, dtype=np.float64),
+                               self.links, tk.ENgetlinkvalues(EN_Mod.EN_INITSTATUS, self.links, dtype=np.float64),
+                               self.controlled,
+                               tk.ENgetlinkvalues(EN_Mod.EN_INITSETTING, self.controlled, dtype=np.float64))
+        self.offset = 0
+
+    def checkpoint(self):
+        # Description: Captures the current hydraulic state.
+        # Returns: ENstate
+        # Notes: Call right after ENrunH (e.g. inside an ENiterH loop), when the
+        #        toolkit holds the solution at the current time.
+        tk = self.toolkit
+        t = int(tk.ENsimtime().total_seconds())
+        heads = tk.ENgetnodevalues(EN_Mod.EN_HEAD, self.tanks, dtype=np.float64)
+        return ENstate(self.offset + t, self.tanks, heads - self._elevations,
+                       self.links, tk.ENgetlinkvalues(EN_Mod.EN_STATUS, self.links, dtype=np.float64),
+                       self.controlled, tk.ENgetlinkvalues(EN_Mod.EN_SETTING, self.controlled, dtype=np.float64))
+
+    def restore(self, state):
+        # Description: Makes a captured state the initial conditions of the next simulation.
+        # Arguments: state: ENstate from checkpoint() (or self.initial to go back to the start)
+        # Notes: Call with the hydraulics system closed or before ENinitH.
+        tk = self.toolkit
+        levels = np.clip(state.tanklevels, self._minlevels, self._maxlevels)
+        tk.ENsetnodevalues(EN_Mod.EN_TANKLEVEL, state.tanks, levels)
+        # Pipes take their status; open pumps and valves their speed or
+        # setting, since an initial status of open would fix a valve open
+        controlled = np.isin(state.links, state.controlled)
+        tk.ENsetlinkvalues(EN_Mod.EN_INITSTATUS, state.links[~controlled], state.status[~controlled])
+        opened = state.status[controlled] > 0
+        if (~opened).any():
+            tk.ENsetlinkvalues(EN_Mod.EN_INITSTATUS, state.controlled[~opened], 0)
+        if opened.any():
+            tk.ENsetlinkvalues(EN_Mod.EN_INITSETTING, state.controlled[opened], state.settings[opened])
+        elapsed = state.time
+        tk.ENsettimeparam(EN_Mod.EN_PATTERNSTART, self._patternstart + elapsed)
+        for cindex, (ctype, lindex, setting, nindex, level) in enumerate(self._controls, 1):
+            if lindex == 0:
+                continue
+            if ctype == EN_Mod.EN_TIMER:
+                level -= elapsed
+                if level < 0:
+                    lindex = 0      # fired before the restart
+                    level = 0
+            elif ctype == EN_Mod.EN_TIMEOFDAY:
+                level = (level - elapsed) % 86400
+            tk.ENsetcontrol(cindex, ctype, lindex, setting, nindex, level)
+        self.offset = elapsed
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Shared fixtures: the repository root on sys.path, a scratch copy of BMV.inp
+# and the network opened in the module-level toolkit. Tests that call the
+# toolkit are skipped when no EPANET library can be loaded (see EN_Mod,
+# EPANET_LIBRARY).
+import os
+import shutil
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import EN_Mod
+
+requires_toolkit = pytest.mark.skipif(isinstance(EN_Mod._lib, EN_Mod._MissingLibrary),
+                                      reason='EPANET toolkit library not available')
+
+@pytest.fixture
+def bmv(tmp_path):
+    # Path of a copy of BMV.inp in a temporary directory
+    path = str(tmp_path / 'BMV.inp')
+    shutil.copy(os.path.join(ROOT, 'BMV.inp'), path)
+    return path
+
+@pytest.fixture
+def hydraulics(network):
+    # BMV.inp with the hydraulics system open and the first time step solved
+    EN_Mod.ENopenH()
+    try:
+        EN_Mod.ENinitH(0)
+        EN_Mod.ENrunH()
+        yield network
+    finally:
+        EN_Mod.ENcloseH()
+
+@pytest.fixture
+def network(bmv):
+    # BMV.inp opened in the module-level toolkit, closed after the test. The
+    # hydraulics system is left alone: tests that open it (directly or through
+    # the hydraulics fixture) close it exactly once, since closing it twice
+    # crashes EPANET 2.0.
+    if isinstance(EN_Mod._lib, EN_Mod._MissingLibrary):
+        pytest.skip('EPANET toolkit library not available')
+    EN_Mod.ENopen(bmv, os.devnull, '', topology=True)
+    try:
+        yield bmv
+    finally:
+        EN_Mod.ENclose()
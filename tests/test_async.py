@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import gc
+import numpy as np
+import EN_Mod
+from EN_Async import ENasyncpool
+from conftest import requires_toolkit
+
+def _run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 60))
+
+@requires_toolkit
+def test_run_and_early_exit(bmv):
+    async def main():
+        async with ENasyncpool(1) as pool:
+            full = await pool.run(bmv, None, (EN_Mod.EN_PRESSURE,))
+            async with pool.iterH(bmv, None, (EN_Mod.EN_PRESSURE,)) as steps:
+                async for t, step in steps:
+                    if t >= 3*3600:
+                        break
+            again = await pool.run(bmv, None, (EN_Mod.EN_PRESSURE,))
+        return full, again
+    full, again = _run(main())
+    assert len(full.times) == 25
+    np.testing.assert_array_equal(full.times, again.times)
+    np.testing.assert_allclose(full.nodes[EN_Mod.EN_PRESSURE], again.nodes[EN_Mod.EN_PRESSURE],
+                               rtol=1e-5, atol=1e-4)
+
+@requires_toolkit
+def test_abandoned_iterator_releases_project(bmv):
+    async def main():
+        async with ENasyncpool(1) as pool:
+            for k in range(3):
+                async for t, step in pool.iterH(bmv, None, (EN_Mod.EN_PRESSURE,)):
+                    break
+                gc.collect()
+            return await pool.run(bmv, None, (EN_Mod.EN_PRESSURE,))
+    assert len(_run(main()).times) == 25
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import EN_Mod
+from EN_Mod import EN_DURATION, EN_LINKCOUNT, EN_NODECOUNT, EN_PRESSURE
+from Benchmark import gridnetwork
+from conftest import requires_toolkit
+
+@requires_toolkit
+def test_gridnetwork_is_valid(tmp_path):
+    inpname = str(tmp_path / 'grid.inp')
+    gridnetwork(100).write(inpname)
+    EN_Mod.ENopen(inpname, os.devnull, '', topology=True)
+    try:
+        # 10x10 junctions and 4 reservoirs; 2*10*9 grid pipes and 4 feeds
+        assert EN_Mod.ENgetcount(EN_NODECOUNT) == 104
+        assert EN_Mod.ENgetcount(EN_LINKCOUNT) == 184
+        topology = EN_Mod.ENgettopology()
+        assert len(topology.junctions) == 100 and len(topology.reservoirs) == 4
+        assert EN_Mod.ENgettimeparam(EN_DURATION) == 24*3600
+        steps = [(t, step.nodes[EN_PRESSURE].copy()) for t, step in
+                 EN_Mod.ENiterH((EN_PRESSURE,), nodes=topology.junctions, report=True)]
+    finally:
+        EN_Mod.ENclose()
+    assert [t for t, _ in steps] == list(range(0, 24*3600 + 1, 3600))
+    # the corner reservoirs supply every junction under positive pressure
+    assert all((pressures > 0).all() for _, pressures in steps)
+    assert not np.array_equal(steps[0][1], steps[6][1])
+
+def test_gridnetwork_is_reproducible():
+    first, second = gridnetwork(50, seed=3), gridnetwork(50, seed=3)
+    np.testing.assert_array_equal(first.junctions['elevation'], second.junctions['elevation'])
+    assert len(first.junctions['id']) == 49
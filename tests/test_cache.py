@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import EN_Mod
+from EN_Cache import ENfingerprint, ENhydcache, ENresultcache
+from EN_Mod import EN_BASEDEMAND, EN_DURATION, EN_PRESSURE, EN_TANKLEVEL
+from EN_Scenario import ENscenario, ENsession
+from conftest import requires_toolkit
+
+def _reopen(path, topology=True):
+    # Hydraulics can no longer be solved once a Hydraulics file is used
+    EN_Mod.ENclose()
+    EN_Mod.ENopen(path, os.devnull, '', topology=topology)
+
+def test_hydcache_hit_and_miss(network, tmp_path):
+    cache = ENhydcache(str(tmp_path / 'hyd'))
+    key = cache.key(network)
+    assert not cache.solveH(network)
+    assert os.listdir(str(tmp_path / 'hyd')) == [key + '.hyd']
+    _reopen(network)
+    assert cache.key(network) == key
+    assert cache.solveH(network)
+    # the key does not depend on the topology cache
+    _reopen(network, topology=False)
+    assert cache.key(network) == key
+
+def test_hydcache_pattern_invalidation(network, tmp_path):
+    cache = ENhydcache(str(tmp_path / 'hyd'))
+    key = cache.key(network)
+    factor = EN_Mod.ENgetpatternvalue(1, 2)
+    EN_Mod.ENsetpatternvalue(1, 2, factor + 0.5)
+    assert cache.key(network) != key
+    assert not cache.solveH(network)
+    _reopen(network)
+    assert cache.key(network) == key
+    EN_Mod.ENsetpatternvalue(1, 2, factor + 0.5)
+    assert cache.solveH(network)
+
+def test_hydcache_tank_invalidation(network, tmp_path):
+    cache = ENhydcache(str(tmp_path / 'hyd'))
+    assert not cache.solveH(network)
+    _reopen(network)
+    tanks = EN_Mod.ENgettopology().tanks
+    level = EN_Mod.ENgetnodevalues(EN_TANKLEVEL, tanks)
+    EN_Mod.ENsetnodevalues(EN_TANKLEVEL, tanks, level + 1)
+    assert not cache.solveH(network)
+    assert len(os.listdir(str(tmp_path / 'hyd'))) == 2
+
+def _scenario(name=None, demand=1.0):
+    s = ENscenario(name)
+    s.setnodevalues(EN_BASEDEMAND, [2, 3], demand)
+    return s
+
+def test_fingerprint(bmv):
+    key = ENfingerprint(bmv, _scenario('a'))
+    # the name is not part of the fingerprint; every override and option is
+    assert ENfingerprint(bmv, _scenario('b')) == key
+    assert ENfingerprint(bmv, _scenario('a', 1.5)) != key
+    assert ENfingerprint(bmv, None) != key
+    assert ENfingerprint(bmv, _scenario('a'), ('pressure',)) != key
+    changed = [_scenario() for _ in range(4)]
+    changed[0].setpattern(1, [1.0, 2.0])
+    changed[1].settimeparam(EN_DURATION, 3600)
+    changed[2].setnodevalues(EN_BASEDEMAND, [2, 4], 1.0)
+    changed[3].setlinkvalues(EN_BASEDEMAND, [2, 3], 1.0)     # same code and values, on links
+    assert len(set(ENfingerprint(bmv, s) for s in changed) | {key}) == 5
+    # long arrays are hashed by contents, not by their abbreviated repr
+    big = np.zeros(5000)
+    other = big.copy()
+    other[2500] = 1
+    assert ENfingerprint(bmv, None, (big,)) != ENfingerprint(bmv, None, (other,))
+    with open(bmv, 'a') as f:
+        f.write('\n')
+    assert ENfingerprint(bmv, _scenario('a')) != key
+
+def test_resultcache_tiers(tmp_path):
+    directory = str(tmp_path / 'memo')
+    cache = ENresultcache(maxbytes=2000, directory=directory)
+    assert cache.get('a') is None and cache.misses == 1
+    cache.put('a', np.zeros(100))
+    cache.put('b', np.ones(100))
+    # 1600 bytes in memory: a third array evicts the least recently used
+    assert cache.get('a') is not None
+    cache.put('c', np.ones(100))
+    assert list(cache.memory) == ['a', 'c'] and cache.nbytes == 1600
+    np.testing.assert_array_equal(cache.get('b'), np.ones(100))
+    assert cache.hits == 2
+    # the disk tier is shared with a new cache on the same directory
+    other = ENresultcache(directory=directory)
+    np.testing.assert_array_equal(other.get('c'), np.ones(100))
+    assert other.hits == 1 and 'c' in other.memory
+    cache.clear()
+    assert cache.get('a') is None and ENresultcache(directory=directory).get('c') is None
+
+@requires_toolkit
+def test_session_cache(bmv):
+    cache = ENresultcache()
+    with ENsession(bmv, cache=cache) as session:
+        first = session.run(_scenario('x'), (EN_PRESSURE,))
+        assert (cache.hits, cache.misses) == (0, 1)
+        again = session.run(_scenario('y'), (EN_PRESSURE,))
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert again.name == 'y' and again.nodes[EN_PRESSURE] is first.nodes[EN_PRESSURE]
+        # other capture settings or overrides are run
+        session.run(_scenario('x'), (EN_PRESSURE,), nodes=[2])
+        changed = session.run(_scenario('x', 2.0), (EN_PRESSURE,))
+        assert cache.misses == 3
+        assert not np.array_equal(changed.nodes[EN_PRESSURE], first.nodes[EN_PRESSURE])
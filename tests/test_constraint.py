@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import EN_Mod
+from EN_Constraint import ENconstraints, ENconstraintresult
+
+def test_check_tank_level(hydraulics):
+    tanks = EN_Mod.ENgettopology().tanks
+    level = (EN_Mod.ENgetnodevalues(EN_Mod.EN_HEAD, tanks, dtype=np.float64) -
+             EN_Mod.ENgetnodevalues(EN_Mod.EN_ELEVATION, tanks, dtype=np.float64))
+    c = ENconstraints()
+    name = c.addtanklevel(tanks, lower=level + 1.0)
+    result = ENconstraintresult([b.name for b in c.bounds])
+    assert not c.check(0, result)
+    assert abs(result.worst[name] - 1.0) < 1e-3
+    assert result.first[name] == 0
+    assert result.where[name] in list(tanks)
+
+    ok = ENconstraints()
+    ok.addtanklevel(tanks, lower=level - 1.0, upper=level + 1.0)
+    assert ok.check(0, ENconstraintresult([b.name for b in ok.bounds]))
+
+def test_check_pressure_and_velocity(hydraulics):
+    topology = EN_Mod.ENgettopology()
+    pressure = EN_Mod.ENgetnodevalues(EN_Mod.EN_PRESSURE, topology.junctions, dtype=np.float64)
+    velocity = np.abs(EN_Mod.ENgetlinkvalues(EN_Mod.EN_VELOCITY, topology.pipes, dtype=np.float64))
+    c = ENconstraints()
+    c.addpressure(topology.junctions, lower=pressure.min() + 5.0, name='p')
+    c.addvelocity(topology.pipes, upper=velocity.max() + 1.0, name='v')
+    result = ENconstraintresult(['p', 'v'], tolerance=1e-3)
+    assert not c.check(0, result)
+    expected = np.maximum(pressure.min() + 5.0 - pressure, 0).sum()
+    assert abs(result.violation['p'] - expected) < 1e-2
+    assert result.violation['v'] == 0.0
+    assert result.steps == {'p': 1, 'v': 0}
+
+def test_evaluate_abort(network):
+    junctions = EN_Mod.ENgettopology().junctions
+    c = ENconstraints()
+    c.addpressure(junctions, lower=1e6)
+    result = c.evaluate(abort=True)
+    assert result.aborted and result.time == 0 and not result.feasible
+    assert c.evaluate(abort=False).steps[c.bounds[0].name] > 1
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import EN_Mod
+from EN_Export import _link_var_names, _node_var_names, _var_name, ENhdf5writer
+
+def test_var_names():
+    assert _var_name(_node_var_names, 'node', EN_Mod.EN_PRESSURE) == 'pressure'
+    assert _var_name(_node_var_names, 'node', EN_Mod.EN_TANK_KBULK) == 'tank_kbulk'
+    assert _var_name(_node_var_names, 'node', 99) == 'node99'
+    assert _var_name(_link_var_names, 'link', EN_Mod.EN_LINKQUAL) == 'linkqual'
+    assert _var_name(_link_var_names, 'link', 99) == 'link99'
+
+def test_hdf5_round_trip(network, tmp_path):
+    h5py = pytest.importorskip('h5py')
+    filename = str(tmp_path / 'run.h5')
+    times, pressures = [], []
+    with ENhdf5writer(filename, (EN_Mod.EN_PRESSURE,), (EN_Mod.EN_FLOW,), chunk=7) as out:
+        for t, step in EN_Mod.ENiterH((EN_Mod.EN_PRESSURE,), (EN_Mod.EN_FLOW,), report=True):
+            out.write(t, step)
+            times.append(t)
+            pressures.append(step.nodes[EN_Mod.EN_PRESSURE].copy())
+    with h5py.File(filename, 'r') as f:
+        np.testing.assert_array_equal(f['time'][:], times)
+        np.testing.assert_array_equal(f['nodes/pressure'][:], np.array(pressures, dtype=np.float32))
+        assert f['links/flow'].shape == (len(times), EN_Mod.ENgetcount(EN_Mod.EN_LINKCOUNT))
+        assert [i.decode() if isinstance(i, bytes) else i for i in f['nodes/ids'][:3]] == \
+               [EN_Mod.ENgetnodeid(k) for k in (1, 2, 3)]
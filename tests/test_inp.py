@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from EN_Inp import ENreadinp
+
+ENERGY_REACTIONS = """[TITLE]
+Per-element energy and reaction data
+
+[JUNCTIONS]
+J1\t10\t1
+J2\t12\t2
+
+[RESERVOIRS]
+R1\t50
+
+[TANKS]
+T1\t20\t3\t0\t6\t10
+
+[PIPES]
+P1\tR1\tJ1\t100\t200\t120
+P2\tJ1\tJ2\t100\t150\t110
+P3\tJ2\tT1\t100\t150\t110
+
+[ENERGY]
+Global Efficiency\t75
+PUMP P1 Efficiency E1
+PUMP P2 Price 0.2
+
+[REACTIONS]
+Order Bulk\t1
+Global Bulk\t-0.5
+BULK P1 -0.3
+BULK P2 -0.4
+WALL P1 -1.0
+TANK T1 -0.2
+
+[END]
+"""
+
+def _tables(net):
+    return dict((name, getattr(net, name)) for name in ('junctions', 'reservoirs', 'tanks', 'pipes',
+                                                       'pumps', 'valves'))
+
+def test_per_element_lines_are_kept(tmp_path):
+    path = tmp_path / 'net.inp'
+    path.write_text(ENERGY_REACTIONS)
+    net = ENreadinp(str(path))
+    assert net.energy == {'GLOBAL EFFICIENCY': '75'}
+    assert net.energy_elements == ['PUMP P1 Efficiency E1', 'PUMP P2 Price 0.2']
+    assert net.reactions == {'ORDER BULK': '1', 'GLOBAL BULK': '-0.5'}
+    assert net.reactions_elements == ['BULK P1 -0.3', 'BULK P2 -0.4', 'WALL P1 -1.0', 'TANK T1 -0.2']
+
+    copy = tmp_path / 'copy.inp'
+    net.write(str(copy))
+    again = ENreadinp(str(copy))
+    assert again.energy == net.energy
+    assert again.energy_elements == net.energy_elements
+    assert again.reactions == net.reactions
+    assert again.reactions_elements == net.reactions_elements
+
+def test_bmv_round_trip(bmv, tmp_path):
+    net = ENreadinp(bmv)
+    copy = str(tmp_path / 'copy.inp')
+    net.write(copy)
+    again = ENreadinp(copy)
+    assert list(again.node_ids) == list(net.node_ids)
+    assert list(again.link_ids) == list(net.link_ids)
+    for name, table in _tables(net).items():
+        other = getattr(again, name)
+        assert other.keys() == table.keys(), name
+        for column in table.keys():
+            if table[column].dtype.kind == 'f':
+                np.testing.assert_array_equal(other[column], table[column])
+            else:
+                assert list(other[column]) == list(table[column]), (name, column)
+    assert list(again.patterns) == list(net.patterns)
+    for pid, factors in net.patterns.items():
+        np.testing.assert_array_equal(again.patterns[pid], factors)
+    assert again.times == net.times
+    assert again.options == net.options
+    assert again.rules == net.rules
+    assert again.timeparam('DURATION') == 24*3600
+
+VALVES_TANKS = """[JUNCTIONS]
+J1\t10\t1
+J2\t12\t2
+J3\t12\t2
+J4\t12\t2
+
+[RESERVOIRS]
+R1\t50
+
+[TANKS]
+T1\t20\t3\t0\t6\t10
+T2\t20\t3\t0\t6\t10\t5\tC1
+T3\t20\t3\t0\t6\t10\t0\t*\tYES
+T4\t20\t3\t0\t6\t10\t0\tC1\tNO
+
+[PIPES]
+P1\tR1\tJ1\t100\t200\t120
+P2\tJ2\tT1\t100\t150\t110
+P3\tJ3\tT2\t100\t150\t110
+P4\tJ4\tT3\t100\t150\t110
+P5\tJ4\tT4\t100\t150\t110
+
+[VALVES]
+V1\tJ1\tJ2\t150\tPRV\t30\t0.5
+V2\tJ2\tJ3\t150\tGPV\tC2\t0
+V3\tJ3\tJ4\t150\tTCV
+
+[CURVES]
+C1\t0\t0
+C1\t6\t100
+C2\t0\t0
+C2\t10\t5
+
+[END]
+"""
+
+def _read_write(tmp_path, text):
+    path = tmp_path / 'net.inp'
+    path.write_text(text)
+    net = ENreadinp(str(path))
+    copy = tmp_path / 'copy.inp'
+    net.write(str(copy))
+    return net, ENreadinp(str(copy)), copy
+
+def test_valves_round_trip(tmp_path):
+    net, again, copy = _read_write(tmp_path, VALVES_TANKS)
+    valves = net.valves
+    assert valves['type'].tolist() == ['PRV', 'GPV', 'TCV']
+    assert valves['curve'].tolist() == ['', 'C2', '']
+    assert valves['setting'][0] == 30 and np.isnan(valves['setting'][1:]).all()
+    assert valves['minorloss'].tolist() == [0.5, 0, 0]
+    for column in valves.keys():
+        np.testing.assert_array_equal(again.valves[column], valves[column])
+    # a missing setting followed by a minor loss is written as 0
+    net.valves['minorloss'][2] = 0.25
+    net.write(str(copy))
+    again = ENreadinp(str(copy))
+    assert again.valves['setting'][2] == 0 and again.valves['minorloss'][2] == 0.25
+
+def test_tanks_round_trip(tmp_path):
+    net, again, copy = _read_write(tmp_path, VALVES_TANKS)
+    tanks = net.tanks
+    assert tanks['minvol'].tolist() == [0, 5, 0, 0]
+    assert tanks['volcurve'].tolist() == ['', 'C1', '', 'C1']
+    assert tanks['overflow'].tolist() == ['', '', 'YES', 'NO']
+    for column in tanks.keys():
+        np.testing.assert_array_equal(again.tanks[column], tanks[column])
+    lines = [l for l in copy.read_text().splitlines() if l.startswith('T')]
+    assert lines[0].split() == ['T1', '20', '3', '0', '6', '10', '0']
+    assert lines[2].split()[-2:] == ['*', 'YES']
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import EN_Mod
+from EN_Mod import EN_DURATION, EN_FLOW, EN_PRESSURE
+
+def _manual_run():
+    # (t, pressures, flows) of every event of the ENrunH/ENnextH loop
+    events = []
+    EN_Mod.ENopenH()
+    try:
+        EN_Mod.ENinitH(0)
+        while True:
+            EN_Mod.ENrunH()
+            t = EN_Mod._current_simulation_time.value
+            events.append((t, EN_Mod.ENgetnodevalues(EN_PRESSURE), EN_Mod.ENgetlinkvalues(EN_FLOW)))
+            if EN_Mod.ENnextH() <= 0:
+                break
+    finally:
+        EN_Mod.ENcloseH()
+    return events
+
+def test_iterH_matches_manual_loop(network):
+    expected = _manual_run()
+    steps = [(t, step.nodes[EN_PRESSURE].copy(), step.links[EN_FLOW].copy())
+             for t, step in EN_Mod.ENiterH((EN_PRESSURE,), (EN_FLOW,))]
+    assert len(steps) == len(expected) == 30
+    assert [t for t, p, q in steps] == [t for t, p, q in expected]
+    assert steps[-1][0] == EN_Mod.ENgettimeparam(EN_DURATION)
+    for (t, p, q), (t0, p0, q0) in zip(steps, expected):
+        np.testing.assert_array_equal(p, p0)
+        np.testing.assert_array_equal(q, q0)
+
+def test_iterH_subset_and_early_close(network):
+    nodes = [1, 5]
+    steps = EN_Mod.ENiterH((EN_PRESSURE,), nodes=nodes)
+    t, step = next(steps)
+    assert t == 0 and step.nodes[EN_PRESSURE].shape == (2,)
+    steps.close()
+    # the hydraulics system was closed: it can be opened again
+    assert len(list(EN_Mod.ENiterH((EN_PRESSURE,)))) == 30
+
+def test_iterH_without_openclose(network):
+    EN_Mod.ENopenH()
+    try:
+        first = [t for t, step in EN_Mod.ENiterH(openclose=False)]
+        second = [t for t, step in EN_Mod.ENiterH(openclose=False)]
+    finally:
+        EN_Mod.ENcloseH()
+    assert first == second and len(first) == 30
+
+def test_iterH_report_steps(network):
+    full = [(t, step.nodes[EN_PRESSURE].copy()) for t, step in EN_Mod.ENiterH((EN_PRESSURE,))]
+    rstep = EN_Mod.ENgettimeparam(EN_Mod.EN_REPORTSTEP)
+    reported = [(t, step.nodes[EN_PRESSURE].copy()) for t, step in EN_Mod.ENiterH((EN_PRESSURE,), report=True)]
+    expected = [(t, p) for t, p in full if t % rstep == 0]
+    assert len(reported) == 25
+    assert [t for t, p in reported] == [t for t, p in expected]
+    for (t, p), (t0, p0) in zip(reported, expected):
+        np.testing.assert_array_equal(p, p0)
+
+def test_iterH_report_stats(network):
+    full = [(t, step.nodes[EN_PRESSURE].astype(np.float64)) for t, step in EN_Mod.ENiterH((EN_PRESSURE,))]
+    times = [t for t, p in full]
+    previous = 0
+    for t, step in EN_Mod.ENiterH((EN_PRESSURE,), report=True, stats=True):
+        # events from the previous reporting time up to this one
+        events = [k for k, te in enumerate(times) if previous <= te <= t]
+        values = np.array([full[k][1] for k in events])
+        np.testing.assert_array_equal(step.nodestats.min[EN_PRESSURE], values.min(axis=0).astype(np.float32))
+        np.testing.assert_array_equal(step.nodestats.max[EN_PRESSURE], values.max(axis=0).astype(np.float32))
+        if t > previous:
+            weights = np.diff([times[k] for k in events])
+            mean = (values[:-1]*weights[:, np.newaxis]).sum(axis=0)/weights.sum()
+            np.testing.assert_allclose(step.nodestats.mean[EN_PRESSURE], mean, rtol=1e-5, atol=1e-4)
+        previous = t
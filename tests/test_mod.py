@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import EN_Mod
+from EN_Mod import EN_FLOW, EN_LINKCOUNT, EN_NODECOUNT, EN_PRESSURE, EN_ELEVATION, EN_DIAMETER
+
+@pytest.fixture(params=['module', 'project'])
+def toolkit(request, bmv):
+    # BMV.inp opened, with its first time step solved, in the module-level
+    # toolkit or in an ENproject (a private library copy for EPANET 2.0)
+    if isinstance(EN_Mod._lib, EN_Mod._MissingLibrary):
+        pytest.skip('EPANET toolkit library not available')
+    if request.param == 'module':
+        tk = EN_Mod
+    else:
+        tk = EN_Mod.ENproject()
+        if not tk.concurrent:
+            tk.ENdeleteproject()
+            tk = EN_Mod.ENproject(private=True)
+    tk.ENopen(bmv, EN_Mod.os.devnull, '')
+    try:
+        tk.ENopenH()
+        try:
+            tk.ENinitH(0)
+            tk.ENrunH()
+            yield tk
+        finally:
+            tk.ENcloseH()
+    finally:
+        tk.ENclose()
+        if tk is not EN_Mod:
+            tk.ENdeleteproject()
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_bulk_getters_match_per_element(toolkit, dtype):
+    nnodes = toolkit.ENgetcount(EN_NODECOUNT)
+    nlinks = toolkit.ENgetcount(EN_LINKCOUNT)
+    for code in (EN_PRESSURE, EN_ELEVATION):
+        expected = np.array([toolkit.ENgetnodevalue(k, code) for k in range(1, nnodes+1)])
+        np.testing.assert_array_equal(toolkit.ENgetnodevalues(code, dtype=dtype), expected.astype(dtype))
+        subset = np.array([5, 1, 5, nnodes], dtype=np.intc)
+        np.testing.assert_array_equal(toolkit.ENgetnodevalues(code, subset, dtype=dtype),
+                                      expected[subset-1].astype(dtype))
+    for code in (EN_FLOW, EN_DIAMETER):
+        expected = np.array([toolkit.ENgetlinkvalue(k, code) for k in range(1, nlinks+1)])
+        out = np.zeros(nlinks + 2, dtype=dtype)
+        assert toolkit.ENgetlinkvalues(code, out=out) is out
+        np.testing.assert_array_equal(out[:nlinks], expected.astype(dtype))
+        np.testing.assert_array_equal(out[nlinks:], 0)
+        np.testing.assert_array_equal(toolkit.ENgetlinkvalues(code, [nlinks, 2]), expected[[nlinks-1, 1]].astype(np.float32))
+
+def test_bulk_getter_indices_changed_in_place(toolkit):
+    indices = np.array([1, 2, 3], dtype=np.intc)
+    first = toolkit.ENgetnodevalues(EN_ELEVATION, indices)
+    indices[:] = [4, 5, 6]
+    second = toolkit.ENgetnodevalues(EN_ELEVATION, indices)
+    np.testing.assert_array_equal(first, np.float32([toolkit.ENgetnodevalue(k, EN_ELEVATION) for k in (1, 2, 3)]))
+    np.testing.assert_array_equal(second, np.float32([toolkit.ENgetnodevalue(k, EN_ELEVATION) for k in (4, 5, 6)]))
+
+def test_bulk_getter_rejects_undefined_index(toolkit):
+    with pytest.raises(EN_Mod.ENtoolkitError):
+        toolkit.ENgetnodevalues(EN_PRESSURE, [1, toolkit.ENgetcount(EN_NODECOUNT) + 1])
+    with pytest.raises(ValueError):
+        toolkit.ENgetlinkvalues(EN_FLOW, out=np.empty(2))
+
+def test_bulk_getters_with_topology(network):
+    # counts come from the topology cache
+    topology = EN_Mod.ENgettopology()
+    assert len(EN_Mod.ENgetnodevalues(EN_ELEVATION)) == len(topology.node_ids)
+    np.testing.assert_array_equal(EN_Mod.ENgetlinkvalues(EN_DIAMETER, topology.pumps),
+                                  [EN_Mod.ENgetlinkvalue(int(k), EN_DIAMETER) for k in topology.pumps])
+
+def test_bulk_setters_match_per_element(toolkit):
+    nodes = [3, 1, 7]
+    toolkit.ENsetnodevalues(EN_ELEVATION, nodes, [10.5, 11.25, 12.0])
+    assert [toolkit.ENgetnodevalue(k, EN_ELEVATION) for k in nodes] == pytest.approx([10.5, 11.25, 12.0])
+    links = np.arange(1, 6, dtype=np.intc)
+    toolkit.ENsetlinkvalues(EN_DIAMETER, links, 250.0)
+    np.testing.assert_allclose(toolkit.ENgetlinkvalues(EN_DIAMETER, links), 250.0)
+
+def test_bulk_setter_reports_every_failure(toolkit):
+    nnodes = toolkit.ENgetcount(EN_NODECOUNT)
+    with pytest.raises(EN_Mod.ENbulkError) as caught:
+        toolkit.ENsetnodevalues(EN_ELEVATION, [1, nnodes+1, 2, nnodes+2], 42.0)
+    assert caught.value.failures == [(nnodes+1, 203), (nnodes+2, 203)]
+    assert len(caught.value.messages) == 2 and not caught.value.warning
+    # the valid indices were still set
+    assert [toolkit.ENgetnodevalue(k, EN_ELEVATION) for k in (1, 2)] == pytest.approx([42.0, 42.0])
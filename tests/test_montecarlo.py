@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import multiprocessing.pool
+import numpy as np
+import EN_Mod
+import EN_MonteCarlo
+from EN_Mod import EN_PATTERN, EN_PRESSURE
+from EN_MonteCarlo import ENdemandsampler, ENmontecarlo
+from EN_Scenario import ENsession
+from conftest import requires_toolkit
+
+def test_sampler_from_toolkit(network):
+    junctions = EN_Mod.ENgettopology().junctions
+    sampler = ENdemandsampler.fromtoolkit()
+    np.testing.assert_array_equal(sampler.junctions, junctions)
+    # BMV's junctions have no demand pattern: its pattern is not sampled
+    assert sampler.patterns == {}
+    EN_Mod.ENsetnodevalues(EN_PATTERN, junctions[:3], 1)
+    sampler = ENdemandsampler.fromtoolkit(patterncv=0.1)
+    assert list(sampler.patterns) == [1]
+    np.testing.assert_array_equal(sampler.patterns[1], EN_Mod.ENgetpattern(1, dtype=np.float64))
+
+def test_sampler_seed():
+    first = ENdemandsampler([1, 2, 3], [1.0, 2.0, 0.0], {1: np.ones(4)}, 0.2, 0.1, seed=7)
+    second = ENdemandsampler([1, 2, 3], [1.0, 2.0, 0.0], {1: np.ones(4)}, 0.2, 0.1, seed=7)
+    demands, patterns = first.sample(5)
+    np.testing.assert_array_equal(demands, second.sample(5)[0])
+    assert demands.shape == (5, 3) and patterns[1].shape == (5, 4)
+    assert (demands[:, 2] == 0).all() and (demands >= 0).all()
+
+@requires_toolkit
+def test_montecarlo_one_pool(bmv, monkeypatch):
+    pools = []
+    threadpool = multiprocessing.pool.ThreadPool
+    def countedpool(*args, **kwargs):
+        pools.append(threadpool(*args, **kwargs))
+        return pools[-1]
+    monkeypatch.setattr(EN_MonteCarlo.multiprocessing.pool, 'ThreadPool', countedpool)
+    junctions = [2, 3, 4]
+    stats = ENmontecarlo(bmv, ENdemandsampler(junctions, [1.0, 2.0, 3.0], seed=1), 7, (0, 100),
+                         batch=3, threads=2, thresholds=(50,))
+    assert len(pools) == 1
+    assert stats.count == 7
+    # the same realizations run one by one
+    with ENsession(bmv) as session:
+        sampler = ENdemandsampler(junctions, [1.0, 2.0, 3.0], seed=1)
+        minima = np.array([session.run(s, (EN_PRESSURE,)).nodes[EN_PRESSURE].min(axis=0)
+                           for first, size in ((0, 3), (3, 3), (6, 1)) for s in sampler.scenarios(size, first)])
+    np.testing.assert_allclose(stats.min, minima.min(axis=0), rtol=1e-6, atol=1e-5)
+    np.testing.assert_allclose(stats.max, minima.max(axis=0), rtol=1e-6, atol=1e-5)
+    np.testing.assert_allclose(stats.mean, minima.mean(axis=0), rtol=1e-6, atol=1e-5)
+    np.testing.assert_array_equal(stats.probability(50), (minima < 50).mean(axis=0))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import EN_Mod
+from EN_Out import ENoutput, EN_OUT_FLOW, EN_OUT_PRESSURE
+from conftest import requires_toolkit
+
+@requires_toolkit
+def test_output_matches_toolkit(bmv, tmp_path):
+    binname = str(tmp_path / 'BMV.out')
+    EN_Mod.ENopen(bmv, os.devnull, binname)
+    try:
+        nnodes = EN_Mod.ENgetcount(EN_Mod.EN_NODECOUNT)
+        nlinks = EN_Mod.ENgetcount(EN_Mod.EN_LINKCOUNT)
+        ntanks = EN_Mod.ENgetcount(EN_Mod.EN_TANKCOUNT)
+        node_ids = [EN_Mod.ENgetnodeid(k) for k in range(1, nnodes+1)]
+        link_ids = [EN_Mod.ENgetlinkid(k) for k in range(1, nlinks+1)]
+        elevations = EN_Mod.ENgetnodevalues(EN_Mod.EN_ELEVATION)
+        lengths = EN_Mod.ENgetlinkvalues(EN_Mod.EN_LENGTH)
+        rstep = EN_Mod.ENgettimeparam(EN_Mod.EN_REPORTSTEP)
+        duration = EN_Mod.ENgettimeparam(EN_Mod.EN_DURATION)
+        times, pressures, flows = [], [], []
+        for t, step in EN_Mod.ENiterH((EN_Mod.EN_PRESSURE,), (EN_Mod.EN_FLOW,), report=True):
+            times.append(t)
+            pressures.append(step.nodes[EN_Mod.EN_PRESSURE].copy())
+            flows.append(step.links[EN_Mod.EN_FLOW].copy())
+        EN_Mod.ENsolveH()
+        EN_Mod.ENsolveQ()
+    finally:
+        EN_Mod.ENclose()
+    out = ENoutput(binname)
+    try:
+        assert (out.nnodes, out.nlinks, out.ntanks, out.npumps) == (nnodes, nlinks, ntanks, 2)
+        assert (out.reportstep, out.duration, out.nperiods) == (rstep, duration, len(times))
+        assert out.node_ids == node_ids and out.link_ids == link_ids
+        np.testing.assert_allclose(out.node_elevations, elevations, rtol=1e-6)
+        np.testing.assert_allclose(out.link_lengths, lengths, rtol=1e-6)
+        np.testing.assert_array_equal(out.times, times)
+        np.testing.assert_allclose(out.noderesults(EN_OUT_PRESSURE), pressures, rtol=1e-5, atol=1e-4)
+        np.testing.assert_allclose(out.linkresults(EN_OUT_FLOW), flows, rtol=1e-5, atol=1e-4)
+        np.testing.assert_array_equal(out.noderesults(EN_OUT_PRESSURE, [3, 1])[:, 1],
+                                      out.node_results[:, EN_OUT_PRESSURE, 0])
+        assert out.linkindex(link_ids[31]) == 32
+        assert sorted(out.energy['link'].tolist()) == [32, 33]
+    finally:
+        out.close()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import os
+import EN_Mod
+from EN_Mod import EN_BASEDEMAND, EN_NODECOUNT, EN_PRESSURE, ENprofiling
+from conftest import requires_toolkit
+
+def _getters(stats, prefix, calls, nnodes):
+    # dll calls made by calls bulk reads of every node, with or without the bulk getter
+    bulk = stats.get(('dll', prefix + 'getnodevalues'), [0])[0]
+    single = stats.get(('dll', prefix + 'getnodevalue'), [0])[0]
+    return (bulk, single) in ((calls, 0), (0, calls*nnodes))
+
+def test_profile_module_counters(hydraulics):
+    runH = EN_Mod.ENrunH
+    nnodes = EN_Mod.ENgetcount(EN_NODECOUNT)
+    with ENprofiling() as profile:
+        for _ in range(3):
+            EN_Mod.ENgetnodevalues(EN_PRESSURE)
+        EN_Mod.ENsetnodevalues(EN_BASEDEMAND, [1, 2], [1.0, 2.0])
+        EN_Mod.ENrunH()
+    stats = profile.stats
+    assert stats[('python', 'ENgetnodevalues')][0] == 3
+    assert _getters(stats, 'EN', 3, nnodes)
+    assert stats[('dll', 'ENsetnodevalue')][0] == 2
+    assert stats[('python', 'ENrunH')][0] == stats[('dll', 'ENrunH')][0] == 1
+    assert stats[('python', 'ENrunH')][1] >= stats[('dll', 'ENrunH')][1] > 0
+    assert [row['function'] for row in profile.records()].count('ENrunH') == 2
+    # everything is put back on exit
+    assert EN_Mod.ENrunH is runH
+    assert not isinstance(EN_Mod._lib, EN_Mod._timedlibrary)
+    EN_Mod.ENgetnodevalues(EN_PRESSURE)
+    assert stats[('python', 'ENgetnodevalues')][0] == 3
+    profile.reset()
+    assert profile.records() == []
+
+@requires_toolkit
+def test_profile_project_counters(bmv):
+    with EN_Mod.ENproject(private=True) as project:
+        getter = project._nodegetter
+        project.ENopen(bmv, os.devnull, '')
+        prefix = 'EN' if project._ph is None else 'EN_'
+        with ENprofiling(project) as profile:
+            project.ENgetnodevalues(EN_PRESSURE)
+            project.ENgetcount(EN_NODECOUNT)
+        stats = profile.stats
+        assert stats[('python', 'ENgetnodevalues')][0] == 1
+        assert _getters(stats, prefix, 1, 25)
+        assert stats[('dll', prefix + 'getcount')][0] >= 1
+        assert project._nodegetter is getter
+        assert 'ENgetnodevalues' not in project.__dict__
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import pytest
+import EN_Mod
+from conftest import requires_toolkit
+
+def _project():
+    # Project able to run alongside others (a private library copy for EPANET 2.0)
+    project = EN_Mod.ENproject()
+    if not project.concurrent:
+        project.ENdeleteproject()
+        project = EN_Mod.ENproject(private=True)
+    return project
+
+@requires_toolkit
+def test_concurrent_projects_match_module(bmv):
+    EN_Mod.ENopen(bmv, os.devnull, '')
+    try:
+        expected = np.array([step.nodes[EN_Mod.EN_PRESSURE].copy() for _, step in
+                             EN_Mod.ENiterH((EN_Mod.EN_PRESSURE,), report=True)])
+    finally:
+        EN_Mod.ENclose()
+    with _project() as first, _project() as second:
+        assert first.concurrent and second.concurrent
+        for project in (first, second):
+            project.ENopen(bmv, os.devnull, '')
+        # steps of the two projects interleaved; both runs are closed before
+        # the projects are deleted
+        runs = [first.ENiterH((EN_Mod.EN_PRESSURE,), report=True),
+                second.ENiterH((EN_Mod.EN_PRESSURE,), report=True)]
+        try:
+            pressures = [[step.nodes[EN_Mod.EN_PRESSURE].copy() for _, step in steps]
+                         for steps in zip(*runs)]
+            assert next(runs[0], None) is None and next(runs[1], None) is None
+        finally:
+            for run in runs:
+                run.close()
+    np.testing.assert_array_equal(np.array([a for a, _ in pressures]), expected)
+    np.testing.assert_array_equal(np.array([b for _, b in pressures]), expected)
+
+@requires_toolkit
+def test_legacy_library_has_one_owner(bmv):
+    with EN_Mod.ENproject() as first, EN_Mod.ENproject() as second:
+        if first.concurrent:
+            pytest.skip('toolkit creates one project per handle')
+        first.ENopen(bmv, os.devnull, '')
+        with pytest.raises(RuntimeError):
+            second.ENopen(bmv, os.devnull, '')
+        first.ENclose()
+        second.ENopen(bmv, os.devnull, '')
+        assert second.ENgetcount(EN_Mod.EN_NODECOUNT) == 25
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import EN_Mod
+from EN_Mod import EN_AGE, EN_DURATION, EN_QUALITY, EN_QUALSTEP, EN_REPORTSTEP
+
+def _manual_run():
+    # (t, ages) of every ENrunQ of the ENrunQ/ENstepQ loop
+    events = []
+    EN_Mod.ENsolveH()
+    EN_Mod.ENopenQ()
+    try:
+        EN_Mod.ENinitQ(0)
+        while True:
+            EN_Mod.ENrunQ()
+            events.append((EN_Mod._current_simulation_time.value, EN_Mod.ENgetnodevalues(EN_QUALITY)))
+            if EN_Mod.ENstepQ() <= 0:
+                break
+    finally:
+        EN_Mod.ENcloseQ()
+    return events
+
+def test_iterQ_quality_steps(network):
+    EN_Mod.ENsetqualtype(EN_AGE)
+    expected = _manual_run()
+    steps = [(t, step.nodes[EN_QUALITY].copy()) for t, step in EN_Mod.ENiterQ((EN_QUALITY,), qualsteps=True)]
+    # one step per ENrunQ, then the end of the simulation reached by the last ENstepQ
+    assert len(steps) == len(expected) + 1
+    assert len(expected) == EN_Mod.ENgettimeparam(EN_DURATION) // EN_Mod.ENgettimeparam(EN_QUALSTEP)
+    assert steps[-1][0] == EN_Mod.ENgettimeparam(EN_DURATION)
+    for (t, age), (t0, age0) in zip(steps, expected):
+        assert t == t0
+        np.testing.assert_array_equal(age, age0)
+    # water ages grow from zero at the start
+    assert not steps[0][1].any() and steps[-1][1].max() > 0
+
+def test_hydraulics_file_round_trip(network, tmp_path):
+    hydfile = str(tmp_path / 'BMV.hyd')
+    EN_Mod.ENsetqualtype(EN_AGE)
+    expected = [(t, step.nodes[EN_QUALITY].copy()) for t, step in EN_Mod.ENiterQ((EN_QUALITY,), report=True)]
+    EN_Mod.ENsavehydfile(hydfile)
+    EN_Mod.ENclose()
+    EN_Mod.ENopen(network, EN_Mod.os.devnull, '')
+    EN_Mod.ENsetqualtype(EN_AGE)
+    EN_Mod.ENusehydfile(hydfile)
+    steps = [(t, step.nodes[EN_QUALITY].copy())
+             for t, step in EN_Mod.ENiterQ((EN_QUALITY,), report=True, solveH=False)]
+    rstep = EN_Mod.ENgettimeparam(EN_REPORTSTEP)
+    assert [t for t, _ in steps] == [t for t, _ in expected] == list(range(0, 24*3600 + 1, rstep))
+    if EN_Mod.ENgetversion() < 20200:
+        pytest.xfail('EPANET 2.0 does not reproduce water quality from a used Hydraulics file')
+    for (_, age), (_, age0) in zip(steps, expected):
+        np.testing.assert_array_equal(age, age0)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import EN_Mod
+from EN_Mod import EN_FLOW, EN_PRESSURE
+from EN_Results import ENresults
+
+def _steps(**kwargs):
+    # (t, pressures, flows) of a run, copied from the steps
+    return [(t, step.nodes[EN_PRESSURE].copy(), step.links[EN_FLOW].copy())
+            for t, step in EN_Mod.ENiterH((EN_PRESSURE,), (EN_FLOW,), **kwargs)]
+
+def test_results_store_report_steps(network):
+    expected = _steps(report=True)
+    res = ENresults((EN_PRESSURE,), (EN_FLOW,)).record(EN_Mod.ENiterH((EN_PRESSURE,), (EN_FLOW,), report=True))
+    assert len(res) == len(expected) == 25
+    np.testing.assert_array_equal(res.times, [t for t, p, q in expected])
+    pressures = res.node(EN_PRESSURE)
+    assert pressures.dtype == np.float32 and pressures.shape == (25, 25)
+    np.testing.assert_array_equal(pressures, [p for t, p, q in expected])
+    np.testing.assert_array_equal(res.link(EN_FLOW), [q for t, p, q in expected])
+    # capacity sized from the time parameters: nothing to trim
+    nbytes = res.nbytes
+    res.trim()
+    assert res.nbytes == nbytes == 25*8 + 25*25*4 + 25*33*4
+
+def test_results_growth_and_trim(network):
+    expected = _steps()
+    res = ENresults((EN_PRESSURE,), (EN_FLOW,), capacity=4)
+    res.record(EN_Mod.ENiterH((EN_PRESSURE,), (EN_FLOW,)))
+    assert len(res) == len(expected) == 30
+    np.testing.assert_array_equal(res.node(EN_PRESSURE), [p for t, p, q in expected])
+    np.testing.assert_array_equal(res.link(EN_FLOW), [q for t, p, q in expected])
+    assert len(res._times) > 30
+    res.trim()
+    assert res.nbytes == 30*8 + 30*25*4 + 30*33*4
+    np.testing.assert_array_equal(res.node(EN_PRESSURE), [p for t, p, q in expected])
+
+def test_results_selection(network):
+    nodes = [2, 5, 7]
+    res = ENresults((EN_PRESSURE,), nodes=nodes)
+    res.record(EN_Mod.ENiterH((EN_PRESSURE,), nodes=nodes, report=True))
+    ids = [EN_Mod.ENgetnodeid(k) for k in nodes]
+    assert res.node_ids == tuple(ids) and res.link_ids == tuple(EN_Mod.ENgettopology().link_ids)
+    everything = res.node(EN_PRESSURE)
+    # one ID: a view over every time
+    series = res.node(EN_PRESSURE, ids[1])
+    assert series.shape == (25,) and np.shares_memory(series, everything)
+    np.testing.assert_array_equal(series, everything[:, 1])
+    # list of IDs, in the order asked for
+    np.testing.assert_array_equal(res.node(EN_PRESSURE, [ids[2], ids[0]]), everything[:, [2, 0]])
+    # times from start included to stop excluded
+    window = res.node(EN_PRESSURE, start=3600, stop=3*3600)
+    np.testing.assert_array_equal(window, everything[1:3])
+    assert res.node(EN_PRESSURE, start=25*3600).shape == (0, 3)
+    wide = res.node(EN_PRESSURE, ids[0], dtype=np.float64)
+    assert wide.dtype == np.float64
+    np.testing.assert_array_equal(wide, everything[:, 0])
+    with pytest.raises(KeyError):
+        res.node(EN_PRESSURE, EN_Mod.ENgetnodeid(1))
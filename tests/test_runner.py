@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import EN_Mod
+from EN_Scenario import ENiterscenarios, ENrunscenarios, ENscenario, ENsession
+from conftest import requires_toolkit
+
+def _scenarios(n):
+    scenarios = []
+    for k in range(n):
+        s = ENscenario('s%d' % k)
+        s.setnodevalues(EN_Mod.EN_BASEDEMAND, range(1, 11), 0.5 + 0.25*k)
+        scenarios.append(s)
+    return scenarios
+
+def _reference(bmv, scenarios):
+    with ENsession(bmv) as session:
+        return [session.run(s, (EN_Mod.EN_PRESSURE,), (EN_Mod.EN_FLOW,)) for s in scenarios]
+
+def _assert_same(results, expected):
+    assert [r.name for r in results] == [r.name for r in expected]
+    for r, e in zip(results, expected):
+        np.testing.assert_array_equal(r.times, e.times)
+        np.testing.assert_allclose(r.nodes[EN_Mod.EN_PRESSURE], e.nodes[EN_Mod.EN_PRESSURE], rtol=1e-6, atol=1e-5)
+        np.testing.assert_allclose(r.links[EN_Mod.EN_FLOW], e.links[EN_Mod.EN_FLOW], rtol=1e-6, atol=1e-5)
+
+@requires_toolkit
+def test_process_pool_matches_session(bmv):
+    scenarios = _scenarios(4)
+    expected = _reference(bmv, scenarios)
+    results = ENrunscenarios(bmv, scenarios, (EN_Mod.EN_PRESSURE,), (EN_Mod.EN_FLOW,), processes=2)
+    _assert_same(results, expected)
+    # the scenarios differ from one another
+    assert not np.array_equal(results[0].nodes[EN_Mod.EN_PRESSURE], results[3].nodes[EN_Mod.EN_PRESSURE])
+
+@requires_toolkit
+def test_iterscenarios_positions_and_capture(bmv):
+    scenarios = _scenarios(3)
+    seen = {}
+    for position, result in ENiterscenarios(bmv, scenarios, (EN_Mod.EN_HEAD,), nodes=[1, 2], processes=2):
+        seen[position] = result
+    assert sorted(seen) == [0, 1, 2]
+    assert seen[2].name == 's2'
+    assert seen[2].nodes[EN_Mod.EN_HEAD].shape == (25, 2)
+    assert seen[2].links == {}
+
+@requires_toolkit
+def test_thread_pool_matches_session(bmv):
+    scenarios = _scenarios(5)
+    expected = _reference(bmv, scenarios)
+    results = ENrunscenarios(bmv, scenarios, (EN_Mod.EN_PRESSURE,), (EN_Mod.EN_FLOW,), threads=2)
+    _assert_same(results, expected)
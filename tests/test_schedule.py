@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import EN_Mod
+from EN_Schedule import ENrunschedule
+
+PUMPS = (32, 33)
+
+def test_metering_with_tariff_per_period(network):
+    pstep = EN_Mod.ENgettimeparam(EN_Mod.EN_PATTERNSTEP)
+    tariff = np.where(np.arange(24) < 8, 0.1, 0.2)
+    energy, cost = ENrunschedule(PUMPS, None, tariff=tariff)
+    assert energy.shape == cost.shape == (2,)
+    assert np.all(energy >= 0)
+    explicit = ENrunschedule(PUMPS, None, pstep, tariff, flag=EN_Mod.EN_INITFLOW)
+    np.testing.assert_allclose(cost, explicit[1])
+    assert np.all(cost <= 0.2*energy + 1e-9)
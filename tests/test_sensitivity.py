@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import EN_Mod
+from EN_Mod import EN_ELEVATION
+from EN_Sensitivity import ENsensitivity
+from conftest import requires_toolkit
+
+@requires_toolkit
+@pytest.mark.parametrize('workers', [{'threads': 2}, {'processes': 2}])
+def test_elevation_derivative(bmv, workers):
+    # Junction heads do not depend on elevations (demand-driven analysis):
+    # the pressure of junction 2 falls by its elevation per unit of the
+    # elevation multiplier, other pressures do not move. Worker processes
+    # read results through the single precision toolkit functions.
+    with ENsensitivity(bmv, [2, 3], **workers) as s:
+        s.addnode(EN_ELEVATION, [2])
+        J, y = s.jacobian([1.0])
+    elevation = s.groups[0].baseline[0]
+    assert elevation > 0
+    J = J.reshape(-1, 2)
+    assert J.shape == (25, 2) and y.shape == (50,)
+    np.testing.assert_allclose(J[:, 0], -elevation, rtol=1e-5)
+    np.testing.assert_allclose(J[:, 1], 0, atol=1e-3)
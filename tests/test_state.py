@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import EN_Mod
+from EN_Mod import EN_DURATION, EN_PRESSURE
+from EN_State import ENhorizon
+
+def test_horizon_links(network):
+    horizon = ENhorizon()
+    topology = EN_Mod.ENgettopology()
+    np.testing.assert_array_equal(horizon.tanks, topology.tanks)
+    np.testing.assert_array_equal(horizon.controlled, [32, 33])
+    assert len(horizon.links) == 33
+
+def test_restart_matches_continuous_run(network):
+    horizon = ENhorizon()
+    restart = 6*3600
+    continuous = {}
+    for t, step in EN_Mod.ENiterH((EN_PRESSURE,), report=True):
+        continuous[t] = step.nodes[EN_PRESSURE].astype(np.float64)
+        if t == restart:
+            state = horizon.checkpoint()
+    assert state.time == restart
+    horizon.restore(state)
+    EN_Mod.ENsettimeparam(EN_DURATION, 24*3600 - restart)
+    times = []
+    for t, step in EN_Mod.ENiterH((EN_PRESSURE,), report=True):
+        times.append(restart + t)
+        np.testing.assert_allclose(step.nodes[EN_PRESSURE], continuous[restart + t], rtol=0, atol=1e-4,
+                                   err_msg='t=%d' % (restart + t))
+    assert times == sorted(t for t in continuous if t >= restart)
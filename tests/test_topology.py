@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import pytest
+import EN_Mod
+from conftest import requires_toolkit
+
+@requires_toolkit
+def test_topology_matches_toolkit(bmv):
+    EN_Mod.ENopen(bmv, os.devnull, '')
+    try:
+        assert EN_Mod.ENgettopology() is None
+        nnodes = EN_Mod.ENgetcount(EN_Mod.EN_NODECOUNT)
+        nlinks = EN_Mod.ENgetcount(EN_Mod.EN_LINKCOUNT)
+        node_ids = [EN_Mod.ENgetnodeid(k) for k in range(1, nnodes+1)]
+        link_ids = [EN_Mod.ENgetlinkid(k) for k in range(1, nlinks+1)]
+        node_types = [EN_Mod.ENgetnodetype(k) for k in range(1, nnodes+1)]
+        link_types = [EN_Mod.ENgetlinktype(k) for k in range(1, nlinks+1)]
+        link_nodes = [EN_Mod.ENgetlinknodes(k) for k in range(1, nlinks+1)]
+        topology = EN_Mod.ENtopology()
+    finally:
+        EN_Mod.ENclose()
+    assert (nnodes, nlinks) == (25, 33)
+    assert topology.node_ids == tuple(node_ids)
+    assert topology.link_ids == tuple(link_ids)
+    assert all(topology.node_index[i] == k for k, i in enumerate(node_ids, 1))
+    assert all(topology.link_index[i] == k for k, i in enumerate(link_ids, 1))
+    np.testing.assert_array_equal(topology.link_nodes, link_nodes)
+    assert [k for k, t in enumerate(node_types, 1) if t == 'Tank'] == topology.tanks.tolist()
+    assert [k for k, t in enumerate(node_types, 1) if t == 'Reservoir'] == topology.reservoirs.tolist()
+    assert [k for k, t in enumerate(node_types, 1) if t == 'Junction'] == topology.junctions.tolist()
+    assert topology.pumps.tolist() == [32, 33]
+    assert [k for k, t in enumerate(link_types, 1) if t in ('PIPE', 'CVPIPE')] == topology.pipes.tolist()
+    assert len(topology.pipes) + len(topology.pumps) + len(topology.valves) == nlinks
+    with pytest.raises(AttributeError):
+        topology.tanks = None
+    with pytest.raises(ValueError):
+        topology.pumps[0] = 1
+
+@requires_toolkit
+def test_lookups_use_cache_until_close(bmv):
+    EN_Mod.ENopen(bmv, os.devnull, '', topology=True)
+    try:
+        topology = EN_Mod.ENgettopology()
+        assert topology is not None
+        for k in (1, 13, 25):
+            nid = EN_Mod.ENgetnodeid(k)
+            assert nid == topology.node_ids[k-1]
+            assert EN_Mod.ENgetnodeindex(nid) == k
+        assert EN_Mod.ENgetlinktype(32) == 'PUMP'
+        assert EN_Mod.ENgetlinknodes(1) == tuple(topology.link_nodes[0].tolist())
+    finally:
+        EN_Mod.ENclose()
+    assert EN_Mod.ENgettopology() is None